@@ -69,8 +69,22 @@ def create_app(config_class=Config):
     from .properties import bp as properties_bp
     app.register_blueprint(properties_bp, url_prefix='/properties')
 
+    # Release expired apartado holds in the background
+    from .properties.holds import init_app as init_holds
+    init_holds(app)
+
     # Register CLI commands
-    from .cli import create_admin_command
+    from .cli import (create_admin_command, reconcile_lot_counters_command, export_lots_command,
+                      rebuild_lot_index_command, build_catalog_snapshots_command,
+                      build_sembrado_tiles_command, recalculate_prices_command,
+                      snapshot_inventory_command)
     app.cli.add_command(create_admin_command)
+    app.cli.add_command(reconcile_lot_counters_command)
+    app.cli.add_command(export_lots_command)
+    app.cli.add_command(rebuild_lot_index_command)
+    app.cli.add_command(build_catalog_snapshots_command)
+    app.cli.add_command(build_sembrado_tiles_command)
+    app.cli.add_command(recalculate_prices_command)
+    app.cli.add_command(snapshot_inventory_command)
 
     return app
@@ -141,6 +141,8 @@ class User(UserMixin, db.Model):
 
     def get_assignable_clients(self):
         """Get list of clients that this user can assign lots to"""
+        # Imported here: app.clients imports its routes, which import this module
+        from app.clients.models import Client
         if self.has_role(UserRole.ADMIN) or self.has_role(UserRole.GERENTE):
             return Client.query.filter_by(estatus='activo').all()
             
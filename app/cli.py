@@ -37,3 +37,91 @@ def create_admin_command(username, email, password, nombre, apellido_paterno, ap
     db.session.commit()
     
     click.echo('Admin user created successfully.')
+
+@click.command('reconcile-lot-counters')
+@with_appcontext
+def reconcile_lot_counters_command():
+    """Rebuild the lot availability counters from the lots table."""
+    from .properties.counters import reconcile
+    total = reconcile()
+    click.echo(f'Lot counters rebuilt: {total} rows.')
+
+@click.command('rebuild-lot-index')
+@with_appcontext
+def rebuild_lot_index_command():
+    """Rebuild the memory-mapped lot index used by the public catalog."""
+    from flask import current_app
+    from .properties.lot_index import build
+    path = current_app.config['LOT_INDEX_PATH']
+    if not path:
+        click.echo('The lot index is disabled (LOT_INDEX_PATH is empty).')
+        return
+    total = build(path)
+    click.echo(f'Lot index rebuilt: {total} lots.')
+
+@click.command('build-catalog-snapshots')
+@click.option('--fraccionamiento', 'fraccionamiento_ids', type=int, multiple=True,
+              help='Fraccionamiento id to regenerate (default: all)')
+@with_appcontext
+def build_catalog_snapshots_command(fraccionamiento_ids):
+    """Pre-render the static public catalog pages."""
+    from flask import current_app
+    from .properties.snapshots import regenerate, ALL
+    if not current_app.config['CATALOG_SNAPSHOT_FOLDER']:
+        click.echo('Catalog snapshots are disabled (CATALOG_SNAPSHOT_FOLDER is empty).')
+        return
+    regenerate(set(fraccionamiento_ids) or {ALL})
+    click.echo('Catalog snapshots regenerated.')
+
+@click.command('build-sembrado-tiles')
+@click.option('--fraccionamiento', 'fraccionamiento_ids', type=int, multiple=True,
+              help='Fraccionamiento id to build (default: all with a sembrado)')
+@with_appcontext
+def build_sembrado_tiles_command(fraccionamiento_ids):
+    """Cut the sembrado plans into Deep Zoom tile pyramids."""
+    from .properties.models import Fraccionamiento
+    from .properties.tiles import build_tiles
+    if not fraccionamiento_ids:
+        fraccionamiento_ids = [f.id for f in Fraccionamiento.query.filter(Fraccionamiento.sembrado.isnot(None))]
+    for fraccionamiento_id in fraccionamiento_ids:
+        dzi = build_tiles(fraccionamiento_id)
+        click.echo(f'{fraccionamiento_id}: {dzi or "skipped (no sembrado)"}')
+
+@click.command('recalculate-prices')
+@click.option('--fraccionamiento', 'fraccionamiento_id', type=int, required=True, help='Fraccionamiento id to reprice')
+@click.option('--paquete', 'paquete_id', type=int, help='Only reprice this paquete')
+@click.option('--dry-run', is_flag=True, help='Show the changes without writing them')
+@with_appcontext
+def recalculate_prices_command(fraccionamiento_id, paquete_id, dry_run):
+    """Reprice the free lots of a fraccionamiento from its pricing rules."""
+    from .properties.pricing import recalculate
+    cambios = recalculate(fraccionamiento_id, paquete_id=paquete_id, dry_run=dry_run)
+    for cambio in cambios:
+        click.echo(f"{cambio['lote_id']}\tMz {cambio['manzana']} Lote {cambio['lote']}\t"
+                   f"{cambio['precio_actual']:.2f} -> {cambio['precio_nuevo']:.2f}")
+    if not dry_run:
+        db.session.commit()
+    click.echo(f"{len(cambios)} lots {'would change' if dry_run else 'repriced'}.")
+
+@click.command('snapshot-inventory')
+@click.option('--force', is_flag=True, help='Take a snapshot even if there is one from today')
+@with_appcontext
+def snapshot_inventory_command(force):
+    """Store today's estado and precio of every lot, for as-of inventory queries."""
+    from .properties.inventory_history import take_daily_snapshots
+    total = take_daily_snapshots(force=force)
+    click.echo(f'{total} fraccionamientos snapshotted.')
+
+@click.command('export-lots')
+@click.option('--fraccionamiento', 'fraccionamiento_id', type=int, help='Fraccionamiento id to export')
+@click.option('--paquete', 'paquete_id', type=int, help='Paquete id to export')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='Output file (default: stdout)')
+@with_appcontext
+def export_lots_command(fraccionamiento_id, paquete_id, output):
+    """Export the lots of a fraccionamiento or paquete as CSV."""
+    if not fraccionamiento_id and not paquete_id:
+        raise click.UsageError('Use --fraccionamiento or --paquete.')
+
+    from .properties.export import generate_csv
+    for chunk in generate_csv(fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id):
+        output.write(chunk)
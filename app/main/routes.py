@@ -1,9 +1,14 @@
 from flask import render_template
 from flask_login import login_required
 from app.main import bp
+from app.properties.models import Fraccionamiento
+from app.properties.counters import get_counts
 
 @bp.route('/')
 @bp.route('/index')
 @login_required
 def index():
-    return render_template('main/index.html', title='Home')
+    fraccionamientos = Fraccionamiento.query.order_by(Fraccionamiento.nombre).all()
+    return render_template('main/index.html', title='Home',
+                         fraccionamientos=fraccionamientos,
+                         disponibilidad=get_counts('fraccionamiento'))
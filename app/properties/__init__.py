@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('properties', __name__)
 
-from . import routes  # noqa
+from . import routes, counters, snapshots, adjacency, sembrado, revisions, saved_searches, holds, live  # noqa
@@ -0,0 +1,128 @@
+"""Adjacency graph of the lots, built from their colindancias.
+
+A colindancia such as "Lote Número 03 y Lote Número 04" makes the lot a
+neighbour of lots 3 and 4 of the same paquete and manzana; a reference in
+either direction is enough. Edges live in lote_colindancias, once per
+direction, and are rebuilt per (paquete, manzana) group on the flush that
+changes a lot's number, manzana, paquete or colindancias, so an edit costs
+one small group instead of the whole inventory.
+"""
+from collections import defaultdict, deque
+from sqlalchemy import delete, event, inspect, or_, select
+from sqlalchemy.orm import Session, aliased
+from app.database import db
+from .models import Lote, LoteColindancia
+from .sorting import lote_sort_key
+from .linderos import SIDES, parse_vecinos
+
+COLINDANCIAS = tuple(f'colindancia_{lado}' for lado in SIDES)
+TRACKED_ATTRIBUTES = ('paquete_id', 'manzana', 'lote') + COLINDANCIAS
+MAX_CONTIGUOUS_LOTS = 20
+# Groups returned per request
+DEFAULT_CONTIGUOUS_GROUPS = 10
+MAX_CONTIGUOUS_GROUPS = 50
+
+def group_edges(rows):
+    """Edges (both directions) among rows of (id, lote, colindancia_1..4) of one group"""
+    by_number = defaultdict(list)
+    for lote_id, lote, *_ in rows:
+        by_number[lote_sort_key(lote)].append(lote_id)
+
+    edges = set()
+    for lote_id, _, *colindancias in rows:
+        for colindancia in colindancias:
+            for number in parse_vecinos(colindancia):
+                for vecino_id in by_number.get(number, ()):
+                    if vecino_id != lote_id:
+                        edges.add((lote_id, vecino_id))
+                        edges.add((vecino_id, lote_id))
+    return edges
+
+def rebuild(connection, lote_ids, groups):
+    """Drop every edge touching lote_ids and rebuild the (paquete_id, manzana) groups"""
+    table = LoteColindancia.__table__
+    if lote_ids:
+        connection.execute(delete(table).where(or_(table.c.lote_id.in_(lote_ids), table.c.vecino_id.in_(lote_ids))))
+
+    columns = [Lote.id, Lote.lote] + [getattr(Lote, name) for name in COLINDANCIAS]
+    for paquete_id, manzana in groups:
+        rows = connection.execute(
+            select(*columns).where(Lote.paquete_id == paquete_id, Lote.manzana == manzana)
+        ).all()
+        if not rows:
+            continue
+        connection.execute(delete(table).where(table.c.lote_id.in_([row[0] for row in rows])))
+        edges = group_edges(rows)
+        if edges:
+            connection.execute(table.insert(), [{'lote_id': a, 'vecino_id': b} for a, b in sorted(edges)])
+
+@event.listens_for(Session, 'after_flush')
+def _rebuild_changed_groups(session, flush_context):
+    lote_ids, groups = set(), set()
+    for obj in session.new:
+        if isinstance(obj, Lote):
+            groups.add((obj.paquete_id, obj.manzana))
+    for obj in session.deleted:
+        if isinstance(obj, Lote):
+            lote_ids.add(obj.id)
+    for obj in session.dirty:
+        if not isinstance(obj, Lote):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[key].history.has_changes() for key in TRACKED_ATTRIBUTES):
+            # Its old group keeps its other edges; only the ones to this lot go
+            lote_ids.add(obj.id)
+            groups.add((obj.paquete_id, obj.manzana))
+
+    if lote_ids or groups:
+        rebuild(session.connection(), lote_ids, groups)
+
+def contiguous_groups(k, fraccionamiento_id=None, paquete_id=None, estado='Libre', limit=None):
+    """Connected groups of k lots in an estado, one per connected component of at least k.
+
+    Returns [(lote ids of the group, size of its component)], the first
+    limit of them in catalog order when limit is given. Components are
+    walked breadth-first from their first lot in catalog order, so the first
+    k lots reached are always connected; the walk is linear in lots + edges
+    and stops once limit groups are found.
+    """
+    def scoped(query, lote):
+        query = query.filter(lote.estado_del_inmueble == estado)
+        if fraccionamiento_id:
+            query = query.filter(lote.fraccionamiento_id == fraccionamiento_id)
+        if paquete_id:
+            query = query.filter(lote.paquete_id == paquete_id)
+        return query
+
+    ids = [lote_id for (lote_id,) in scoped(db.session.query(Lote.id), Lote)
+           .order_by(Lote.paquete_id, Lote.manzana_orden, Lote.lote_orden, Lote.id)]
+
+    origen, vecino = aliased(Lote), aliased(Lote)
+    edges = scoped(db.session.query(LoteColindancia.lote_id, LoteColindancia.vecino_id), origen)\
+        .join(origen, origen.id == LoteColindancia.lote_id)\
+        .join(vecino, vecino.id == LoteColindancia.vecino_id)\
+        .filter(vecino.estado_del_inmueble == estado)
+    adjacency = defaultdict(list)
+    for lote_id, vecino_id in edges:
+        adjacency[lote_id].append(vecino_id)
+
+    groups = []
+    visited = set()
+    for start in ids:
+        if start in visited:
+            continue
+        visited.add(start)
+        component = []
+        queue = deque([start])
+        while queue:
+            lote_id = queue.popleft()
+            component.append(lote_id)
+            for vecino_id in adjacency[lote_id]:
+                if vecino_id not in visited:
+                    visited.add(vecino_id)
+                    queue.append(vecino_id)
+        if len(component) >= k:
+            groups.append((component[:k], len(component)))
+            if len(groups) == limit:
+                break
+    return groups
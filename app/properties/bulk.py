@@ -0,0 +1,52 @@
+"""Bookkeeping for set-based writes to the lots table.
+
+UPDATE statements issued directly on the lotes table bypass the unit of
+work, so none of the flush listeners (table versions, page cache, catalog
+snapshots, lot index) see them. Code issuing them calls lots_updated() in
+the same transaction, before committing; estados_changed() instead when
+only the estado changed, which also covers the availability counters,
+sembrado overlays and live events, and lets the lot index be patched
+rather than rebuilt. Both only record the changes in session.info: the
+counters and table versions are written just before the transaction
+commits, the rest once it has.
+"""
+from collections import Counter
+from .versions import defer_versions
+from .counters import lot_delta, defer_deltas
+from .live import lot_event
+from .lot_index import record_estados
+
+def _lots_written(session, fraccionamiento_ids):
+    defer_versions(session, ['lotes'])
+    # Picked up by the after_commit listeners of page_cache and snapshots
+    session.info['page_cache_purge'] = True
+    session.info.setdefault('catalog_snapshots', set()).update(fraccionamiento_ids)
+
+def lots_updated(session, fraccionamiento_ids):
+    """Record a bulk write to the lots of the given fraccionamientos"""
+    _lots_written(session, fraccionamiento_ids)
+    record_estados(session, None)
+
+def estados_changed(session, lots, estado):
+    """Record a bulk change of the estado of lots to estado.
+
+    lots are (lote_id, paquete_id, fraccionamiento_id, prototipo_id,
+    previous estado) rows, read before the UPDATE.
+    """
+    deltas = Counter()
+    # Picked up by the after_commit listener of sembrado
+    overlays = session.info.setdefault('sembrado_overlays', {'estados': {}, 'invalid': set()})
+    # Picked up by the after_commit listener of live
+    events = session.info.setdefault('live_events', {})
+    estados = {}
+    fraccionamiento_ids = set()
+    for lote_id, paquete_id, fraccionamiento_id, prototipo_id, previous in lots:
+        lot_delta(deltas, paquete_id, fraccionamiento_id, prototipo_id, previous, -1)
+        lot_delta(deltas, paquete_id, fraccionamiento_id, prototipo_id, estado, 1)
+        overlays['estados'].setdefault(fraccionamiento_id, {})[lote_id] = estado
+        events[lote_id] = lot_event(lote_id, fraccionamiento_id, paquete_id, estado)
+        estados[lote_id] = estado
+        fraccionamiento_ids.add(fraccionamiento_id)
+    defer_deltas(session, deltas)
+    _lots_written(session, fraccionamiento_ids)
+    record_estados(session, estados)
@@ -0,0 +1,106 @@
+"""Keyset-paginated lot catalog shared by the public and admin lot listings"""
+import base64
+import json
+from sqlalchemy import func, tuple_
+from .models import Paquete, Lote
+from .loading import with_profile
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Each sort is a tuple of columns (always ending in Lote.id so the order is
+# total) plus a function that reads the same values back from a loaded lot,
+# which is what ends up inside the cursor of the next page.
+SORTS = {
+    # Matches the ix_lotes_paquete_orden index
+    'ubicacion': (
+        (Lote.paquete_id, Lote.manzana_orden, Lote.lote_orden, Lote.id),
+        lambda lote: [lote.paquete_id, lote.manzana_orden, lote.lote_orden, lote.id]
+    ),
+    'precio': (
+        (Lote.precio, Lote.id),
+        lambda lote: [lote.precio, lote.id]
+    ),
+    'terreno': (
+        (func.coalesce(Lote.terreno, 0), Lote.id),
+        lambda lote: [lote.terreno or 0, lote.id]
+    ),
+}
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+
+    # Every sort key is numeric; anything else would only fail later, comparing
+    if not isinstance(values, list) or len(values) != size or \
+            not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        raise ValueError('Cursor inválido')
+    return values
+
+def catalog_query(fraccionamiento_id=None, paquete_id=None, estado=None):
+    """Build the filtered lot query with paquete, fraccionamiento and prototipo joined in"""
+    query = Lote.query.join(Lote.paquete).join(Paquete.fraccionamiento).join(Lote.prototipo)
+    query = with_profile(query, 'catalog_row')
+
+    if fraccionamiento_id:
+        query = query.filter(Lote.fraccionamiento_id == fraccionamiento_id)
+    if paquete_id:
+        query = query.filter(Lote.paquete_id == paquete_id)
+    if estado:
+        query = query.filter(Lote.estado_del_inmueble == estado)
+
+    return query
+
+def catalog_page(query, sort='ubicacion', descending=False, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Return one page of lots and the cursor of the next page (None on the last page)"""
+    if sort not in SORTS:
+        raise ValueError(f'Orden no soportado: {sort}')
+
+    columns, sort_key = SORTS[sort]
+    if after:
+        position = tuple_(*columns)
+        values = tuple_(*decode_cursor(after, len(columns)))
+        query = query.filter(position < values if descending else position > values)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+    # Fetch one extra row to know whether there is a next page
+    lotes = query.limit(limit + 1).all()
+    if len(lotes) <= limit:
+        return lotes, None
+
+    lotes = lotes[:limit]
+    return lotes, encode_cursor(sort_key(lotes[-1]))
+
+def serialize_catalog_row(lote, include_private=False):
+    """Row payload used by the catalog tables"""
+    row = {
+        'id': lote.id,
+        'fraccionamiento': lote.paquete.fraccionamiento.nombre,
+        'paquete': lote.paquete.nombre,
+        'manzana': lote.manzana,
+        'lote': lote.lote,
+        'prototipo': lote.prototipo.nombre_prototipo,
+        'terreno': lote.terreno,
+        'tipo_de_lote': lote.tipo_de_lote,
+        'precio': float(lote.precio),
+        'estado_del_inmueble': lote.estado_del_inmueble
+    }
+
+    if include_private:
+        row.update({
+            'calle': lote.calle,
+            'numero_exterior': lote.numero_exterior,
+            'numero_interior': lote.numero_interior
+        })
+
+    return row
@@ -0,0 +1,153 @@
+"""Lot availability counters per paquete, fraccionamiento and prototipo.
+
+Every flush that creates, deletes or changes the estado, paquete,
+fraccionamiento or prototipo of a Lote turns into +1/-1 deltas on LoteContador rows.
+The deltas of a transaction are added up and applied on its own connection
+just before it commits, so they commit or roll back together with the lot
+writes. Every reservation changes the same few counter rows; written last,
+in key order, their locks are held only for the end of the transaction.
+Code that changes lots with bulk UPDATEs outside the ORM calls
+defer_deltas() itself (see bulk.py).
+"""
+from collections import Counter
+from sqlalchemy import event, func, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.database import db
+from .models import Lote, LoteContador
+
+def _previous(state, key):
+    """Value of an attribute before the pending flush"""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.object, key)
+
+def lot_delta(deltas, paquete_id, fraccionamiento_id, prototipo_id, estado, amount):
+    """Add the counter changes of one lot to a Counter of deltas"""
+    deltas[('paquete', paquete_id, estado)] += amount
+    deltas[('fraccionamiento', fraccionamiento_id, estado)] += amount
+    deltas[('prototipo', prototipo_id, estado)] += amount
+
+# INSERT ... ON CONFLICT DO UPDATE of the dialects that have it
+UPSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def apply_deltas(connection, deltas):
+    """Apply a Counter of (ambito, ambito_id, estado) -> delta on a connection.
+
+    Rows are written in key order, so concurrent transactions lock the
+    counters they share in the same order instead of deadlocking (a
+    reservation and a release touch the same rows in opposite directions),
+    and as upserts, so two first lots of a scope cannot both insert its row.
+    """
+    table = LoteContador.__table__
+    upsert = UPSERTS.get(connection.dialect.name)
+    changes = sorted((key, amount) for key, amount in deltas.items() if amount and key[1] is not None)
+    for (ambito, ambito_id, estado), amount in changes:
+        if upsert is not None:
+            connection.execute(
+                upsert(table).values(ambito=ambito, ambito_id=ambito_id, estado=estado, total=amount)
+                .on_conflict_do_update(index_elements=['ambito', 'ambito_id', 'estado'],
+                                       set_={'total': table.c.total + amount})
+            )
+            continue
+        result = connection.execute(
+            update(table)
+            .where(table.c.ambito == ambito, table.c.ambito_id == ambito_id, table.c.estado == estado)
+            .values(total=table.c.total + amount)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                ambito=ambito, ambito_id=ambito_id, estado=estado, total=amount
+            ))
+
+def defer_deltas(session, deltas):
+    """Apply a Counter of deltas when the session commits, in its transaction"""
+    session.info.setdefault('lot_counters', Counter()).update(deltas)
+
+TRACKED_ATTRIBUTES = ('paquete_id', 'fraccionamiento_id', 'prototipo_id', 'estado_del_inmueble')
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    # No-op; registered with active_history so the value before the change is
+    # loaded even when the lot was expired by a previous commit
+    return value
+
+for _key in TRACKED_ATTRIBUTES:
+    event.listen(getattr(Lote, _key), 'set', _load_previous_value, active_history=True, retval=True)
+
+@event.listens_for(Session, 'after_flush')
+def _track_lot_changes(session, flush_context):
+    # (paquete_id, fraccionamiento_id, prototipo_id, estado, +1/-1) for every
+    # lot leaving or entering a bucket
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Lote):
+            changes.append(tuple(getattr(obj, key) for key in TRACKED_ATTRIBUTES) + (1,))
+
+    for obj in session.deleted:
+        if isinstance(obj, Lote):
+            state = inspect(obj)
+            changes.append(tuple(_previous(state, key) for key in TRACKED_ATTRIBUTES) + (-1,))
+
+    for obj in session.dirty:
+        if not isinstance(obj, Lote):
+            continue
+        state = inspect(obj)
+        before = tuple(_previous(state, key) for key in TRACKED_ATTRIBUTES)
+        after = tuple(getattr(obj, key) for key in TRACKED_ATTRIBUTES)
+        if before != after:
+            changes.append(before + (-1,))
+            changes.append(after + (1,))
+
+    if not changes:
+        return
+
+    deltas = Counter()
+    for change in changes:
+        lot_delta(deltas, *change)
+    defer_deltas(session, deltas)
+
+@event.listens_for(Session, 'before_commit')
+def _apply_pending_deltas(session):
+    # The commit flushes after this event: flush now so the deltas are complete
+    session.flush()
+    deltas = session.info.pop('lot_counters', None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deltas(session):
+    session.info.pop('lot_counters', None)
+
+def get_counts(ambito, ids=None):
+    """Return {ambito_id: {estado: total}} for the given ids (all when None)"""
+    query = LoteContador.query.filter_by(ambito=ambito)
+    if ids is not None:
+        query = query.filter(LoteContador.ambito_id.in_(list(ids)))
+
+    counts = {}
+    for contador in query:
+        counts.setdefault(contador.ambito_id, {})[contador.estado] = contador.total
+    return counts
+
+def reconcile():
+    """Rebuild every counter from the lots table; returns the number of counter rows"""
+    scopes = {
+        'paquete': Lote.paquete_id,
+        'fraccionamiento': Lote.fraccionamiento_id,
+        'prototipo': Lote.prototipo_id,
+    }
+    rows = []
+    for ambito, column in scopes.items():
+        grouped = db.session.query(column, Lote.estado_del_inmueble, func.count(Lote.id))\
+            .group_by(column, Lote.estado_del_inmueble)
+        rows.extend({'ambito': ambito, 'ambito_id': ambito_id, 'estado': estado, 'total': total}
+                    for ambito_id, estado, total in grouped)
+
+    db.session.query(LoteContador).delete()
+    if rows:
+        db.session.execute(LoteContador.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
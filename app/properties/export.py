@@ -0,0 +1,85 @@
+"""CSV export of the lot inventory of a fraccionamiento or paquete.
+
+The first columns are exactly those of static/templates/lotes_template.csv,
+so an export can be edited and fed back to the bulk upload (which ignores
+the extra columns). Rows are read as plain tuples in yield_per batches and
+written out one batch at a time, so memory stays flat however many lots
+are exported.
+"""
+import csv
+import io
+from app.database import db
+from app.clients.models import Client
+from .models import Prototipo, Fraccionamiento, Paquete, Lote, LoteAsignacion
+
+# Same order as lotes_template.csv
+TEMPLATE_COLUMNS = [
+    'prototipo_id', 'calle', 'numero_exterior', 'numero_interior', 'manzana', 'lote', 'cuv',
+    'terreno', 'tipo_de_lote', 'estado_del_inmueble', 'precio',
+    'orientacion_1', 'medidas_orientacion_1', 'colindancia_1',
+    'orientacion_2', 'medidas_orientacion_2', 'colindancia_2',
+    'orientacion_3', 'medidas_orientacion_3', 'colindancia_3',
+    'orientacion_4', 'medidas_orientacion_4', 'colindancia_4',
+]
+
+EXTRA_COLUMNS = [
+    'lote_id', 'perimetro', 'frente', 'fraccionamiento', 'paquete', 'prototipo',
+    'asignacion_estado', 'fecha_asignacion', 'cliente_id', 'cliente',
+]
+
+# Columns written with two decimals, as in the template
+DECIMAL_COLUMNS = ('terreno', 'precio', 'perimetro', 'frente')
+
+def _format(name, value):
+    if value is None:
+        return ''
+    if name in DECIMAL_COLUMNS:
+        return f'{value:.2f}'
+    return value
+
+def export_query(fraccionamiento_id=None, paquete_id=None):
+    """Tuples of TEMPLATE_COLUMNS + EXTRA_COLUMNS in catalog order"""
+    query = db.session.query(
+        *[getattr(Lote, name) for name in TEMPLATE_COLUMNS],
+        Lote.id, Lote.perimetro, Lote.frente, Fraccionamiento.nombre, Paquete.nombre, Prototipo.nombre_prototipo,
+        LoteAsignacion.estado, LoteAsignacion.fecha_asignacion, Client.id,
+        Client.nombre, Client.apellido_paterno, Client.apellido_materno
+    ).select_from(Lote)\
+        .join(Paquete, Paquete.id == Lote.paquete_id)\
+        .join(Fraccionamiento, Fraccionamiento.id == Lote.fraccionamiento_id)\
+        .join(Prototipo, Prototipo.id == Lote.prototipo_id)\
+        .outerjoin(LoteAsignacion, LoteAsignacion.lote_id == Lote.id)\
+        .outerjoin(Client, Client.id == LoteAsignacion.client_id)
+
+    if fraccionamiento_id:
+        query = query.filter(Lote.fraccionamiento_id == fraccionamiento_id)
+    if paquete_id:
+        query = query.filter(Lote.paquete_id == paquete_id)
+
+    return query.order_by(Lote.paquete_id, Lote.manzana_orden, Lote.lote_orden, Lote.id)
+
+def _row(values):
+    size = len(TEMPLATE_COLUMNS)
+    row = [_format(name, value) for name, value in zip(TEMPLATE_COLUMNS, values[:size])]
+    lote_id, perimetro, frente, fraccionamiento, paquete, prototipo, estado, fecha, client_id = values[size:size + 9]
+    cliente = ' '.join(part for part in values[size + 9:] if part)
+    row += [lote_id, _format('perimetro', perimetro), _format('frente', frente),
+            fraccionamiento, paquete, prototipo, estado or '',
+            fecha.isoformat(sep=' ', timespec='seconds') if fecha else '',
+            client_id or '', cliente]
+    return row
+
+def generate_csv(fraccionamiento_id=None, paquete_id=None, batch_size=1000):
+    """Yield the export as CSV text, one chunk per batch of lots"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TEMPLATE_COLUMNS + EXTRA_COLUMNS)
+
+    for count, values in enumerate(export_query(fraccionamiento_id, paquete_id).yield_per(batch_size), 1):
+        writer.writerow(_row(values))
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
@@ -0,0 +1,28 @@
+"""Lock between the processes that rewrite the same generated file.
+
+The lot index, the sembrado overlays and the catalog snapshots are files
+written by whichever worker process notices they are stale, and sembrado
+tiles are built by a thread per upload; holding the lock of a path keeps
+two of them from rewriting it at the same time. Every holder opens the
+lock file itself, so threads of one process exclude each other too.
+"""
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+class FileLock:
+    """Exclusive lock shared by every process using the same file"""
+    def __init__(self, path):
+        self.path = path + '.lock'
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
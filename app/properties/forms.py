@@ -1,8 +1,9 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, FloatField, IntegerField, TextAreaField, MultipleFileField, SelectField, SubmitField
-from wtforms.validators import DataRequired, NumberRange, Optional
+from wtforms.validators import DataRequired, NumberRange, Optional, ValidationError
 from flask_wtf.file import FileAllowed, FileField
-from .models import Fraccionamiento, Prototipo
+from .reference_cache import fraccionamiento_choices, prototipo_choices
+from .sembrado import parse_poligono
 
 class PrototipoForm(FlaskForm):
     nombre_prototipo = StringField('Nombre de Prototipo', validators=[DataRequired(message='El nombre es requerido')])
@@ -156,13 +157,20 @@ class LoteForm(FlaskForm):
     medidas_orientacion_4 = StringField('Medidas Orientación 4')
     colindancia_4 = StringField('Colindancia 4')
     
+    sembrado_poligono = TextAreaField('Polígono en el Sembrado')
+    
     submit = SubmitField('Guardar Lote')
 
     def __init__(self, *args, **kwargs):
         super(LoteForm, self).__init__(*args, **kwargs)
-        self.prototipo_id.choices = [
-            (p.id, p.nombre_prototipo) for p in Prototipo.query.order_by('nombre_prototipo').all()
-        ]
+        self.prototipo_id.choices = list(prototipo_choices())
+
+    def validate_sembrado_poligono(self, field):
+        if field.data and field.data.strip():
+            try:
+                field.data = parse_poligono(field.data)
+            except ValueError as e:
+                raise ValidationError(str(e))
 
 class LoteFilterForm(FlaskForm):
     fraccionamiento = SelectField('Fraccionamiento', coerce=int, validators=[DataRequired()])
@@ -176,7 +184,7 @@ class LoteFilterForm(FlaskForm):
     
     def __init__(self, *args, **kwargs):
         super(LoteFilterForm, self).__init__(*args, **kwargs)
-        self.fraccionamiento.choices = [(f.id, f.nombre) for f in Fraccionamiento.query.order_by('nombre').all()]
+        self.fraccionamiento.choices = list(fraccionamiento_choices())
         self.paquete.choices = [(0, 'Todos los paquetes')]  # Default choice
 
 class LoteBulkUploadForm(FlaskForm):
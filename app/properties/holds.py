@@ -0,0 +1,188 @@
+"""Expiry of apartado holds.
+
+An assignment made with a vence_en is released automatically once that
+moment passes, with a LoteAsignacionHistorial row like a manual release.
+Each process running the web app keeps a heap of the hold deadlines it
+knows of (the next one in the database, plus every hold committed by the
+process itself) and a thread that sleeps until the earliest of them.
+When it wakes up, the holds due are read through the (estado, vence_en)
+index and released BATCH_SIZE lots per transaction; the assignments that
+are not due are never looked at. A batch that fails is retried lot by lot,
+so one bad hold does not keep the others from expiring, and holds still
+due after a sweep are retried after RETRY_DELAY seconds, doubling up to
+MAX_SLEEP while they keep failing, instead of right away.
+
+Holds created by other processes are picked up when the thread resyncs
+with the database, at the latest every MAX_SLEEP seconds. Several
+processes releasing the same holds is harmless: release_many is all or
+nothing, so the loser rolls back and the next sweep skips what is gone.
+Set HOLD_SCHEDULER=0 to leave a process out.
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app.database import db
+from .models import LoteAsignacion
+from .reservations import release_many, RESERVED_ESTADO
+
+BATCH_SIZE = 200
+MAX_SLEEP = 300  # seconds
+RETRY_DELAY = 5  # seconds
+EXPIRED_MOTIVO = 'Apartado vencido'
+
+def hold_deadline(horas=None, now=None):
+    """vence_en of a hold lasting horas, or APARTADO_VIGENCIA_HORAS when None; None if it never expires"""
+    if horas is None:
+        horas = current_app.config.get('APARTADO_VIGENCIA_HORAS')
+        if horas is None:
+            return None
+    horas = float(horas)
+    if horas <= 0:
+        raise ValueError('La vigencia del apartado debe ser mayor a cero')
+    return (now or datetime.utcnow()) + timedelta(hours=horas)
+
+def release_expired(now=None, batch_size=BATCH_SIZE):
+    """Release the holds due at now, batch_size lots per transaction; returns the number released"""
+    now = now or datetime.utcnow()
+    table = LoteAsignacion.__table__
+    failed = set()
+    total = 0
+    while True:
+        due = select(table.c.lote_id)\
+            .where(table.c.estado == RESERVED_ESTADO, table.c.vence_en <= now)\
+            .order_by(table.c.vence_en).limit(batch_size)
+        if failed:
+            due = due.where(table.c.lote_id.not_in(failed))
+        lote_ids = db.session.execute(due).scalars().all()
+        if not lote_ids:
+            return total
+        try:
+            total += release_many(lote_ids, user=None, motivo=EXPIRED_MOTIVO, now=now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            total += _release_one_by_one(lote_ids, now, failed)
+        if len(lote_ids) < batch_size:
+            return total
+
+def _release_one_by_one(lote_ids, now, failed):
+    """Release the lots of a failed batch separately; adds the ones that fail to failed"""
+    total = 0
+    for lote_id in lote_ids:
+        try:
+            total += release_many([lote_id], user=None, motivo=EXPIRED_MOTIVO, now=now)
+            db.session.commit()
+        except ValueError:
+            # Released by someone else meanwhile, most likely
+            db.session.rollback()
+            failed.add(lote_id)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('No se pudo liberar el apartado vencido del lote %s', lote_id)
+            failed.add(lote_id)
+    return total
+
+def next_deadline():
+    """Earliest vence_en of the current holds"""
+    return db.session.query(func.min(LoteAsignacion.vence_en))\
+        .filter(LoteAsignacion.estado == RESERVED_ESTADO, LoteAsignacion.vence_en.isnot(None)).scalar()
+
+class HoldScheduler:
+    """Thread sleeping until the earliest known hold deadline"""
+
+    def __init__(self, app):
+        self.app = app
+        self.deadlines = []  # heap of datetimes
+        self.condition = threading.Condition()
+        self.thread = None
+        self.retry_delay = RETRY_DELAY
+
+    def schedule(self, deadline):
+        with self.condition:
+            if not self.deadlines or deadline < self.deadlines[0]:
+                # Earlier than what the thread sleeps for
+                self.condition.notify()
+            heapq.heappush(self.deadlines, deadline)
+
+    def start(self):
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='apartado-holds', daemon=True)
+                self.thread.start()
+
+    def _sleep(self):
+        """Return when a deadline is due or after MAX_SLEEP seconds"""
+        with self.condition:
+            while True:
+                now = datetime.utcnow()
+                if self.deadlines and self.deadlines[0] <= now:
+                    while self.deadlines and self.deadlines[0] <= now:
+                        heapq.heappop(self.deadlines)
+                    return
+                timeout = (self.deadlines[0] - now).total_seconds() if self.deadlines else MAX_SLEEP
+                if not self.condition.wait(min(timeout, MAX_SLEEP)) and timeout >= MAX_SLEEP:
+                    return
+
+    def _run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    released = release_expired()
+                    if released:
+                        current_app.logger.info('%s apartados vencidos liberados', released)
+                    deadline = next_deadline()
+                except Exception:
+                    db.session.rollback()
+                    current_app.logger.exception('No se pudieron liberar los apartados vencidos')
+                    deadline = datetime.min
+            self._plan(deadline)
+            self._sleep()
+
+    def _plan(self, deadline, now=None):
+        """Queue the wake-up for the next deadline found after a sweep"""
+        now = now or datetime.utcnow()
+        if deadline is not None and deadline <= now:
+            # Still due after the sweep: it failed, so back off instead of spinning
+            deadline = now + timedelta(seconds=self.retry_delay)
+            self.retry_delay = min(self.retry_delay * 2, MAX_SLEEP)
+        else:
+            self.retry_delay = RETRY_DELAY
+        if deadline is not None:
+            with self.condition:
+                # A later one is covered by the wake-up for the current top
+                if not self.deadlines or deadline < self.deadlines[0]:
+                    heapq.heappush(self.deadlines, deadline)
+
+_scheduler = None
+
+def init_app(app):
+    """Start the scheduler with the first request of a process (not for CLI commands or tests)"""
+    global _scheduler
+    if not app.config.get('HOLD_SCHEDULER'):
+        return
+    _scheduler = HoldScheduler(app)
+
+    @app.before_request
+    def _start_hold_scheduler():
+        if not app.testing:
+            _scheduler.start()
+
+@event.listens_for(Session, 'after_flush')
+def _collect_holds(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, LoteAsignacion) and obj.vence_en is not None:
+            session.info.setdefault('apartado_holds', set()).add(obj.vence_en)
+
+@event.listens_for(Session, 'after_commit')
+def _schedule_holds(session):
+    deadlines = session.info.pop('apartado_holds', None)
+    if deadlines and _scheduler is not None:
+        for deadline in deadlines:
+            _scheduler.schedule(deadline)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_holds(session):
+    session.info.pop('apartado_holds', None)
@@ -0,0 +1,150 @@
+"""Inventory of a fraccionamiento as it was at any past moment.
+
+Once a day (flask snapshot-inventory) the estado and precio of every lot of
+each fraccionamiento is stored as one compressed InventarioSnapshot row. To
+answer "what was available on March 1st", the latest snapshot taken before
+that moment is loaded and the few changes made between the snapshot and
+the moment are replayed on top of it:
+
+- assignment periods (LoteAsignacionHistorial) overlapping the window: the
+  lot took the period's estado at fecha_inicio and became Libre at fecha_fin
+- current assignments (LoteAsignacion) made within the window
+- price changes (lote_precio_historial) within the window
+
+Each of those is one range read on a (fecha...) index, so the cost depends
+on the activity of at most one day plus the size of the fraccionamiento,
+never on the whole history. Estados typed directly in the lot form leave no
+history and are only seen from the next snapshot on. Before the first
+snapshot the full history is replayed from the creation of each lot.
+"""
+import json
+import zlib
+from datetime import datetime
+from collections import Counter
+from sqlalchemy import func
+from app.database import db
+from .models import Fraccionamiento, Lote, LoteAsignacion, LoteAsignacionHistorial, LotePrecioHistorial, \
+    InventarioSnapshot
+
+def _pack(rows):
+    """Compress (lote_id, estado, precio) rows, one JSON array per column"""
+    estados = sorted({estado for _, estado, _ in rows})
+    codes = {estado: code for code, estado in enumerate(estados)}
+    return zlib.compress(json.dumps({
+        'estados': estados,
+        'ids': [lote_id for lote_id, _, _ in rows],
+        'codigos': [codes[estado] for _, estado, _ in rows],
+        'precios': [precio for _, _, precio in rows]
+    }, separators=(',', ':')).encode('utf-8'))
+
+def _unpack(datos):
+    """{lote_id: [estado, precio]} of a snapshot"""
+    data = json.loads(zlib.decompress(datos))
+    estados = data['estados']
+    return {lote_id: [estados[code], precio]
+            for lote_id, code, precio in zip(data['ids'], data['codigos'], data['precios'])}
+
+def take_snapshot(fraccionamiento_id, when=None):
+    """Store the current state of the lots of a fraccionamiento; the caller commits"""
+    rows = db.session.query(Lote.id, Lote.estado_del_inmueble, Lote.precio)\
+        .filter(Lote.fraccionamiento_id == fraccionamiento_id).order_by(Lote.id).all()
+    snapshot = InventarioSnapshot(fraccionamiento_id=fraccionamiento_id, tomado_en=when or datetime.utcnow(),
+                                  total_lotes=len(rows), datos=_pack(rows))
+    db.session.add(snapshot)
+    return snapshot
+
+def take_daily_snapshots(force=False):
+    """Snapshot every fraccionamiento that has none yet today; returns how many were taken"""
+    now = datetime.utcnow()
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    taken = {fid for (fid,) in db.session.query(InventarioSnapshot.fraccionamiento_id)
+             .filter(InventarioSnapshot.tomado_en >= start_of_day)}
+    total = 0
+    for (fraccionamiento_id,) in db.session.query(Fraccionamiento.id).order_by(Fraccionamiento.id):
+        if force or fraccionamiento_id not in taken:
+            take_snapshot(fraccionamiento_id, now)
+            total += 1
+    db.session.commit()
+    return total
+
+def _events(fraccionamiento_id, since, until):
+    """(moment, order, lote_id, field, value) changes in (since, until], oldest first"""
+    events = []
+    periods = db.session.query(LoteAsignacionHistorial.lote_id, LoteAsignacionHistorial.fecha_inicio,
+                               LoteAsignacionHistorial.fecha_fin, LoteAsignacionHistorial.estado)\
+        .join(Lote, Lote.id == LoteAsignacionHistorial.lote_id)\
+        .filter(Lote.fraccionamiento_id == fraccionamiento_id, LoteAsignacionHistorial.fecha_inicio <= until)
+    if since is not None:
+        periods = periods.filter(LoteAsignacionHistorial.fecha_fin > since)
+    for lote_id, inicio, fin, estado in periods:
+        if since is None or inicio > since:
+            events.append((inicio, 0, lote_id, 'estado', estado))
+        if fin <= until:
+            events.append((fin, 0, lote_id, 'estado', 'Libre'))
+
+    current = db.session.query(LoteAsignacion.lote_id, LoteAsignacion.fecha_asignacion, LoteAsignacion.estado)\
+        .join(Lote, Lote.id == LoteAsignacion.lote_id)\
+        .filter(Lote.fraccionamiento_id == fraccionamiento_id, LoteAsignacion.fecha_asignacion <= until)
+    if since is not None:
+        current = current.filter(LoteAsignacion.fecha_asignacion > since)
+    for lote_id, fecha, estado in current:
+        events.append((fecha, 0, lote_id, 'estado', estado))
+
+    prices = db.session.query(LotePrecioHistorial.fecha, LotePrecioHistorial.id, LotePrecioHistorial.lote_id,
+                              LotePrecioHistorial.precio_nuevo)\
+        .join(Lote, Lote.id == LotePrecioHistorial.lote_id)\
+        .filter(Lote.fraccionamiento_id == fraccionamiento_id, LotePrecioHistorial.fecha <= until)
+    if since is not None:
+        prices = prices.filter(LotePrecioHistorial.fecha > since)
+    for fecha, history_id, lote_id, nuevo in prices:
+        events.append((fecha, history_id, lote_id, 'precio', nuevo))
+
+    # Ties on the same moment keep their history order
+    events.sort(key=lambda event: (event[0], event[1]))
+    return events
+
+def _initial_prices(lote_ids):
+    """Price every lot had when created: the one its first change replaced, or its current one"""
+    first = db.session.query(LotePrecioHistorial.lote_id, func.min(LotePrecioHistorial.id).label('id'))\
+        .filter(LotePrecioHistorial.lote_id.in_(lote_ids)).group_by(LotePrecioHistorial.lote_id).subquery()
+    return dict(db.session.query(LotePrecioHistorial.lote_id, LotePrecioHistorial.precio_anterior)
+                .join(first, first.c.id == LotePrecioHistorial.id))
+
+def inventory_as_of(fraccionamiento_id, when):
+    """State of the lots of a fraccionamiento at a moment.
+
+    Returns (lots, snapshot) where lots maps lote_id -> {'estado', 'precio'}
+    and snapshot is the InventarioSnapshot replayed from (None before the
+    first one).
+    """
+    snapshot = InventarioSnapshot.query\
+        .filter(InventarioSnapshot.fraccionamiento_id == fraccionamiento_id, InventarioSnapshot.tomado_en <= when)\
+        .order_by(InventarioSnapshot.tomado_en.desc()).first()
+
+    if snapshot is not None:
+        since = snapshot.tomado_en
+        state = _unpack(snapshot.datos)
+        created = db.session.query(Lote.id, Lote.precio)\
+            .filter(Lote.fraccionamiento_id == fraccionamiento_id, Lote.created_at > since, Lote.created_at <= when)
+    else:
+        since = None
+        state = {}
+        created = db.session.query(Lote.id, Lote.precio)\
+            .filter(Lote.fraccionamiento_id == fraccionamiento_id, Lote.created_at <= when)
+    # Lots created after the snapshot start Libre at the price they were created with
+    created = dict(created.all())
+    if created:
+        created.update(_initial_prices(list(created)))
+    for lote_id, precio in created.items():
+        state.setdefault(lote_id, ['Libre', precio])
+
+    for _, _, lote_id, field, value in _events(fraccionamiento_id, since, when):
+        if lote_id in state:
+            state[lote_id][0 if field == 'estado' else 1] = value
+
+    lots = {lote_id: {'estado': estado, 'precio': precio} for lote_id, (estado, precio) in state.items()}
+    return lots, snapshot
+
+def summarize(lots):
+    """Number of lots per estado"""
+    return dict(Counter(lot['estado'] for lot in lots.values()))
@@ -0,0 +1,75 @@
+"""Numeric lot boundaries parsed from the orientacion/medidas/colindancia columns.
+
+Each lot describes up to four sides as free text, e.g. orientacion "Suroeste",
+medidas "7 y 8 metros", colindancia "Lote Número 03 y Lote Número 04
+Respectivamente". A side made of several segments is as long as their sum,
+a side that borders a street is part of the lot's front, and the lot
+numbers named in a colindancia are its neighbours in the same manzana.
+"""
+import re
+
+SIDES = range(1, 5)
+# Decimal point or comma ("7.50", "7,50"); "7, 8" are two numbers
+NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+# "Lote Número 03", "Lote No. 3", "Lotes 03 y 04", "Lote #3, 4"
+LOTE_REFERENCE = re.compile(
+    r'\blotes?\s*(?:n[úu]m(?:ero)?s?\.?|no\.?|n[°º]\.?|#)?\s*(\d+(?:\s*(?:,|y)\s*\d+)*)',
+    re.IGNORECASE
+)
+STREET_WORDS = ('calle', 'av', 'avenida', 'blvd', 'boulevard', 'privada', 'priv',
+                'circuito', 'cerrada', 'andador', 'vialidad', 'carretera', 'camino')
+
+def parse_longitudes(medidas):
+    """Segment lengths in a measure string ("7 y 8 metros" -> [7.0, 8.0])"""
+    return [float(value.replace(',', '.')) for value in NUMBER.findall(medidas or '')]
+
+def parse_longitud(medidas):
+    """Total length of a side, or None when the string has no number"""
+    longitudes = parse_longitudes(medidas)
+    return sum(longitudes) if longitudes else None
+
+def borders_street(colindancia, calle=None):
+    """Whether a colindancia is a street: it names the lot's calle or starts with a street word"""
+    text = (colindancia or '').strip().lower()
+    if not text:
+        return False
+    if calle and calle.strip().lower() in text:
+        return True
+    return re.split(r'[\s.]+', text)[0] in STREET_WORDS
+
+def linderos_de(lote):
+    """One dict per described side of a lot, with its parsed length"""
+    linderos = []
+    for lado in SIDES:
+        orientacion = getattr(lote, f'orientacion_{lado}')
+        medidas = getattr(lote, f'medidas_orientacion_{lado}')
+        colindancia = getattr(lote, f'colindancia_{lado}')
+        if not any([orientacion, medidas, colindancia]):
+            continue
+        linderos.append({
+            'lado': lado,
+            'orientacion': orientacion,
+            'medidas': medidas,
+            'colindancia': colindancia,
+            'longitud': parse_longitud(medidas),
+            'es_frente': borders_street(colindancia, lote.calle)
+        })
+    return linderos
+
+def perimetro(linderos):
+    """Sum of the side lengths, or None when no side could be parsed"""
+    longitudes = [lindero['longitud'] for lindero in linderos if lindero['longitud'] is not None]
+    return sum(longitudes) if longitudes else None
+
+def frente(linderos):
+    """Length of the longest side bordering a street, or None"""
+    longitudes = [lindero['longitud'] for lindero in linderos
+                  if lindero['es_frente'] and lindero['longitud'] is not None]
+    return max(longitudes) if longitudes else None
+
+def parse_vecinos(colindancia):
+    """Lot numbers named in a colindancia ("Lote Número 03 y Lote Número 04" -> [3, 4])"""
+    numbers = []
+    for match in LOTE_REFERENCE.finditer(colindancia or ''):
+        numbers.extend(int(number) for number in re.findall(r'\d+', match.group(1)))
+    return numbers
@@ -0,0 +1,87 @@
+"""Publishing of lot changes to the live status gateway.
+
+Every committed change to the estado or precio of a lot (assignments,
+releases, expired holds, edits, new and deleted lots) is sent as JSON over
+UDP to LIVE_EVENTS_ADDRESS, where live_gateway.py relays it to the open
+catalog pages as server-sent events. Sending a datagram never blocks nor
+fails the request: with the gateway down the events are simply lost, and
+pages show the current state again on reload.
+
+Bulk Core updates add their events to session.info['live_events'] (see
+bulk.estados_changed). Every event carries the 'lotes' version its commit
+bumped to, so the gateway can replay to a page what happened after the
+version its rows were read at (see lotes_catalog).
+"""
+import json
+import socket
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from .models import Lote
+
+PUBLISHED_ATTRIBUTES = ('estado_del_inmueble', 'precio')
+EVENTS_PER_DATAGRAM = 50
+
+_socket = None
+_lock = threading.Lock()
+
+def lot_event(lote_id, fraccionamiento_id, paquete_id, estado, precio=None):
+    """Event of one lot; estado None means it was deleted, precio None that it did not change"""
+    event = {'lote_id': lote_id, 'fraccionamiento_id': fraccionamiento_id, 'paquete_id': paquete_id,
+             'estado_del_inmueble': estado}
+    if precio is not None:
+        event['precio'] = precio
+    return event
+
+def _address():
+    address = current_app.config.get('LIVE_EVENTS_ADDRESS') if has_app_context() else None
+    if not address:
+        return None
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+def publish(events, version=None):
+    """Send events to the gateway, EVENTS_PER_DATAGRAM per datagram, stamped with a 'lotes' version"""
+    global _socket
+    address = _address()
+    if not address or not events:
+        return
+    if version is not None:
+        events = [dict(event, version=version) for event in events]
+    with _lock:
+        if _socket is None:
+            _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            _socket.setblocking(False)
+    for start in range(0, len(events), EVENTS_PER_DATAGRAM):
+        datagram = json.dumps(events[start:start + EVENTS_PER_DATAGRAM], separators=(',', ':')).encode('utf-8')
+        try:
+            _socket.sendto(datagram, address)
+        except OSError:
+            current_app.logger.debug('No se pudieron publicar cambios de lotes', exc_info=True)
+            return
+
+@event.listens_for(Session, 'after_flush')
+def _collect_lot_events(session, flush_context):
+    events = session.info.setdefault('live_events', {})
+    for obj in session.new | session.dirty:
+        if not isinstance(obj, Lote) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        if obj in session.new or any(state.attrs[key].history.has_changes() for key in PUBLISHED_ATTRIBUTES):
+            events[obj.id] = lot_event(obj.id, obj.fraccionamiento_id, obj.paquete_id, obj.estado_del_inmueble,
+                                       obj.precio)
+    for obj in session.deleted:
+        if isinstance(obj, Lote):
+            events[obj.id] = lot_event(obj.id, obj.fraccionamiento_id, obj.paquete_id, None)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_lot_events(session):
+    events = session.info.pop('live_events', None)
+    if events:
+        # Bumped by the after_commit listener of versions.py, which runs first
+        publish(list(events.values()), session.info.get('committed_versions', {}).get('lotes'))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_lot_events(session):
+    session.info.pop('live_events', None)
@@ -0,0 +1,80 @@
+"""Named eager-loading profiles for the properties queries.
+
+Each profile lists the relationships a page or API response touches, so a
+listing costs a fixed number of SELECTs no matter how many rows it shows.
+Profiles are built lazily because the backref attributes (Lote.paquete,
+Lote.prototipo, Paquete.fraccionamiento) only exist once the mappers are
+configured.
+"""
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from .models import (Prototipo, Fraccionamiento, Paquete, Lote,
+                     LoteAsignacion, LoteAsignacionHistorial)
+
+PROFILES = {}
+
+def profile(name):
+    """Register a function returning the loader options of a profile"""
+    def decorator(f):
+        PROFILES[name] = f
+        return f
+    return decorator
+
+def load_options(name):
+    """Loader options of a registered profile"""
+    if name not in PROFILES:
+        raise ValueError(f'Perfil de carga desconocido: {name}')
+    return PROFILES[name]()
+
+def with_profile(query, name):
+    """Apply a registered profile to a query"""
+    return query.options(*load_options(name))
+
+@profile('catalog_row')
+def catalog_row():
+    """Catalog tables; the query must already join paquete, fraccionamiento and prototipo"""
+    return (
+        contains_eager(Lote.paquete).contains_eager(Paquete.fraccionamiento),
+        contains_eager(Lote.prototipo)
+    )
+
+@profile('admin_grid')
+def admin_grid():
+    """Lot form and admin pages: the lot with its paquete, fraccionamiento and prototipo"""
+    return (
+        joinedload(Lote.paquete).joinedload(Paquete.fraccionamiento),
+        joinedload(Lote.prototipo)
+    )
+
+@profile('lot_detail')
+def lot_detail():
+    """Lot detail API: admin_grid plus prototipo images, the current assignment's client and the linderos"""
+    return (
+        joinedload(Lote.paquete).joinedload(Paquete.fraccionamiento),
+        joinedload(Lote.prototipo).selectinload(Prototipo.imagenes),
+        joinedload(Lote.asignacion).joinedload(LoteAsignacion.client),
+        selectinload(Lote.linderos)
+    )
+
+@profile('lot_history')
+def lot_history():
+    """Assignment history rows with their client and user"""
+    return (
+        joinedload(LoteAsignacionHistorial.client),
+        joinedload(LoteAsignacionHistorial.user)
+    )
+
+@profile('prototipo_card')
+def prototipo_card():
+    """Prototipo cards, which show the first image; joined, since selectinload
+    issues one more SELECT per 500 prototipos"""
+    return (joinedload(Prototipo.imagenes),)
+
+@profile('paquete_page')
+def paquete_page():
+    """Paquete pages, whose breadcrumb shows the fraccionamiento"""
+    return (joinedload(Paquete.fraccionamiento),)
+
+@profile('fraccionamiento_page')
+def fraccionamiento_page():
+    """Fraccionamiento with its paquetes"""
+    return (selectinload(Fraccionamiento.paquetes),)
@@ -0,0 +1,385 @@
+"""Memory-mapped columnar index of the lot inventory for the public catalog.
+
+The public catalog rows of every lot are written to one file as fixed-width
+columns (array module typecodes) plus the JSON of each row, ordered by
+fraccionamiento, paquete and natural manzana/lote order, with two extra
+permutations for the precio and terreno sorts. Worker processes mmap the
+file read-only, so they all share the same pages of the OS cache instead
+of each holding a copy, and answer keyset-paginated catalog queries with a
+binary search plus a short scan instead of a database query.
+
+The file is stamped with the TablaVersion versions of the tables it was
+built from. Readers compare the stamp with the database (one small SELECT);
+when it is stale they start a rebuild in a background thread and are
+answered from the database until the new file replaces the old one, so a
+write never makes a catalog request wait for a rebuild. Commits that only
+change the estado of existing lots patch the estado column and the stamp in
+place instead.
+"""
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app.database import db
+from .models import Prototipo, Fraccionamiento, Paquete, Lote, TablaVersion
+from .catalog import catalog_query, serialize_catalog_row, encode_cursor, decode_cursor
+from .versions import get_versions
+from .file_lock import FileLock
+
+MAGIC = b'LOTIDX01'
+# Tables the rows are built from; the stamp holds one version per table
+TABLES = ('lotes', 'paquetes', 'fraccionamiento', 'prototipos')
+SOURCE_MODELS = (Lote, Paquete, Fraccionamiento, Prototipo)
+STAMP = struct.Struct('<' + 'q' * len(TABLES))
+HEADER_LENGTH = struct.Struct('<Q')
+# Lot attributes that can change without a rebuild
+PATCHABLE_ATTRIBUTES = {'estado_del_inmueble', 'updated_at'}
+
+# name -> typecode of the fixed-width columns, all in file order except the permutations
+COLUMNS = (
+    ('id', 'i'),
+    ('paquete', 'i'),
+    ('manzana_orden', 'i'),
+    ('lote_orden', 'i'),
+    ('precio', 'd'),
+    ('terreno', 'd'),
+    ('estado', 'B'),
+    ('by_precio', 'i'),   # positions sorted by (fraccionamiento, precio, id)
+    ('by_terreno', 'i'),  # positions sorted by (fraccionamiento, terreno, id)
+    ('by_id', 'i'),       # positions sorted by id, to find a lot when patching
+    ('row_offsets', 'q'),
+    ('row_data', 'B'),    # public catalog row of each lot as JSON, without estado
+)
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def read_stamp(connection):
+    """Current versions of TABLES, in TABLES order"""
+    table = TablaVersion.__table__
+    versions = dict(connection.execute(
+        select(table.c.tabla, table.c.version).where(table.c.tabla.in_(TABLES))
+    ).all())
+    return tuple(versions.get(name, 0) for name in TABLES)
+
+def build(path):
+    """Write a fresh index file for the whole inventory and return the row count"""
+    stamp = read_stamp(db.session.connection())
+    estados = list(Lote.ESTADOS_INMUEBLE)
+    columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+    columns['row_offsets'].append(0)
+    fraccionamientos = []
+    ranges = {'fraccionamientos': {}, 'paquetes': {}}
+
+    query = catalog_query().order_by(Lote.fraccionamiento_id, Lote.paquete_id,
+                                     Lote.manzana_orden, Lote.lote_orden, Lote.id)
+    for position, lote in enumerate(query.yield_per(1000)):
+        if lote.estado_del_inmueble not in estados:
+            estados.append(lote.estado_del_inmueble)
+        for scope, key in (('fraccionamientos', lote.fraccionamiento_id), ('paquetes', lote.paquete_id)):
+            bounds = ranges[scope].setdefault(str(key), [position, position, lote.fraccionamiento_id])
+            bounds[1] = position + 1
+
+        fraccionamientos.append(lote.fraccionamiento_id)
+        columns['id'].append(lote.id)
+        columns['paquete'].append(lote.paquete_id)
+        columns['manzana_orden'].append(lote.manzana_orden)
+        columns['lote_orden'].append(lote.lote_orden)
+        columns['precio'].append(float(lote.precio))
+        columns['terreno'].append(lote.terreno or 0)
+        columns['estado'].append(estados.index(lote.estado_del_inmueble))
+
+        row = serialize_catalog_row(lote)
+        del row['estado_del_inmueble']
+        columns['row_data'].frombytes(json.dumps(row, separators=(',', ':')).encode('utf-8'))
+        columns['row_offsets'].append(len(columns['row_data']))
+
+    count = len(columns['id'])
+    positions = range(count)
+    ids, precio, terreno = columns['id'], columns['precio'], columns['terreno']
+    columns['by_precio'].extend(sorted(positions, key=lambda i: (fraccionamientos[i], precio[i], ids[i])))
+    columns['by_terreno'].extend(sorted(positions, key=lambda i: (fraccionamientos[i], terreno[i], ids[i])))
+    columns['by_id'].extend(sorted(positions, key=ids.__getitem__))
+
+    # Lay the columns out after the header, each 8-byte aligned
+    header = {'rows': count, 'estados': estados, 'columns': {}}
+    header.update(ranges)
+    offset = 0
+    for name, typecode in COLUMNS:
+        header['columns'][name] = [offset, typecode, len(columns[name])]
+        offset = _align(offset + len(columns[name]) * columns[name].itemsize)
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    data_start = _align(len(MAGIC) + STAMP.size + HEADER_LENGTH.size + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + STAMP.pack(*stamp) + HEADER_LENGTH.pack(len(header_bytes)) + header_bytes)
+        for name, _ in COLUMNS:
+            f.seek(data_start + header['columns'][name][0])
+            columns[name].tofile(f)
+        f.truncate(data_start + offset)
+    os.replace(temporary, path)
+    return count
+
+class LotIndex:
+    """Read-only view over a mapped index file"""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._map)
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError('Archivo de índice inválido')
+        start = len(MAGIC) + STAMP.size
+        (length,) = HEADER_LENGTH.unpack_from(self._map, start)
+        start += HEADER_LENGTH.size
+        header = json.loads(bytes(view[start:start + length]))
+        data_start = _align(start + length)
+
+        self.rows = header['rows']
+        self.estados = header['estados']
+        self.fraccionamientos = {int(key): bounds for key, bounds in header['fraccionamientos'].items()}
+        self.paquetes = {int(key): bounds for key, bounds in header['paquetes'].items()}
+        self.offsets = {}
+        for name, (offset, typecode, size) in header['columns'].items():
+            self.offsets[name] = data_start + offset
+            column = view[data_start + offset:data_start + offset + size * array.array(typecode).itemsize]
+            setattr(self, name, column.cast(typecode))
+        view.release()
+
+    @property
+    def stamp(self):
+        return STAMP.unpack_from(self._map, len(MAGIC))
+
+    def _sort(self, sort):
+        """Sequence of positions and the sort key of a position"""
+        if sort == 'ubicacion':
+            return None, lambda i: (self.paquete[i], self.manzana_orden[i], self.lote_orden[i], self.id[i])
+        if sort == 'precio':
+            return self.by_precio, lambda i: (self.precio[i], self.id[i])
+        if sort == 'terreno':
+            return self.by_terreno, lambda i: (self.terreno[i], self.id[i])
+        raise ValueError(f'Orden no soportado: {sort}')
+
+    def page(self, fraccionamiento_id=None, paquete_id=None, estado=None,
+             sort='ubicacion', descending=False, after=None, limit=50):
+        """Same contract as catalog.catalog_page, returning public row dicts"""
+        order, sort_key = self._sort(sort)
+        if paquete_id:
+            bounds = self.paquetes.get(paquete_id)
+            if bounds is not None and fraccionamiento_id and bounds[2] != fraccionamiento_id:
+                bounds = None
+        else:
+            bounds = self.fraccionamientos.get(fraccionamiento_id)
+
+        estado_code = None
+        if estado:
+            estado_code = self.estados.index(estado) if estado in self.estados else -1
+        if bounds is None or estado_code == -1:
+            return [], None
+
+        if order is None:
+            # File order is the ubicacion order; a paquete is a contiguous range
+            lo, hi = bounds[0], bounds[1]
+            positions = range(self.rows)
+            only_paquete = None
+        else:
+            # Permutations are grouped by fraccionamiento with the same bounds
+            lo, hi = self.fraccionamientos[bounds[2]][:2]
+            positions = order
+            only_paquete = paquete_id or None
+
+        if after:
+            cursor = tuple(decode_cursor(after, 4 if order is None else 2))
+            if descending:
+                hi = bisect.bisect_left(positions, cursor, lo, hi, key=sort_key)
+            else:
+                lo = bisect.bisect_right(positions, cursor, lo, hi, key=sort_key)
+
+        walk = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        found = []
+        for index in walk:
+            position = positions[index]
+            if only_paquete is not None and self.paquete[position] != only_paquete:
+                continue
+            if estado_code is not None and self.estado[position] != estado_code:
+                continue
+            found.append(position)
+            if len(found) > limit:
+                break
+
+        next_cursor = None
+        if len(found) > limit:
+            found = found[:limit]
+            next_cursor = encode_cursor(list(sort_key(found[-1])))
+        return [self.row(position) for position in found], next_cursor
+
+    def row(self, position):
+        row = json.loads(bytes(self.row_data[self.row_offsets[position]:self.row_offsets[position + 1]]))
+        row['estado_del_inmueble'] = self.estados[self.estado[position]]
+        return row
+
+    def position_of(self, lote_id):
+        index = bisect.bisect_left(self.by_id, lote_id, key=self.id.__getitem__)
+        if index < self.rows and self.id[self.by_id[index]] == lote_id:
+            return self.by_id[index]
+        return None
+
+    def close(self):
+        for name, _ in COLUMNS:
+            getattr(self, name).release()
+        self._map.close()
+
+_lock = threading.Lock()
+_current = None
+_rebuilding = None
+
+def _path():
+    return current_app.config.get('LOT_INDEX_PATH')
+
+def _is_fresh(path, stamp):
+    try:
+        index = LotIndex(path)
+    except (FileNotFoundError, ValueError):
+        return False
+    fresh = index.stamp == stamp
+    index.close()
+    return fresh
+
+def _rebuild(app, path):
+    with app.app_context():
+        try:
+            with FileLock(path):
+                # Another process may have rebuilt it while we waited
+                if not _is_fresh(path, read_stamp(db.session.connection())):
+                    build(path)
+        except Exception:
+            app.logger.exception('No se pudo reconstruir el índice de lotes')
+
+def _start_rebuild(path):
+    """Rebuild the file in a thread unless this process already is; call with _lock held"""
+    global _rebuilding
+    if _rebuilding is None or not _rebuilding.is_alive():
+        _rebuilding = threading.Thread(target=_rebuild, args=(current_app._get_current_object(), path),
+                                       name='lot-index-rebuild', daemon=True)
+        _rebuilding.start()
+
+def get_index():
+    """Mapped index matching the database, or None when disabled or being rebuilt"""
+    global _current
+    path = _path()
+    if not path:
+        return None
+    stamp = tuple(get_versions(TABLES)[name][0] for name in TABLES)
+    with _lock:
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        # A replaced file gets a new inode; the old mapping is released
+        # once the requests still reading it are done
+        if _current is not None and _current.inode != inode:
+            _current = None
+        if _current is None and inode is not None:
+            try:
+                _current = LotIndex(path)
+            except ValueError:
+                _current = None
+        if _current is not None and _current.stamp == stamp:
+            return _current
+        # Missing or stale: the caller uses the database meanwhile
+        _start_rebuild(path)
+        return None
+
+def patch_estados(path, changes, version):
+    """Write new estados into the file if it is one 'lotes' version behind version.
+
+    changes maps lote id -> estado, written by the commit that bumped
+    'lotes' to version. Returns False when the file is missing, at another
+    version or does not know a lot or estado, in which case readers will
+    rebuild it.
+    """
+    if not os.path.exists(path):
+        return False
+    with FileLock(path):
+        index = LotIndex(path)
+        try:
+            stamp = list(index.stamp)
+            if stamp[TABLES.index('lotes')] != version - 1:
+                return False
+            stamp[TABLES.index('lotes')] = version
+            patches = []
+            for lote_id, estado in changes.items():
+                position = index.position_of(lote_id)
+                if position is None or estado not in index.estados:
+                    return False
+                patches.append((index.offsets['estado'] + position, index.estados.index(estado)))
+        finally:
+            index.close()
+
+        with open(path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mapped:
+            for offset, code in patches:
+                mapped[offset] = code
+            # Stamp last, so readers never take a half-patched file as current
+            STAMP.pack_into(mapped, len(MAGIC), *stamp)
+            mapped.flush()
+    return True
+
+def _changes(session):
+    return session.info.setdefault('lot_index', {'estados': {}, 'patchable': True})
+
+def record_estados(session, estados):
+    """Record lots written outside the unit of work (see bulk.py).
+
+    estados maps lote id -> new estado when only the estado changed, or is
+    None when other columns changed too, so the file must be rebuilt.
+    """
+    changes = _changes(session)
+    if estados is None:
+        changes['patchable'] = False
+    else:
+        changes['estados'].update(estados)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_lot_changes(session, flush_context):
+    changes = _changes(session)
+    for obj in session.new | session.deleted:
+        if isinstance(obj, SOURCE_MODELS):
+            changes['patchable'] = False
+    for obj in session.dirty:
+        if not isinstance(obj, SOURCE_MODELS) or not session.is_modified(obj, include_collections=False):
+            continue
+        if not isinstance(obj, Lote):
+            changes['patchable'] = False
+            continue
+        changed = {attr.key for attr in inspect(obj).attrs if attr.history.has_changes()
+                   and attr.key in Lote.__table__.columns}
+        if changed - PATCHABLE_ATTRIBUTES:
+            changes['patchable'] = False
+        else:
+            changes['estados'][obj.id] = obj.estado_del_inmueble
+
+@event.listens_for(Session, 'after_commit')
+def _patch_after_commit(session):
+    changes = session.info.pop('lot_index', None)
+    # Bumped by the after_commit listener of versions.py, which runs first
+    version = session.info.get('committed_versions', {}).get('lotes')
+    if not _path() or not changes or not version or not changes['patchable'] or not changes['estados']:
+        return
+    try:
+        patch_estados(_path(), changes['estados'], version)
+    except (OSError, ValueError):
+        current_app.logger.exception('No se pudo actualizar el índice de lotes')
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_lot_changes(session):
+    session.info.pop('lot_index', None)
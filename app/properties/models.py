@@ -1,5 +1,9 @@
 from app.database import db
 from datetime import datetime
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from .sorting import manzana_sort_key, lote_sort_key, uses_roman_numerals, UNKNOWN_SORT_KEY
+from .linderos import SIDES, linderos_de, perimetro, frente
 
 class PrototipoImagen(db.Model):
     __tablename__ = 'prototipo_imagenes'
@@ -41,6 +45,11 @@ class Fraccionamiento(db.Model):
     ubicacion = db.Column(db.String(200), nullable=True)
     logo = db.Column(db.String(200))  # Path to logo file
     sembrado = db.Column(db.String(200))
+    # Pixel size of an image sembrado, read on upload (see sembrado.py)
+    sembrado_ancho = db.Column(db.Integer, nullable=True)
+    sembrado_alto = db.Column(db.Integer, nullable=True)
+    # Deep Zoom descriptor (.dzi) of the sembrado's tile pyramid, relative to static (see tiles.py)
+    sembrado_tiles = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -65,6 +74,9 @@ class Lote(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     paquete_id = db.Column(db.Integer, db.ForeignKey('paquetes.id'), nullable=False)
     prototipo_id = db.Column(db.Integer, db.ForeignKey('prototipos.id'), nullable=False)
+    # Copy of paquete.fraccionamiento_id so catalog filters stay on this table;
+    # kept in sync on flush (see _sync_lote_fraccionamiento)
+    fraccionamiento_id = db.Column(db.Integer, db.ForeignKey('fraccionamiento.id'), nullable=False)
     
     # Location details
     calle = db.Column(db.String(100), nullable=False)
@@ -72,6 +84,9 @@ class Lote(db.Model):
     numero_interior = db.Column(db.String(50), nullable=True)  
     manzana = db.Column(db.String(50), nullable=False)
     lote = db.Column(db.String(50), nullable=False)
+    # Natural order of manzana and lote, derived on write (see sorting.py)
+    manzana_orden = db.Column(db.Integer, nullable=False, default=UNKNOWN_SORT_KEY, server_default=str(UNKNOWN_SORT_KEY))
+    lote_orden = db.Column(db.Integer, nullable=False, default=UNKNOWN_SORT_KEY, server_default=str(UNKNOWN_SORT_KEY))
     cuv = db.Column(db.String(50), nullable=True, default=None)
     terreno = db.Column(db.Float, nullable=True, default=None)
     tipo_de_lote = db.Column(db.String(50), nullable=False)
@@ -91,6 +106,11 @@ class Lote(db.Model):
     orientacion_4 = db.Column(db.String(50), nullable=True, default=None)
     medidas_orientacion_4 = db.Column(db.String(50), nullable=True, default=None)
     colindancia_4 = db.Column(db.String(100), nullable=True, default=None)
+    # Derived from the sides above on flush (see linderos.py)
+    perimetro = db.Column(db.Float, nullable=True)
+    frente = db.Column(db.Float, nullable=True)
+    # Outline on the fraccionamiento's sembrado as SVG points in image pixels ("x,y x,y ...")
+    sembrado_poligono = db.Column(db.Text, nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -100,13 +120,43 @@ class Lote(db.Model):
     ESTADOS_INMUEBLE = ['Libre', 'Apartado', 'Titulado']
     ORIENTACIONES = ['Norte', 'Sur', 'Este', 'Oeste', 'Noreste', 'Noroeste', 'Sureste', 'Suroeste']
 
+    __table_args__ = (
+        # Catalog order within a paquete, served straight from the index
+        db.Index('ix_lotes_paquete_orden', 'paquete_id', 'manzana_orden', 'lote_orden', 'id'),
+        # Same order for a whole fraccionamiento
+        db.Index('ix_lotes_fraccionamiento_orden', 'fraccionamiento_id', 'paquete_id',
+                 'manzana_orden', 'lote_orden', 'id'),
+        db.Index('ix_lotes_fraccionamiento_frente', 'fraccionamiento_id', 'frente'),
+    )
+
+    fraccionamiento = db.relationship('Fraccionamiento')
+    linderos = db.relationship('LoteLindero',
+                               backref='lote',
+                               order_by='LoteLindero.lado',
+                               cascade='all, delete-orphan')
+
     asignacion = db.relationship('LoteAsignacion', 
                                  uselist=False,  # One-to-one relationship
                                  back_populates='lote',
                                  cascade='all, delete-orphan')
 
-    def asignar_a_cliente(self, client, user, notas=None):
-        """Assign this lot to a client"""
+    @db.validates('manzana')
+    def _set_manzana_orden(self, key, value):
+        # Single letters are settled on flush, once the paquete is known (see _sync_manzana_orden)
+        self.manzana_orden = manzana_sort_key(value)
+        return value
+
+    @db.validates('lote')
+    def _set_lote_orden(self, key, value):
+        self.lote_orden = lote_sort_key(value)
+        return value
+
+    def asignar_a_cliente(self, client, user, notas=None, vence_en=None):
+        """Assign this lot to a client.
+
+        The check below is not safe against concurrent requests; the API
+        reserves lots with reservations.reserve instead.
+        """
         if self.estado_del_inmueble != 'Libre':
             raise ValueError('Este lote no está disponible')
             
@@ -119,7 +169,8 @@ class Lote(db.Model):
             client=client,
             user=user,
             estado='Apartado',
-            notas=notas
+            notas=notas,
+            vence_en=vence_en
         )
         
         # Update lot status
@@ -152,6 +203,36 @@ class Lote(db.Model):
         
         return historial
 
+class LoteLindero(db.Model):
+    """One side of a lot with its length parsed from the free-text columns"""
+    __tablename__ = 'lote_linderos'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id'), nullable=False)
+    lado = db.Column(db.Integer, nullable=False)  # 1-4, the N of orientacion_N
+    orientacion = db.Column(db.String(50), nullable=True)
+    medidas = db.Column(db.String(50), nullable=True)
+    colindancia = db.Column(db.String(100), nullable=True)
+    longitud = db.Column(db.Float, nullable=True)  # meters, None when medidas has no number
+    es_frente = db.Column(db.Boolean, nullable=False, default=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('lote_id', 'lado', name='uq_lote_linderos_lote_lado'),
+        db.Index('ix_lote_linderos_orientacion_longitud', 'orientacion', 'longitud'),
+    )
+
+class LoteColindancia(db.Model):
+    """Two neighbouring lots of the same paquete and manzana, stored in both
+    directions; derived from the colindancias (see adjacency.py)"""
+    __tablename__ = 'lote_colindancias'
+    
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id', ondelete='CASCADE'), primary_key=True)
+    vecino_id = db.Column(db.Integer, db.ForeignKey('lotes.id', ondelete='CASCADE'), primary_key=True)
+    
+    __table_args__ = (
+        db.Index('ix_lote_colindancias_vecino', 'vecino_id'),
+    )
+
 class LoteAsignacion(db.Model):
     __tablename__ = 'lote_asignaciones'
     
@@ -162,6 +243,17 @@ class LoteAsignacion(db.Model):
     fecha_asignacion = db.Column(db.DateTime, default=datetime.utcnow)
     estado = db.Column(db.String(50), nullable=False)  # Apartado or Titulado
     notas = db.Column(db.Text, nullable=True)
+    # An Apartado hold is released automatically from this moment on (see holds.py); None: never
+    vence_en = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # At most one current assignment per lot, whoever commits first (see reservations.py)
+        db.Index('uq_lote_asignaciones_lote', 'lote_id', unique=True),
+        # Assignments made after an inventory snapshot (see inventory_history.py)
+        db.Index('ix_lote_asignaciones_fecha', 'fecha_asignacion'),
+        # Holds due at a given moment, and the next one to expire
+        db.Index('ix_lote_asignaciones_estado_vence', 'estado', 'vence_en'),
+    )
     
     # Relationships
     lote = db.relationship('Lote', back_populates='asignacion')
@@ -181,7 +273,267 @@ class LoteAsignacionHistorial(db.Model):
     motivo_cambio = db.Column(db.String(100), nullable=False)  # Reason for change
     notas = db.Column(db.Text, nullable=True)
     
+    __table_args__ = (
+        # Periods still open after a given moment and started before another
+        # one, i.e. the ones overlapping a time window (see inventory_history.py)
+        db.Index('ix_lote_asignaciones_historial_periodo', 'fecha_fin', 'fecha_inicio'),
+    )
+    
     # Relationships
     lote = db.relationship('Lote', backref='historial_asignaciones')
     client = db.relationship('Client', backref='historial_lotes')
     user = db.relationship('User', backref='historial_asignaciones')
+
+class ReglaPrecio(db.Model):
+    """Pricing rule of a fraccionamiento, or of one of its paquetes when
+    paquete_id is set; a paquete rule replaces the fraccionamiento rule with
+    the same concepto and tipo_de_lote (see pricing.py)"""
+    __tablename__ = 'reglas_precio'
+    
+    # premio_tipo_de_lote: added to the lots of tipo_de_lote, in pesos or as a
+    # percentage of the prototipo precio; precio_m2_excedente: pesos per m²
+    # of terreno beyond the prototipo superficie_terreno
+    CONCEPTOS = ['premio_tipo_de_lote', 'precio_m2_excedente']
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fraccionamiento_id = db.Column(db.Integer, db.ForeignKey('fraccionamiento.id'), nullable=False)
+    paquete_id = db.Column(db.Integer, db.ForeignKey('paquetes.id'), nullable=True)
+    concepto = db.Column(db.String(30), nullable=False)
+    tipo_de_lote = db.Column(db.String(50), nullable=True)
+    valor = db.Column(db.Float, nullable=False)
+    es_porcentaje = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_reglas_precio_fraccionamiento', 'fraccionamiento_id', 'paquete_id'),
+    )
+
+class RevisionPrecio(db.Model):
+    """One price change applied to many lots at once, a mass revision or a
+    rule recalculation; the old and new price of each lot are in
+    LotePrecioHistorial (see revisions.py)"""
+    __tablename__ = 'revisiones_precio'
+    
+    TIPOS = ['porcentaje', 'monto', 'reglas']
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # None from the command line
+    tipo = db.Column(db.String(20), nullable=False)
+    valor = db.Column(db.Float, nullable=True)  # percentage or pesos; None for reglas
+    # Scope of the revision
+    fraccionamiento_id = db.Column(db.Integer, db.ForeignKey('fraccionamiento.id'), nullable=True)
+    paquete_id = db.Column(db.Integer, db.ForeignKey('paquetes.id'), nullable=True)
+    prototipo_id = db.Column(db.Integer, db.ForeignKey('prototipos.id'), nullable=True)
+    total_lotes = db.Column(db.Integer, nullable=False, default=0)
+
+class LotePrecioHistorial(db.Model):
+    """Price of a lot from fecha on, and the price it replaced"""
+    __tablename__ = 'lote_precio_historial'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id', ondelete='CASCADE'), nullable=False)
+    revision_id = db.Column(db.Integer, db.ForeignKey('revisiones_precio.id'), nullable=True)  # None for a single edit
+    fecha = db.Column(db.DateTime, nullable=False)
+    precio_anterior = db.Column(db.Float, nullable=False)
+    precio_nuevo = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        # "Price of lot X as of date D": last row of X with fecha <= D
+        db.Index('ix_lote_precio_historial_lote_fecha', 'lote_id', 'fecha'),
+        # Every price change within a time window
+        db.Index('ix_lote_precio_historial_fecha', 'fecha'),
+    )
+
+class InventarioSnapshot(db.Model):
+    """Estado and precio of every lot of a fraccionamiento at one moment,
+    stored compressed; taken daily (see inventory_history.py)"""
+    __tablename__ = 'inventario_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fraccionamiento_id = db.Column(db.Integer, db.ForeignKey('fraccionamiento.id'), nullable=False)
+    tomado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    total_lotes = db.Column(db.Integer, nullable=False, default=0)
+    datos = db.Column(db.LargeBinary, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_inventario_snapshots_fraccionamiento_fecha', 'fraccionamiento_id', 'tomado_en'),
+    )
+
+class BusquedaGuardada(db.Model):
+    """Lot criteria a seller wants to be told about when a matching lot becomes
+    Libre. The price range is also kept as a range of price bands so the
+    searches a lot can match are found with one indexed read (see
+    saved_searches.py)"""
+    __tablename__ = 'busquedas_guardadas'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Notified seller
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=True)
+    nombre = db.Column(db.String(100), nullable=False)
+    fraccionamiento_id = db.Column(db.Integer, db.ForeignKey('fraccionamiento.id'), nullable=False)
+    prototipo_id = db.Column(db.Integer, db.ForeignKey('prototipos.id'), nullable=True)  # None: any
+    tipo_de_lote = db.Column(db.String(50), nullable=True)  # None: any
+    precio_min = db.Column(db.Float, nullable=True)
+    precio_max = db.Column(db.Float, nullable=True)
+    banda_min = db.Column(db.Integer, nullable=False)
+    banda_max = db.Column(db.Integer, nullable=False)
+    activa = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_busquedas_guardadas_bucket', 'fraccionamiento_id', 'prototipo_id', 'banda_min'),
+    )
+    
+    # Relationships
+    client = db.relationship('Client')
+
+class Notificacion(db.Model):
+    """Message for a user, e.g. a lot matching one of their saved searches became Libre"""
+    __tablename__ = 'notificaciones'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    busqueda_id = db.Column(db.Integer, db.ForeignKey('busquedas_guardadas.id', ondelete='CASCADE'), nullable=True)
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id', ondelete='CASCADE'), nullable=True)
+    mensaje = db.Column(db.String(255), nullable=False)
+    leida = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_notificaciones_user_leida', 'user_id', 'leida', 'created_at'),
+    )
+
+class LoteContador(db.Model):
+    """Number of lots per estado within a paquete, fraccionamiento or prototipo.
+
+    Maintained in the same transaction as every lot write (see counters.py),
+    so availability summaries are a single indexed read.
+    """
+    __tablename__ = 'lote_contadores'
+    
+    AMBITOS = ['paquete', 'fraccionamiento', 'prototipo']
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ambito = db.Column(db.String(20), nullable=False)  # paquete, fraccionamiento or prototipo
+    ambito_id = db.Column(db.Integer, nullable=False)
+    estado = db.Column(db.String(50), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('ambito', 'ambito_id', 'estado', name='uq_lote_contadores_ambito_estado'),
+    )
+
+class TablaVersion(db.Model):
+    """Write counter per table, bumped in the same transaction as every change
+    to it; read endpoints derive their ETag and Last-Modified from it."""
+    __tablename__ = 'tabla_versiones'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tabla = db.Column(db.String(64), nullable=False, unique=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+def _paquete_of(session, lote):
+    # A paquete assigned through the relationship wins; otherwise go by the
+    # id, since lote.paquete is not loaded for pending lots and is stale
+    # right after paquete_id changes
+    if inspect(lote).attrs.paquete.history.added:
+        return lote.paquete
+    if lote.paquete_id is not None:
+        return session.get(Paquete, lote.paquete_id)
+    return None
+
+def _set_fraccionamiento(lote, paquete):
+    fraccionamiento = paquete.fraccionamiento if inspect(paquete).attrs.fraccionamiento.history.added else None
+    if fraccionamiento is not None and fraccionamiento.id is None:
+        # Fraccionamiento created in this same flush; let the relationship fill the id
+        lote.fraccionamiento = fraccionamiento
+    elif fraccionamiento is not None:
+        lote.fraccionamiento_id = fraccionamiento.id
+    elif paquete.fraccionamiento_id is not None:
+        lote.fraccionamiento_id = paquete.fraccionamiento_id
+
+@event.listens_for(Session, 'before_flush')
+def _sync_lote_fraccionamiento(session, flush_context, instances):
+    """Keep Lote.fraccionamiento_id equal to its paquete's fraccionamiento"""
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Lote):
+            state = inspect(obj)
+            moved = state.attrs.paquete_id.history.has_changes() or state.attrs.paquete.history.has_changes()
+            if obj in session.new or moved:
+                paquete = _paquete_of(session, obj)
+                if paquete is not None:
+                    _set_fraccionamiento(obj, paquete)
+        elif isinstance(obj, Paquete) and obj not in session.new:
+            state = inspect(obj)
+            if state.attrs.fraccionamiento_id.history.has_changes() or state.attrs.fraccionamiento.history.has_changes():
+                for lote in obj.lotes:
+                    _set_fraccionamiento(lote, obj)
+
+@event.listens_for(Session, 'before_flush')
+def _sync_manzana_orden(session, flush_context, instances):
+    """Key the manzanas of new or renamed lots by the numbering of their paquete.
+
+    A lot bringing the first Roman numeral of two or more characters to a
+    paquete also re-keys the single-letter manzanas already in it.
+    """
+    pending = {}
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Lote):
+            continue
+        state = inspect(obj)
+        if obj in session.new or state.attrs.manzana.history.has_changes() \
+                or state.attrs.paquete_id.history.has_changes() or state.attrs.paquete.history.has_changes():
+            paquete = _paquete_of(session, obj)
+            pending.setdefault(paquete.id if paquete is not None else None, []).append(obj)
+
+    table = Lote.__table__
+    connection = session.connection()
+    for paquete_id, lotes in pending.items():
+        existing = []
+        if paquete_id is not None:
+            ids = [lote.id for lote in lotes if lote.id is not None]
+            existing = connection.execute(
+                select(table.c.manzana).distinct()
+                .where(table.c.paquete_id == paquete_id, table.c.id.notin_(ids))
+            ).scalars().all()
+        roman = uses_roman_numerals(existing + [lote.manzana for lote in lotes])
+        for lote in lotes:
+            lote.manzana_orden = manzana_sort_key(lote.manzana, roman)
+        if roman and not uses_roman_numerals(existing):
+            for manzana in existing:
+                key = manzana_sort_key(manzana, roman)
+                if key != manzana_sort_key(manzana):
+                    connection.execute(table.update()
+                                       .where(table.c.paquete_id == paquete_id, table.c.manzana == manzana)
+                                       .values(manzana_orden=key))
+
+LINDERO_ATTRIBUTES = ('calle',) + tuple(
+    f'{prefix}_{lado}' for lado in SIDES for prefix in ('orientacion', 'medidas_orientacion', 'colindancia')
+)
+
+@event.listens_for(Session, 'before_flush')
+def _sync_lote_linderos(session, flush_context, instances):
+    """Rebuild the linderos, perimetro and frente of lots whose sides changed"""
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Lote):
+            continue
+        if obj not in session.new:
+            state = inspect(obj)
+            if not any(state.attrs[key].history.has_changes() for key in LINDERO_ATTRIBUTES):
+                continue
+        linderos = linderos_de(obj)
+        # Reuse the row of each side still described; the flush inserts
+        # before it deletes, so new rows must not take a removed row's lado
+        existing = {lindero.lado: lindero for lindero in obj.linderos}
+        kept = []
+        for values in linderos:
+            lindero = existing.pop(values['lado'], None) or LoteLindero()
+            for key, value in values.items():
+                setattr(lindero, key, value)
+            kept.append(lindero)
+        obj.linderos = kept
+        obj.perimetro = perimetro(linderos)
+        obj.frente = frente(linderos)
@@ -0,0 +1,159 @@
+"""Short-lived response cache for anonymous hits on the public lot catalog.
+
+Responses are keyed by endpoint plus the normalized values of the query
+parameters the view actually reads, kept for PAGE_CACHE_TTL seconds and
+bounded to PAGE_CACHE_MAX_ENTRIES (least recently used entries go first).
+Concurrent misses on the same key are collapsed: one request builds the
+entry while the others wait for it. Any commit that writes lots, paquetes,
+fraccionamientos or prototipos purges the whole cache of this process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .models import Prototipo, PrototipoImagen, Fraccionamiento, Paquete, Lote
+
+# Headers worth replaying; Set-Cookie and Vary must never be shared between visitors
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+
+PURGING_MODELS = (Prototipo, PrototipoImagen, Fraccionamiento, Paquete, Lote)
+
+class PageCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, body, status, headers)
+        self._building = {}  # key -> threading.Event set when the build finishes
+        # Bumped by purge() so a build that overlapped a write is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_or_build(self, key, build, ttl, max_entries, wait_timeout=10):
+        """Return (body, status, headers) for key, calling build() on a miss.
+
+        build() returns (body, status, headers) and whether the result may
+        be cached.
+        """
+        while True:
+            with self._lock:
+                entry = self._lookup(key, time.monotonic())
+                if entry is not None:
+                    self.hits += 1
+                    return entry[1:]
+
+                building = self._building.get(key)
+                if building is None:
+                    self.misses += 1
+                    building = self._building[key] = threading.Event()
+                    generation = self._generation
+                    break
+
+            # Someone else is rebuilding this entry; wait and look again. If
+            # the builder failed or did not cache, fall through and build.
+            if not building.wait(wait_timeout):
+                return build()[0]
+            with self._lock:
+                entry = self._lookup(key, time.monotonic())
+                if entry is not None:
+                    self.hits += 1
+                    return entry[1:]
+            return build()[0]
+
+        try:
+            result, cacheable = build()
+            if cacheable:
+                with self._lock:
+                    if generation != self._generation:
+                        return result
+                    self._entries[key] = (time.monotonic() + ttl,) + result
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > max_entries:
+                        self._entries.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+            building.set()
+
+    def purge(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+cache = PageCache()
+
+def _normalize(value):
+    value = value.strip()
+    return str(int(value)) if value.isdigit() else value
+
+def anonymous_page_cache(*params):
+    """Cache the response of a GET view for anonymous visitors.
+
+    Only the listed query parameters are part of the key, repeated ones as
+    a sorted list; empty values are dropped so '?paquete=' and no paquete
+    share an entry.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or current_user.is_authenticated or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(
+                (name, tuple(sorted(_normalize(value) for value in request.args.getlist(name) if value.strip())))
+                for name in params
+            ))
+
+            def build():
+                response = current_app.make_response(f(*args, **kwargs))
+                headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+                return (response.get_data(), response.status_code, headers), response.status_code == 200
+
+            body, status, headers = cache.get_or_build(
+                key, build,
+                ttl=current_app.config['PAGE_CACHE_TTL'],
+                max_entries=current_app.config['PAGE_CACHE_MAX_ENTRIES']
+            )
+            response = current_app.response_class(body, status=status, headers=headers)
+            etag = response.get_etag()[0]
+            if etag and request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304, headers=[
+                    (name, value) for name, value in headers if name in ('ETag', 'Cache-Control')
+                ])
+            return response
+        return decorated_function
+    return decorator
+
+@event.listens_for(Session, 'after_flush')
+def _collect_catalog_writes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, PURGING_MODELS):
+            session.info['page_cache_purge'] = True
+            return
+
+@event.listens_for(Session, 'after_commit')
+def _purge_after_catalog_writes(session):
+    if session.info.pop('page_cache_purge', False):
+        cache.purge()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_writes(session):
+    session.info.pop('page_cache_purge', None)
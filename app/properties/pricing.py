@@ -0,0 +1,136 @@
+"""Rule-based lot prices.
+
+The price of a lot is its prototipo precio, plus the premio of its
+tipo_de_lote (pesos, or a percentage of the prototipo precio), plus
+precio_m2_excedente for every m² of terreno beyond the prototipo
+superficie_terreno. Rules live in ReglaPrecio per fraccionamiento, and a
+paquete can replace any of them.
+
+Recalculation resolves the rules of each paquete in Python (a handful of
+rows), groups the paquetes that end up with the same rules and reprices
+each group with one UPDATE whose new price is a SQL expression, so
+thousands of lots are repriced in a few statements. Each recalculation is
+recorded as one price revision (see revisions.py). Only Libre lots are
+repriced; apartados and titulados keep the price they were sold at, and
+fraccionamientos without rules keep their hand-typed prices.
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import case, select
+from app.database import db
+from .models import Prototipo, Paquete, Lote, ReglaPrecio, RevisionPrecio
+from .bulk import lots_updated
+from .revisions import REPRICED_ESTADOS, rounded, apply_price_change
+
+def parse_reglas(fraccionamiento_id, items):
+    """Validate a list of rule dicts and return them as ReglaPrecio objects"""
+    paquete_ids = {paquete_id for (paquete_id,) in
+                   db.session.query(Paquete.id).filter_by(fraccionamiento_id=fraccionamiento_id)}
+    reglas, seen = [], set()
+    for item in items:
+        concepto = item.get('concepto')
+        paquete_id = item.get('paquete_id')
+        tipo_de_lote = item.get('tipo_de_lote') or None
+        es_porcentaje = bool(item.get('es_porcentaje'))
+        if concepto not in ReglaPrecio.CONCEPTOS:
+            raise ValueError(f'Concepto no soportado: {concepto}')
+        if paquete_id is not None and paquete_id not in paquete_ids:
+            raise ValueError(f'El paquete {paquete_id} no pertenece al fraccionamiento')
+        if concepto == 'premio_tipo_de_lote' and tipo_de_lote not in Lote.TIPOS_DE_LOTE:
+            raise ValueError(f'Tipo de lote no válido: {tipo_de_lote}')
+        if concepto == 'precio_m2_excedente' and (tipo_de_lote or es_porcentaje):
+            raise ValueError('El precio por m² excedente es un monto sin tipo de lote')
+        try:
+            valor = float(item.get('valor'))
+        except (TypeError, ValueError):
+            raise ValueError(f'Valor no válido: {item.get("valor")}')
+        key = (paquete_id, concepto, tipo_de_lote)
+        if key in seen:
+            raise ValueError(f'Regla repetida: {concepto} {tipo_de_lote or ""}'.strip())
+        seen.add(key)
+        reglas.append(ReglaPrecio(fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id,
+                                  concepto=concepto, tipo_de_lote=tipo_de_lote, valor=valor,
+                                  es_porcentaje=es_porcentaje))
+    return reglas
+
+def serialize_regla(regla):
+    return {
+        'id': regla.id,
+        'paquete_id': regla.paquete_id,
+        'concepto': regla.concepto,
+        'tipo_de_lote': regla.tipo_de_lote,
+        'valor': regla.valor,
+        'es_porcentaje': regla.es_porcentaje
+    }
+
+def rules_by_paquete(fraccionamiento_id, paquete_id=None):
+    """{rules: [paquete ids]} where rules is a hashable tuple of
+    ((concepto, tipo_de_lote), (valor, es_porcentaje)) after paquete overrides"""
+    reglas = ReglaPrecio.query.filter_by(fraccionamiento_id=fraccionamiento_id).all()
+    if not reglas:
+        # Fraccionamientos without rules keep their hand-typed prices
+        return {}
+    base = {(r.concepto, r.tipo_de_lote): (r.valor, r.es_porcentaje) for r in reglas if r.paquete_id is None}
+    overrides = defaultdict(dict)
+    for r in reglas:
+        if r.paquete_id is not None:
+            overrides[r.paquete_id][(r.concepto, r.tipo_de_lote)] = (r.valor, r.es_porcentaje)
+
+    query = db.session.query(Paquete.id).filter_by(fraccionamiento_id=fraccionamiento_id)
+    if paquete_id:
+        query = query.filter(Paquete.id == paquete_id)
+    groups = defaultdict(list)
+    for (pid,) in query:
+        groups[tuple(sorted({**base, **overrides[pid]}.items(), key=repr))].append(pid)
+    return groups
+
+def price_expression(rules):
+    """SQL expression of the rule price of a lot, rounded to cents"""
+    prototipo = select(Prototipo.precio, Prototipo.superficie_terreno)\
+        .where(Prototipo.id == Lote.prototipo_id).correlate(Lote.__table__)
+    precio_base = prototipo.with_only_columns(Prototipo.precio).scalar_subquery()
+    superficie = prototipo.with_only_columns(Prototipo.superficie_terreno).scalar_subquery()
+
+    price = precio_base
+    premios = [(Lote.tipo_de_lote == tipo, precio_base * valor / 100 if es_porcentaje else valor)
+               for (concepto, tipo), (valor, es_porcentaje) in rules if concepto == 'premio_tipo_de_lote']
+    if premios:
+        price = price + case(*premios, else_=0)
+    for (concepto, _), (valor, _) in rules:
+        if concepto == 'precio_m2_excedente':
+            price = price + case((Lote.terreno > superficie, (Lote.terreno - superficie) * valor), else_=0)
+    return rounded(price)
+
+def recalculate(fraccionamiento_id, paquete_id=None, dry_run=False, user_id=None):
+    """Reprice the Libre lots of a fraccionamiento (or one of its paquetes) from its rules.
+
+    Returns the lots whose price changes, as dicts with the current and the
+    new price. Unless dry_run, the changes are applied and recorded as one
+    RevisionPrecio; the caller commits.
+    """
+    changes, writes = [], []
+    for rules, paquete_ids in rules_by_paquete(fraccionamiento_id, paquete_id).items():
+        nuevo = price_expression(rules)
+        condition = (Lote.paquete_id.in_(paquete_ids)
+                     & Lote.estado_del_inmueble.in_(REPRICED_ESTADOS)
+                     & (Lote.precio != nuevo))
+        rows = db.session.execute(
+            select(Lote.id, Lote.paquete_id, Lote.manzana, Lote.lote, Lote.precio, nuevo.label('nuevo'))
+            .where(condition)
+            .order_by(Lote.paquete_id, Lote.manzana_orden, Lote.lote_orden, Lote.id)
+        ).all()
+        changes.extend({
+            'lote_id': row.id, 'paquete_id': row.paquete_id, 'manzana': row.manzana, 'lote': row.lote,
+            'precio_actual': row.precio, 'precio_nuevo': float(row.nuevo)
+        } for row in rows)
+        if rows:
+            writes.append((condition, nuevo))
+
+    if writes and not dry_run:
+        revision = RevisionPrecio(tipo='reglas', fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id,
+                                  user_id=user_id, fecha=datetime.utcnow())
+        db.session.add(revision)
+        db.session.flush()
+        revision.total_lotes = sum(apply_price_change(revision, condition, nuevo) for condition, nuevo in writes)
+        lots_updated(db.session, {fraccionamiento_id})
+    return changes
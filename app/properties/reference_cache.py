@@ -0,0 +1,118 @@
+"""In-process cache for the small, rarely changing choice lists.
+
+Fraccionamiento, paquete and prototipo choices are read on every form
+render (including anonymous hits on the public catalog) but change only
+when an admin edits them. Lists are cached as plain (id, nombre) tuples,
+stamped with the version of the table they come from (see versions.py),
+and served only while the table is still at that version. That is how a
+change committed by another process reaches this one; the version is the
+one @versioned_response already read for the request when there is one,
+one indexed read otherwise. A commit in this process also drops the lists
+of the models it touched right away; rolled back changes leave the cache
+alone.
+"""
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .models import Prototipo, Fraccionamiento, Paquete
+from .versions import table_version
+
+class ReferenceCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        # Bumped on invalidation so a load that raced with a commit is not stored
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, loader):
+        """Cached value of key, loaded again when the table of its group has changed"""
+        # Read before loading, so the value stored is at least this recent
+        stamp = table_version(TABLES[key[0]])
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            version = self._versions.setdefault(key, 0)
+
+        value = loader()
+
+        with self._lock:
+            if self._versions.get(key) == version:
+                self._values[key] = (stamp, value)
+        return value
+
+    def invalidate(self, group):
+        """Drop every cached key of a group ('fraccionamientos', 'paquetes', 'prototipos')"""
+        with self._lock:
+            for key in list(self._versions):
+                if key[0] == group:
+                    self._values.pop(key, None)
+                    self._versions[key] += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._versions.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._values),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'invalidations': self.invalidations
+            }
+
+cache = ReferenceCache()
+
+GROUPS = {
+    Fraccionamiento: 'fraccionamientos',
+    Paquete: 'paquetes',
+    Prototipo: 'prototipos',
+}
+# Table whose version stamps the lists of each group
+TABLES = {group: model.__tablename__ for model, group in GROUPS.items()}
+
+def fraccionamiento_choices():
+    """(id, nombre) of every fraccionamiento, ordered by nombre"""
+    return cache.get(('fraccionamientos',), lambda: [
+        (f.id, f.nombre) for f in Fraccionamiento.query.order_by(Fraccionamiento.nombre)
+    ])
+
+def paquete_choices(fraccionamiento_id):
+    """(id, nombre) of the paquetes of a fraccionamiento, ordered by nombre"""
+    return cache.get(('paquetes', fraccionamiento_id), lambda: [
+        (p.id, p.nombre) for p in Paquete.query.filter_by(fraccionamiento_id=fraccionamiento_id)
+                                               .order_by(Paquete.nombre)
+    ])
+
+def prototipo_choices():
+    """(id, nombre_prototipo) of every prototipo, ordered by nombre_prototipo"""
+    return cache.get(('prototipos',), lambda: [
+        (p.id, p.nombre_prototipo) for p in Prototipo.query.order_by(Prototipo.nombre_prototipo)
+    ])
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_groups(session, flush_context):
+    changed = session.info.setdefault('reference_cache_groups', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        group = GROUPS.get(type(obj))
+        if group:
+            changed.add(group)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_groups(session):
+    for group in session.info.pop('reference_cache_groups', ()):
+        cache.invalidate(group)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_groups(session):
+    session.info.pop('reference_cache_groups', None)
@@ -0,0 +1,178 @@
+"""Atomic reservation of lots.
+
+Checking estado_del_inmueble in Python and committing later lets two
+sellers reserve the same lot when both read it as Libre before either
+commits. A reservation is instead one conditional UPDATE that only matches
+while the lot is still Libre:
+
+    UPDATE lotes SET estado_del_inmueble = 'Apartado' WHERE id = :id AND estado_del_inmueble = 'Libre'
+
+The database serializes concurrent writes to the row, so exactly one of
+them updates it and the others see rowcount 0 and get LotNotAvailable
+(409 in the API). The unique index on lote_asignaciones.lote_id backs this
+up for any other path creating assignments. The availability counters and
+table versions, which every reservation shares, are written last, just
+before the commit (see counters.py and versions.py), so reservations of
+different lots wait for each other as little as possible.
+
+reserve_many and release_many do the same for a list of lots with one
+statement per table, all or nothing: the assignments and history rows are
+inserted in bulk and nothing is written unless every lot can change.
+"""
+from datetime import datetime
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.database import db
+from .models import Lote, LoteAsignacion, LoteAsignacionHistorial
+from .bulk import estados_changed
+from .versions import defer_versions
+from .saved_searches import notify_freed_lots, describe
+
+RESERVABLE_ESTADO = 'Libre'
+RESERVED_ESTADO = 'Apartado'
+FREED_ESTADO = 'Libre'
+MAX_BATCH_LOTS = 500
+
+class LotNotAvailable(ValueError):
+    """The lot was not Libre anymore when reserving it"""
+
+def reserve(lote, client, user, notas=None, vence_en=None):
+    """Assign a Libre lot to a client, or raise LotNotAvailable.
+
+    Returns the new LoteAsignacion. The caller commits, or rolls back on
+    error.
+    """
+    now = datetime.utcnow()
+    table = Lote.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == lote.id, table.c.estado_del_inmueble == RESERVABLE_ESTADO)
+        .values(estado_del_inmueble=RESERVED_ESTADO, updated_at=now)
+    )
+    if result.rowcount != 1:
+        raise LotNotAvailable('Este lote ya no está disponible')
+
+    # The row is ours until commit, so these are the values just reserved
+    row = db.session.execute(
+        select(table.c.id, table.c.paquete_id, table.c.fraccionamiento_id, table.c.prototipo_id)
+        .where(table.c.id == lote.id)
+    ).one()
+    estados_changed(db.session, [tuple(row) + (RESERVABLE_ESTADO,)], RESERVED_ESTADO)
+    # The loaded lot still says Libre
+    db.session.expire(lote, ['estado_del_inmueble', 'updated_at', 'asignacion'])
+
+    asignacion = LoteAsignacion(lote_id=lote.id, client=client, user=user, estado=RESERVED_ESTADO,
+                                fecha_asignacion=now, notas=notas, vence_en=vence_en)
+    db.session.add(asignacion)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        raise LotNotAvailable('Este lote ya está asignado')
+    return asignacion
+
+def _lot_rows(lote_ids):
+    """{lote_id: (lote_id, paquete_id, fraccionamiento_id, prototipo_id, estado)} of the given lots"""
+    if not lote_ids:
+        raise ValueError('Se requiere al menos un lote')
+    if len(lote_ids) > MAX_BATCH_LOTS:
+        raise ValueError(f'Se pueden procesar hasta {MAX_BATCH_LOTS} lotes a la vez')
+    table = Lote.__table__
+    rows = db.session.execute(
+        select(table.c.id, table.c.paquete_id, table.c.fraccionamiento_id, table.c.prototipo_id,
+               table.c.estado_del_inmueble).where(table.c.id.in_(lote_ids))
+    )
+    found = {row[0]: tuple(row) for row in rows}
+    missing = sorted(set(lote_ids) - set(found))
+    if missing:
+        raise ValueError(f'Lotes no encontrados: {", ".join(map(str, missing))}')
+    return found
+
+def reserve_many(lote_ids, client, user, notas=None, vence_en=None):
+    """Assign several Libre lots to one client, all or none.
+
+    Raises LotNotAvailable when any of them is not Libre. Returns the
+    number of lots reserved. The caller commits, or rolls back on error.
+    """
+    lote_ids = sorted(set(lote_ids))
+    rows = _lot_rows(lote_ids)
+    taken = [lote_id for lote_id, row in rows.items() if row[4] != RESERVABLE_ESTADO]
+    if taken:
+        raise LotNotAvailable(f'Lotes no disponibles: {", ".join(map(str, sorted(taken)))}')
+
+    now = datetime.utcnow()
+    table = Lote.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(lote_ids), table.c.estado_del_inmueble == RESERVABLE_ESTADO)
+        .values(estado_del_inmueble=RESERVED_ESTADO, updated_at=now)
+    )
+    if result.rowcount != len(lote_ids):
+        raise LotNotAvailable('Algunos lotes dejaron de estar disponibles')
+    try:
+        db.session.execute(insert(LoteAsignacion.__table__), [
+            {'lote_id': lote_id, 'client_id': client.id, 'user_id': user.id, 'fecha_asignacion': now,
+             'estado': RESERVED_ESTADO, 'notas': notas, 'vence_en': vence_en}
+            for lote_id in lote_ids
+        ])
+    except IntegrityError:
+        raise LotNotAvailable('Algunos lotes ya están asignados')
+    if vence_en is not None:
+        # Picked up by the after_commit listener of holds
+        db.session.info.setdefault('apartado_holds', set()).add(vence_en)
+
+    estados_changed(db.session, rows.values(), RESERVED_ESTADO)
+    defer_versions(db.session, [LoteAsignacion.__tablename__])
+    return len(lote_ids)
+
+def current_assignments(lote_ids):
+    """Current LoteAsignacion of each of the given lots, with their clients"""
+    return LoteAsignacion.query.filter(LoteAsignacion.lote_id.in_(lote_ids))\
+        .options(db.joinedload(LoteAsignacion.client)).all()
+
+def release_many(lote_ids, user, motivo, notas=None, now=None, client_ids=None):
+    """Release several assigned lots back to Libre, all or none, keeping their history.
+
+    The history rows are recorded under user, or under the user who made
+    each assignment when None (expired holds). When client_ids is given,
+    only assignments to those clients are released: a lot assigned to
+    another client since the caller checked its permissions fails the
+    whole batch. Raises
+    ValueError when any of them is not assigned. Returns the number of lots
+    released. The caller checks permissions and commits.
+    """
+    lote_ids = sorted(set(lote_ids))
+    rows = _lot_rows(lote_ids)
+    now = now or datetime.utcnow()
+    assignments = LoteAsignacion.__table__
+    history = LoteAsignacionHistorial.__table__
+    condition = assignments.c.lote_id.in_(lote_ids)
+    if client_ids is not None:
+        condition &= assignments.c.client_id.in_(client_ids)
+    assigned = set(db.session.execute(select(assignments.c.lote_id).where(condition)).scalars())
+    if len(assigned) != len(lote_ids):
+        raise ValueError(f'Lotes no asignados: {", ".join(str(i) for i in lote_ids if i not in assigned)}')
+
+    db.session.execute(insert(history).from_select(
+        ['lote_id', 'client_id', 'user_id', 'fecha_inicio', 'fecha_fin', 'estado', 'motivo_cambio', 'notas'],
+        select(assignments.c.lote_id, assignments.c.client_id,
+               db.literal(user.id) if user is not None else assignments.c.user_id, assignments.c.fecha_asignacion,
+               db.literal(now), assignments.c.estado, db.literal(motivo), db.literal(notas)).where(condition)
+    ))
+    # Counting the deletes also catches lots released by someone else meanwhile
+    result = db.session.execute(delete(assignments).where(condition))
+    if result.rowcount != len(lote_ids):
+        raise ValueError('Algunos lotes no están asignados')
+
+    table = Lote.__table__
+    db.session.execute(
+        update(table).where(table.c.id.in_(lote_ids)).values(estado_del_inmueble=FREED_ESTADO, updated_at=now)
+    )
+    estados_changed(db.session, rows.values(), FREED_ESTADO)
+    defer_versions(db.session, [assignments.name, history.name])
+
+    freed = db.session.execute(
+        select(table.c.id, table.c.fraccionamiento_id, table.c.prototipo_id, table.c.tipo_de_lote, table.c.precio,
+               table.c.manzana, table.c.lote).where(table.c.id.in_(lote_ids))
+    )
+    notify_freed_lots(db.session.connection(), [row[:5] + (describe(row[5], row[6]),) for row in freed])
+    return len(lote_ids)
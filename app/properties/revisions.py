@@ -0,0 +1,121 @@
+"""Mass price revisions and the price history of the lots.
+
+A revision raises or lowers the price of every Libre lot of a paquete,
+prototipo and/or fraccionamiento by a percentage or a fixed amount. It is
+one RevisionPrecio row, one INSERT ... SELECT that copies the old and new
+price of every affected lot into lote_precio_historial, and one UPDATE of
+the lots, whatever their number. Rule recalculations (pricing.py) are
+recorded the same way, and prices edited one lot at a time through the ORM
+get a history row of their own on flush, so the price of any lot at any
+date can be read back with two indexed lookups (price_as_of).
+"""
+from datetime import datetime
+from sqlalchemy import Numeric, cast, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+from app.database import db
+from .models import Lote, RevisionPrecio, LotePrecioHistorial
+from .bulk import lots_updated
+
+REPRICED_ESTADOS = ('Libre',)
+
+def rounded(expression):
+    """A price expression rounded to cents"""
+    return func.round(cast(expression, Numeric(14, 4)), 2)
+
+def apply_price_change(revision, condition, nuevo):
+    """Write the history rows of a revision and set the new price of the matching lots.
+
+    condition and nuevo are SQL expressions over Lote; returns the number
+    of lots changed. The caller commits.
+    """
+    history = LotePrecioHistorial.__table__
+    db.session.execute(insert(history).from_select(
+        ['lote_id', 'revision_id', 'fecha', 'precio_anterior', 'precio_nuevo'],
+        select(Lote.id, db.literal(revision.id), db.literal(revision.fecha), Lote.precio, nuevo).where(condition)
+    ))
+    result = db.session.execute(
+        update(Lote.__table__).where(condition).values(precio=nuevo, updated_at=revision.fecha)
+    )
+    return result.rowcount
+
+def revise(tipo, valor, fraccionamiento_id=None, paquete_id=None, prototipo_id=None, user_id=None, dry_run=False):
+    """Raise (or lower) the price of the Libre lots in scope by a percentage or an amount.
+
+    Returns a summary with the number of lots and their total value before
+    and after. Raises ValueError for an empty scope, an unknown tipo or a
+    change that would leave a negative price. The caller commits.
+    """
+    if tipo not in ('porcentaje', 'monto'):
+        raise ValueError(f'Tipo de revisión no soportado: {tipo}')
+    if not any([fraccionamiento_id, paquete_id, prototipo_id]):
+        raise ValueError('Se requiere un fraccionamiento, paquete o prototipo')
+    valor = float(valor)
+
+    condition = Lote.estado_del_inmueble.in_(REPRICED_ESTADOS)
+    if fraccionamiento_id:
+        condition &= Lote.fraccionamiento_id == fraccionamiento_id
+    if paquete_id:
+        condition &= Lote.paquete_id == paquete_id
+    if prototipo_id:
+        condition &= Lote.prototipo_id == prototipo_id
+    nuevo = rounded(Lote.precio * (1 + valor / 100) if tipo == 'porcentaje' else Lote.precio + valor)
+
+    total, actual, nuevo_total, negativos = db.session.execute(
+        select(func.count(Lote.id), func.sum(Lote.precio), func.sum(nuevo),
+               func.count(Lote.id).filter(nuevo < 0)).where(condition)
+    ).one()
+    if negativos:
+        raise ValueError(f'La revisión dejaría {negativos} lotes con precio negativo')
+    summary = {
+        'total': total,
+        'valor_actual': float(actual or 0),
+        'valor_nuevo': float(nuevo_total or 0),
+        'revision_id': None
+    }
+    if dry_run or not total:
+        return summary
+
+    fraccionamiento_ids = {fid for (fid,) in
+                           db.session.execute(select(Lote.fraccionamiento_id).where(condition).distinct())}
+    revision = RevisionPrecio(tipo=tipo, valor=valor, fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id,
+                              prototipo_id=prototipo_id, user_id=user_id, fecha=datetime.utcnow())
+    db.session.add(revision)
+    db.session.flush()
+    revision.total_lotes = apply_price_change(revision, condition, nuevo)
+    lots_updated(db.session, fraccionamiento_ids)
+    summary['revision_id'] = revision.id
+    return summary
+
+def price_as_of(lote, when):
+    """Price a lot had at a given datetime"""
+    last = db.session.query(LotePrecioHistorial.precio_nuevo)\
+        .filter(LotePrecioHistorial.lote_id == lote.id, LotePrecioHistorial.fecha <= when)\
+        .order_by(LotePrecioHistorial.fecha.desc(), LotePrecioHistorial.id.desc()).first()
+    if last:
+        return last[0]
+    # Before its first change the lot had the price that change replaced
+    following = db.session.query(LotePrecioHistorial.precio_anterior)\
+        .filter(LotePrecioHistorial.lote_id == lote.id, LotePrecioHistorial.fecha > when)\
+        .order_by(LotePrecioHistorial.fecha, LotePrecioHistorial.id).first()
+    return following[0] if following else lote.precio
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    # No-op; registered with active_history so the old price is known even
+    # when the lot was expired by a previous commit
+    return value
+
+event.listen(Lote.precio, 'set', _load_previous_value, active_history=True, retval=True)
+
+@event.listens_for(Session, 'after_flush')
+def _record_price_edits(session, flush_context):
+    rows = []
+    now = datetime.utcnow()
+    for obj in session.dirty:
+        if not isinstance(obj, Lote):
+            continue
+        history = inspect(obj).attrs.precio.history
+        if history.deleted and history.added and history.deleted[0] != history.added[0]:
+            rows.append({'lote_id': obj.id, 'revision_id': None, 'fecha': now,
+                         'precio_anterior': history.deleted[0], 'precio_nuevo': history.added[0]})
+    if rows:
+        session.connection().execute(LotePrecioHistorial.__table__.insert(), rows)
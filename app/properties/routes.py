@@ -1,12 +1,36 @@
 import os
-from flask import render_template, redirect, url_for, flash, request, current_app, jsonify
+from datetime import datetime, timedelta
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, Response, stream_with_context, send_file, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from . import bp
 from .forms import PrototipoForm, FraccionamientoForm, PaqueteForm, LoteForm, LoteBulkUploadForm, LoteFilterForm
-from .models import Prototipo, PrototipoImagen, Fraccionamiento, Paquete, Lote
+from .models import (Prototipo, PrototipoImagen, Fraccionamiento, Paquete, Lote, LoteAsignacionHistorial, ReglaPrecio,
+                     LotePrecioHistorial, BusquedaGuardada, Notificacion)
+from .loading import with_profile
+from .counters import get_counts
+from .versions import versioned_response, table_version
+from .page_cache import anonymous_page_cache
+from .reference_cache import cache as reference_cache, paquete_choices
+from .catalog import catalog_query, catalog_page, serialize_catalog_row, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .search import parse_filters, apply_filters, facet_counts
+from .export import generate_csv
+from .lot_index import get_index as get_lot_index
+from .adjacency import contiguous_groups, MAX_CONTIGUOUS_LOTS, DEFAULT_CONTIGUOUS_GROUPS, MAX_CONTIGUOUS_GROUPS
+from .sembrado import overlay_path, parse_poligono, image_size
+from .tiles import build_tiles_in_background, remove_tiles
+from .pricing import parse_reglas, serialize_regla, recalculate as recalculate_prices
+from .revisions import revise as revise_prices, price_as_of
+from .analytics import price_distribution, simulate as simulate_prices, DEFAULT_PERCENTILES, DEFAULT_BINS
+from .inventory_history import inventory_as_of, summarize as summarize_inventory
+from .saved_searches import serialize_busqueda, set_bands as set_search_bands
+from .reservations import (reserve as reserve_lot, reserve_many as reserve_lots, release_many as release_lots,
+                           current_assignments, LotNotAvailable)
+from .holds import hold_deadline
 from app.database import db
 from app.auth.decorators import admin_required
+from app.auth.models import UserRole
+from app.clients.models import Client
 import csv
 import io
 
@@ -63,8 +87,9 @@ def handle_image_upload(file, prototipo_id):
 
 @bp.route('/prototipos')
 @login_required
+@versioned_response('prototipos', 'prototipo_imagenes')
 def prototipos_index():
-    prototipos = Prototipo.query.order_by(Prototipo.nombre_prototipo).all()
+    prototipos = with_profile(Prototipo.query, 'prototipo_card').order_by(Prototipo.nombre_prototipo).all()
     return render_template('properties/prototipos/index.html', prototipos=prototipos)
 
 @bp.route('/prototipos/nuevo', methods=['GET', 'POST'])
@@ -199,7 +224,7 @@ def prototipo_editar(id):
 @admin_required
 def prototipo_eliminar(id):
     print("Handling prototipo_eliminar request")
-    prototipo = Prototipo.query.get_or_404(id)
+    prototipo = with_profile(Prototipo.query, 'prototipo_card').get_or_404(id)
     
     # Delete associated images from filesystem
     for imagen in prototipo.imagenes:
@@ -245,9 +270,12 @@ def prototipo_imagen_eliminar(id):
 # Fraccionamiento routes
 @bp.route('/fraccionamientos')
 @login_required
+@versioned_response('fraccionamiento', 'paquetes', 'lotes')
 def fraccionamientos_index():
     fraccionamientos = Fraccionamiento.query.all()
-    return render_template('properties/fraccionamientos/index.html', fraccionamientos=fraccionamientos)
+    return render_template('properties/fraccionamientos/index.html', 
+                         fraccionamientos=fraccionamientos,
+                         disponibilidad=get_counts('fraccionamiento'))
 
 @bp.route('/fraccionamientos/new', methods=['GET', 'POST'])
 @login_required
@@ -272,9 +300,15 @@ def fraccionamiento_new():
             os.makedirs(os.path.dirname(os.path.join(current_app.static_folder, sembrado_path)), exist_ok=True)
             form.sembrado.data.save(os.path.join(current_app.static_folder, sembrado_path))
             fraccionamiento.sembrado = sembrado_path
+            fraccionamiento.sembrado_ancho, fraccionamiento.sembrado_alto = \
+                image_size(os.path.join(current_app.static_folder, sembrado_path)) or (None, None)
+            # The old pyramid no longer matches; a new one is built after the commit
+            fraccionamiento.sembrado_tiles = None
 
         db.session.add(fraccionamiento)
         db.session.commit()
+        if form.sembrado.data:
+            build_tiles_in_background(fraccionamiento.id)
         flash('Fraccionamiento creado exitosamente.', 'success')
         return redirect(url_for('properties.fraccionamientos_index'))
     return render_template('properties/fraccionamientos/form.html', form=form)
@@ -301,8 +335,14 @@ def fraccionamiento_edit(id):
             os.makedirs(os.path.dirname(os.path.join(current_app.static_folder, sembrado_path)), exist_ok=True)
             form.sembrado.data.save(os.path.join(current_app.static_folder, sembrado_path))
             fraccionamiento.sembrado = sembrado_path
+            fraccionamiento.sembrado_ancho, fraccionamiento.sembrado_alto = \
+                image_size(os.path.join(current_app.static_folder, sembrado_path)) or (None, None)
+            # The old pyramid no longer matches; a new one is built after the commit
+            fraccionamiento.sembrado_tiles = None
 
         db.session.commit()
+        if form.sembrado.data:
+            build_tiles_in_background(fraccionamiento.id)
         flash('Fraccionamiento actualizado exitosamente.', 'success')
         return redirect(url_for('properties.fraccionamientos_index'))
         
@@ -326,6 +366,7 @@ def fraccionamiento_delete(id):
         os.remove(os.path.join(current_app.static_folder, fraccionamiento.logo))
     if fraccionamiento.sembrado and os.path.exists(os.path.join(current_app.static_folder, fraccionamiento.sembrado)):
         os.remove(os.path.join(current_app.static_folder, fraccionamiento.sembrado))
+    remove_tiles(fraccionamiento.id)
     
     db.session.delete(fraccionamiento)
     db.session.commit()
@@ -333,13 +374,159 @@ def fraccionamiento_delete(id):
     return redirect(url_for('properties.fraccionamientos_index'))
 
 # Paquete routes
+@bp.route('/fraccionamientos/<int:id>/sembrado/disponibilidad.svg')
+def fraccionamiento_sembrado_overlay(id):
+    """Availability overlay of the sembrado, served from its cached file"""
+    path = overlay_path(id)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='image/svg+xml', conditional=True, max_age=0)
+
+@bp.route('/api/fraccionamientos/<int:id>/sembrado/poligonos', methods=['POST'])
+@login_required
+@admin_required
+def fraccionamiento_sembrado_poligonos(id):
+    """Set the sembrado polygons of many lots, by lote_id or by paquete/manzana/lote"""
+    fraccionamiento = Fraccionamiento.query.get_or_404(id)
+    data = request.get_json() or {}
+    poligonos = data.get('poligonos')
+    if not isinstance(poligonos, list):
+        return jsonify({'error': 'Se requiere la lista de poligonos'}), 400
+    
+    lotes = Lote.query.filter_by(fraccionamiento_id=fraccionamiento.id).all()
+    by_id = {lote.id: lote for lote in lotes}
+    by_ubicacion = {(lote.paquete_id, lote.manzana, lote.lote): lote for lote in lotes}
+    try:
+        for item in poligonos:
+            if 'lote_id' in item:
+                lote = by_id.get(item['lote_id'])
+            else:
+                lote = by_ubicacion.get((item.get('paquete_id'), item.get('manzana'), item.get('lote')))
+            if lote is None:
+                raise ValueError(f'Lote no encontrado en el fraccionamiento: {item}')
+            lote.sembrado_poligono = parse_poligono(item.get('puntos')) if item.get('puntos') else None
+    except (ValueError, TypeError, AttributeError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.commit()
+    return jsonify({'message': 'Polígonos actualizados', 'lotes': len(poligonos)})
+
+@bp.route('/api/fraccionamientos/<int:id>/reglas-precio', methods=['GET', 'PUT'])
+@login_required
+@admin_required
+def fraccionamiento_reglas_precio(id):
+    """List the pricing rules of a fraccionamiento, or replace them all (PUT)"""
+    fraccionamiento = Fraccionamiento.query.get_or_404(id)
+    if request.method == 'PUT':
+        data = request.get_json() or {}
+        try:
+            reglas = parse_reglas(fraccionamiento.id, data.get('reglas') or [])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        ReglaPrecio.query.filter_by(fraccionamiento_id=fraccionamiento.id).delete()
+        db.session.add_all(reglas)
+        db.session.commit()
+    
+    reglas = ReglaPrecio.query.filter_by(fraccionamiento_id=fraccionamiento.id)\
+        .order_by(ReglaPrecio.paquete_id, ReglaPrecio.concepto, ReglaPrecio.tipo_de_lote).all()
+    return jsonify({'reglas': [serialize_regla(regla) for regla in reglas]})
+
+@bp.route('/api/fraccionamientos/<int:id>/recalcular-precios', methods=['POST'])
+@login_required
+@admin_required
+def fraccionamiento_recalcular_precios(id):
+    """Reprice the free lots from the pricing rules; dry_run only returns the diff"""
+    fraccionamiento = Fraccionamiento.query.get_or_404(id)
+    data = request.get_json() or {}
+    paquete_id = data.get('paquete_id')
+    if paquete_id and not Paquete.query.filter_by(id=paquete_id, fraccionamiento_id=fraccionamiento.id).first():
+        return jsonify({'error': 'El paquete no pertenece al fraccionamiento'}), 400
+    
+    dry_run = bool(data.get('dry_run'))
+    try:
+        cambios = recalculate_prices(fraccionamiento.id, paquete_id=paquete_id, dry_run=dry_run,
+                                     user_id=current_user.id)
+        if not dry_run:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Error al recalcular precios')
+        return jsonify({'error': 'Error al recalcular los precios'}), 500
+    
+    return jsonify({'dry_run': dry_run, 'total': len(cambios), 'cambios': cambios})
+
+@bp.route('/api/precios/revision', methods=['POST'])
+@login_required
+@admin_required
+def price_revision():
+    """Raise or lower the prices of a paquete, prototipo or fraccionamiento in one UPDATE"""
+    data = request.get_json() or {}
+    dry_run = bool(data.get('dry_run'))
+    try:
+        summary = revise_prices(
+            data.get('tipo'),
+            data.get('valor'),
+            fraccionamiento_id=data.get('fraccionamiento_id'),
+            paquete_id=data.get('paquete_id'),
+            prototipo_id=data.get('prototipo_id'),
+            user_id=current_user.id,
+            dry_run=dry_run
+        )
+        if not dry_run:
+            db.session.commit()
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(dict(summary, dry_run=dry_run))
+
+@bp.route('/api/analytics/precios')
+@login_required
+@admin_required
+def price_analytics():
+    """Price per m² histogram and percentiles, grouped by prototipo or tipo_de_lote"""
+    try:
+        percentiles = [int(p) for p in request.args.get('percentiles', '').split(',') if p.strip()]
+        if any(p < 0 or p > 100 for p in percentiles):
+            raise ValueError('Los percentiles van de 0 a 100')
+        return jsonify(price_distribution(
+            fraccionamiento_id=request.args.get('fraccionamiento', type=int),
+            estado=request.args.get('estado') or None,
+            group=request.args.get('agrupar', 'prototipo'),
+            percentiles=percentiles or DEFAULT_PERCENTILES,
+            bins=request.args.get('bins', DEFAULT_BINS, type=int)
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/api/analytics/simulacion', methods=['POST'])
+@login_required
+@admin_required
+def price_simulation():
+    """Projected inventory value if the given price adjustments were applied"""
+    data = request.get_json() or {}
+    ajustes = data.get('ajustes')
+    if not isinstance(ajustes, list) or not ajustes:
+        return jsonify({'error': 'Se requiere la lista de ajustes'}), 400
+    try:
+        return jsonify(simulate_prices(
+            ajustes,
+            fraccionamiento_id=data.get('fraccionamiento_id'),
+            estado=data.get('estado', 'Libre')
+        ))
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': str(e)}), 400
+
 @bp.route('/fraccionamientos/<int:fraccionamiento_id>/paquetes')
 @login_required
 def paquetes_index(fraccionamiento_id):
-    fraccionamiento = Fraccionamiento.query.get_or_404(fraccionamiento_id)
+    fraccionamiento = with_profile(Fraccionamiento.query, 'fraccionamiento_page').get_or_404(fraccionamiento_id)
+    paquetes = fraccionamiento.paquetes
     return render_template('properties/paquetes/index.html', 
                          fraccionamiento=fraccionamiento,
-                         paquetes=fraccionamiento.paquetes)
+                         paquetes=paquetes,
+                         disponibilidad=get_counts('paquete', [p.id for p in paquetes]))
 
 @bp.route('/fraccionamientos/<int:fraccionamiento_id>/paquetes/new', methods=['GET', 'POST'])
 @login_required
@@ -365,15 +552,15 @@ def paquete_new(fraccionamiento_id):
 @bp.route('/paquetes/<int:paquete_id>/lotes')
 @login_required
 def lotes_index(paquete_id):
-    paquete = Paquete.query.get_or_404(paquete_id)
+    paquete = with_profile(Paquete.query, 'paquete_page').get_or_404(paquete_id)
+    # Rows are streamed page by page from lotes_catalog
     return render_template('properties/lotes/index.html', 
-                         paquete=paquete,
-                         lotes=paquete.lotes)
+                         paquete=paquete)
 
 @bp.route('/paquetes/<int:paquete_id>/lotes/new', methods=['GET', 'POST'])
 @login_required
 def lote_new(paquete_id):
-    paquete = Paquete.query.get_or_404(paquete_id)
+    paquete = with_profile(Paquete.query, 'paquete_page').get_or_404(paquete_id)
     form = LoteForm()
     
     if form.validate_on_submit():
@@ -395,7 +582,8 @@ def lote_new(paquete_id):
             terreno=terreno,
             tipo_de_lote=form.tipo_de_lote.data,
             estado_del_inmueble=form.estado_del_inmueble.data,
-            precio=form.precio.data
+            precio=form.precio.data,
+            sembrado_poligono=form.sembrado_poligono.data or None
         )
         
         # Handle optional orientation fields
@@ -422,7 +610,7 @@ def lote_new(paquete_id):
 @bp.route('/lotes/<int:lote_id>/edit', methods=['GET', 'POST'])
 @login_required
 def lote_edit(lote_id):
-    lote = Lote.query.get_or_404(lote_id)
+    lote = with_profile(Lote.query, 'admin_grid').get_or_404(lote_id)
     form = LoteForm()
     
     # Get prototipos for the select field through the correct relationship chain
@@ -442,6 +630,7 @@ def lote_edit(lote_id):
         form.tipo_de_lote.data = lote.tipo_de_lote
         form.estado_del_inmueble.data = lote.estado_del_inmueble
         form.precio.data = lote.precio
+        form.sembrado_poligono.data = lote.sembrado_poligono
         
         # Load orientation data
         for i in range(1, 5):
@@ -461,6 +650,7 @@ def lote_edit(lote_id):
         lote.tipo_de_lote = form.tipo_de_lote.data
         lote.estado_del_inmueble = form.estado_del_inmueble.data
         lote.precio = form.precio.data
+        lote.sembrado_poligono = form.sembrado_poligono.data or None
         
         # Update orientation data
         for i in range(1, 5):
@@ -485,7 +675,7 @@ def lote_edit(lote_id):
 @login_required
 @admin_required
 def lotes_bulk_upload(paquete_id):
-    paquete = Paquete.query.get_or_404(paquete_id)
+    paquete = with_profile(Paquete.query, 'paquete_page').get_or_404(paquete_id)
     form = LoteBulkUploadForm()
     
     if form.validate_on_submit():
@@ -564,42 +754,162 @@ def lotes_bulk_upload(paquete_id):
                          paquete=paquete)
 
 @bp.route('/lotes/public', methods=['GET'])
+@anonymous_page_cache('fraccionamiento', 'paquete', 'estado', 'fraccionamiento_id')
+@versioned_response('fraccionamiento', 'paquetes')
 def lotes_public():
     form = LoteFilterForm(request.args, meta={'csrf': False})
-    lotes = []
     
     # If fraccionamiento_id is provided in AJAX request, return paquetes list
     if request.args.get('fraccionamiento_id'):
         fraccionamiento_id = int(request.args.get('fraccionamiento_id'))
-        paquetes = Paquete.query.filter_by(fraccionamiento_id=fraccionamiento_id).order_by('nombre').all()
-        return jsonify([(p.id, p.nombre) for p in paquetes])
+        return jsonify(paquete_choices(fraccionamiento_id))
     
-    # Only build query if fraccionamiento is selected
+    # Update paquetes choices based on selected fraccionamiento; the lots
+    # themselves are streamed page by page from lotes_catalog
     if form.fraccionamiento.data:
-        # Update paquetes choices based on selected fraccionamiento
-        paquetes = Paquete.query.filter_by(fraccionamiento_id=form.fraccionamiento.data).order_by('nombre').all()
-        form.paquete.choices = [(0, 'Todos los paquetes')] + [(p.id, p.nombre) for p in paquetes]
-        
-        # Build query based on filters
-        query = Lote.query
-        paquete_ids = [p.id for p in paquetes]
-        query = query.filter(Lote.paquete_id.in_(paquete_ids))
-        
-        if form.paquete.data and form.paquete.data != 0:  # 0 means "All packages"
-            query = query.filter_by(paquete_id=form.paquete.data)
-        
-        if form.estado.data:
-            query = query.filter_by(estado_del_inmueble=form.estado.data)
-        
-        # Get lotes with their relationships
-        lotes = query.join(Paquete).join(Fraccionamiento).join(Prototipo).order_by(
-            Fraccionamiento.nombre,
-            Paquete.nombre,
-            Lote.manzana,
-            Lote.lote
-        ).all()
+        form.paquete.choices = [(0, 'Todos los paquetes')] + paquete_choices(form.fraccionamiento.data)
+    
+    return render_template('properties/lotes/public.html', form=form)
+
+@bp.route('/api/lotes/catalog')
+@anonymous_page_cache('fraccionamiento', 'paquete', 'estado', 'sort', 'order', 'after', 'limit')
+@versioned_response('lotes', 'paquetes', 'fraccionamiento', 'prototipos')
+def lotes_catalog():
+    """Keyset-paginated lot catalog with server-side sort and filter"""
+    fraccionamiento_id = request.args.get('fraccionamiento', type=int)
+    paquete_id = request.args.get('paquete', type=int)
+    if not fraccionamiento_id and not paquete_id:
+        return jsonify({'error': 'Se requiere un fraccionamiento o un paquete'}), 400
     
-    return render_template('properties/lotes/public.html', form=form, lotes=lotes)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    
+    estado = request.args.get('estado') or None
+    sort = request.args.get('sort', 'ubicacion')
+    descending = request.args.get('order') == 'desc'
+    after = request.args.get('after') or None
+    
+    # The rows are at least as recent as this; the page replays the live events after it
+    version = table_version('lotes')
+    # Anonymous visitors only see public fields, which the shared lot index holds
+    include_private = current_user.is_authenticated
+    index = None if include_private else get_lot_index()
+    try:
+        if index is not None:
+            rows, next_cursor = index.page(
+                fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id, estado=estado,
+                sort=sort, descending=descending, after=after, limit=limit
+            )
+        else:
+            query = catalog_query(fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id, estado=estado)
+            lotes, next_cursor = catalog_page(query, sort=sort, descending=descending, after=after, limit=limit)
+            rows = [serialize_catalog_row(lote, include_private) for lote in lotes]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'lotes': rows,
+        'next_cursor': next_cursor,
+        'version': version
+    })
+
+@bp.route('/api/lotes/search')
+@anonymous_page_cache('fraccionamiento', 'paquete', 'estado', 'tipo_de_lote', 'prototipo', 'recamaras',
+                      'precio_min', 'precio_max', 'terreno_min', 'terreno_max', 'frente_min', 'frente_max',
+                      'sort', 'order', 'after', 'limit')
+@versioned_response('lotes', 'paquetes', 'fraccionamiento', 'prototipos')
+def lotes_search():
+    """Faceted lot search: one page of matching lots plus the counts of every facet"""
+    fraccionamiento_id = request.args.get('fraccionamiento', type=int)
+    paquete_id = request.args.get('paquete', type=int)
+    if not fraccionamiento_id and not paquete_id:
+        return jsonify({'error': 'Se requiere un fraccionamiento o un paquete'}), 400
+    
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    
+    try:
+        filters = parse_filters(request.args)
+        query = apply_filters(catalog_query(fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id), filters)
+        lotes, next_cursor = catalog_page(
+            query,
+            sort=request.args.get('sort', 'ubicacion'),
+            descending=request.args.get('order') == 'desc',
+            after=request.args.get('after') or None,
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Counts only change with the filters, not with the page being fetched
+    total, facets = facet_counts(filters, fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id)
+    include_private = current_user.is_authenticated
+    return jsonify({
+        'lotes': [serialize_catalog_row(lote, include_private) for lote in lotes],
+        'next_cursor': next_cursor,
+        'total': total,
+        'facets': facets
+    })
+
+@bp.route('/api/lotes/contiguos')
+@anonymous_page_cache('fraccionamiento', 'paquete', 'k', 'limite')
+@versioned_response('lotes', 'paquetes', 'fraccionamiento', 'prototipos')
+def lotes_contiguos():
+    """Groups of k neighbouring free lots, one per block of adjacent free lots, limite at most"""
+    fraccionamiento_id = request.args.get('fraccionamiento', type=int)
+    paquete_id = request.args.get('paquete', type=int)
+    if not fraccionamiento_id and not paquete_id:
+        return jsonify({'error': 'Se requiere un fraccionamiento o un paquete'}), 400
+    
+    k = request.args.get('k', 2, type=int)
+    k = min(max(k, 2), MAX_CONTIGUOUS_LOTS)
+    limite = request.args.get('limite', DEFAULT_CONTIGUOUS_GROUPS, type=int)
+    limite = min(max(limite, 1), MAX_CONTIGUOUS_GROUPS)
+    
+    # One more than asked tells whether there are more
+    groups = contiguous_groups(k, fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id, limit=limite + 1)
+    hay_mas = len(groups) > limite
+    groups = groups[:limite]
+    ids = [lote_id for group, _ in groups for lote_id in group]
+    lotes = {lote.id: lote for lote in catalog_query().filter(Lote.id.in_(ids))} if ids else {}
+    include_private = current_user.is_authenticated
+    return jsonify({
+        'k': k,
+        'limite': limite,
+        'hay_mas': hay_mas,
+        'grupos': [{
+            'lotes': [serialize_catalog_row(lotes[lote_id], include_private) for lote_id in group],
+            'disponibles_contiguos': size
+        } for group, size in groups]
+    })
+
+@bp.route('/api/lotes/export')
+@login_required
+@admin_required
+def lotes_export():
+    """Stream the lots of a fraccionamiento or paquete as CSV"""
+    fraccionamiento_id = request.args.get('fraccionamiento', type=int)
+    paquete_id = request.args.get('paquete', type=int)
+    if paquete_id:
+        nombre = Paquete.query.get_or_404(paquete_id).nombre
+    elif fraccionamiento_id:
+        nombre = Fraccionamiento.query.get_or_404(fraccionamiento_id).nombre
+    else:
+        return jsonify({'error': 'Se requiere un fraccionamiento o un paquete'}), 400
+    
+    filename = secure_filename(f'disponibilidad_{nombre}.csv') or 'disponibilidad.csv'
+    return Response(
+        stream_with_context(generate_csv(fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@bp.route('/api/reference-cache/stats')
+@login_required
+@admin_required
+def reference_cache_stats():
+    """Hit/miss statistics of the in-process reference-data cache"""
+    return jsonify(reference_cache.stats())
 
 @bp.route('/api/clients/assignable')
 @login_required
@@ -613,22 +923,22 @@ def get_assignable_clients():
     } for client in clients])
 
 @bp.route('/api/lotes/<int:lote_id>')
-@login_required
+@versioned_response('lotes', 'paquetes', 'fraccionamiento', 'prototipos', 'prototipo_imagenes',
+                    'lote_asignaciones', 'client')
 def get_lote_details(lote_id):
     """Get detailed information about a lot"""
-    lote = Lote.query.get_or_404(lote_id)
+    lote = with_profile(Lote.query, 'lot_detail').get_or_404(lote_id)
     
-    # Check if user can view this lot
-    if not current_user.has_role(UserRole.ADMIN) and not current_user.has_role(UserRole.GERENTE):
-        # Add any additional access control if needed
-        pass
+    # Anonymous visitors of the public catalog only get the public fields
+    is_authenticated = current_user.is_authenticated
     
     # Get current assignment if any
     asignacion = None
-    if hasattr(lote, 'asignacion') and lote.asignacion:
+    if is_authenticated and lote.asignacion:
         asignacion = {
             'client_name': f"{lote.asignacion.client.nombre} {lote.asignacion.client.apellido_paterno}",
             'fecha_asignacion': lote.asignacion.fecha_asignacion.isoformat(),
+            'vence_en': lote.asignacion.vence_en.isoformat() if lote.asignacion.vence_en else None,
             'estado': lote.asignacion.estado
         }
     
@@ -638,23 +948,46 @@ def get_lote_details(lote_id):
         primera_imagen = lote.prototipo.imagenes[0]
         prototipo_imagen = url_for('static', filename=f'uploads/prototipos/{primera_imagen.filename}')
     
-    return jsonify({
+    details = {
         'id': lote.id,
+        'fraccionamiento': lote.paquete.fraccionamiento.nombre,
+        'paquete': lote.paquete.nombre,
         'lote': lote.lote,
         'manzana': lote.manzana,
+        'terreno': lote.terreno,
+        'perimetro': lote.perimetro,
+        'frente': lote.frente,
+        'tipo_de_lote': lote.tipo_de_lote,
         'precio': float(lote.precio),
         'estado_del_inmueble': lote.estado_del_inmueble,
-        'can_assign': current_user.has_role(UserRole.ADMIN) or \
+        'can_assign': is_authenticated and (
+                     current_user.has_role(UserRole.ADMIN) or \
                      current_user.has_role(UserRole.GERENTE) or \
                      current_user.has_role(UserRole.LIDER) or \
-                     current_user.has_role(UserRole.VENDEDOR),
+                     current_user.has_role(UserRole.VENDEDOR)),
+        'medidas': [{
+            'orientacion': lindero.orientacion,
+            'medidas': lindero.medidas,
+            'colindancia': lindero.colindancia,
+            'longitud': lindero.longitud
+        } for lindero in lote.linderos],
         'prototipo': {
             'nombre_prototipo': lote.prototipo.nombre_prototipo,
             'superficie_construccion': lote.prototipo.superficie_construccion,
             'imagen_url': prototipo_imagen
         },
         'asignacion': asignacion
-    })
+    }
+    
+    if is_authenticated:
+        details.update({
+            'calle': lote.calle,
+            'numero_exterior': lote.numero_exterior,
+            'numero_interior': lote.numero_interior,
+            'cuv': lote.cuv
+        })
+    
+    return jsonify(details)
 
 @bp.route('/api/lotes/assign', methods=['POST'])
 @login_required
@@ -673,14 +1006,9 @@ def assign_lot():
         return jsonify({'error': 'No tiene permiso para asignar este lote'}), 403
     
     try:
-        # Create assignment
-        asignacion = lote.asignar_a_cliente(
-            client=client,
-            user=current_user,
-            notas=data.get('notas')
-        )
-        
-        db.session.add(asignacion)
+        # Conditional UPDATE: only one of several concurrent requests gets the lot
+        reserve_lot(lote, client=client, user=current_user, notas=data.get('notas'),
+                    vence_en=hold_deadline(data.get('vigencia_horas')))
         db.session.commit()
         
         return jsonify({
@@ -689,20 +1017,82 @@ def assign_lot():
             'client_id': client.id
         })
         
+    except LotNotAvailable as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Error al asignar el lote'}), 500
 
+def _lote_ids(data):
+    lote_ids = data.get('lote_ids')
+    if not isinstance(lote_ids, list) or not all(isinstance(lote_id, int) for lote_id in lote_ids):
+        raise ValueError('Se requiere la lista de lote_ids')
+    return lote_ids
+
+@bp.route('/api/lotes/assign/batch', methods=['POST'])
+@login_required
+def assign_lots_batch():
+    """Assign several lots to one client in one transaction; none is assigned if any is taken"""
+    data = request.get_json() or {}
+    if 'client_id' not in data:
+        return jsonify({'error': 'Missing required fields'}), 400
+    client = Client.query.get_or_404(data['client_id'])
+    if not current_user.can_assign_lot(client, None):
+        return jsonify({'error': 'No tiene permiso para asignar lotes a este cliente'}), 403
+    
+    try:
+        total = reserve_lots(_lote_ids(data), client=client, user=current_user, notas=data.get('notas'),
+                             vence_en=hold_deadline(data.get('vigencia_horas')))
+        db.session.commit()
+        return jsonify({'message': 'Lotes asignados exitosamente', 'total': total, 'client_id': client.id})
+    except LotNotAvailable as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Error al asignar los lotes'}), 500
+
+@bp.route('/api/lotes/release/batch', methods=['POST'])
+@login_required
+def release_lots_batch():
+    """Release several lots in one transaction, e.g. all the lots of a cancelled client"""
+    data = request.get_json() or {}
+    if 'motivo' not in data:
+        return jsonify({'error': 'Se requiere especificar el motivo'}), 400
+    
+    try:
+        lote_ids = _lote_ids(data)
+        # One permission check per client, usually a single one
+        clients = {asignacion.client_id: asignacion for asignacion in current_assignments(lote_ids)}
+        if not all(current_user.can_modify_lot_assignment(asignacion) for asignacion in clients.values()):
+            return jsonify({'error': 'No tiene permiso para liberar estos lotes'}), 403
+        # Only the clients checked above: a lot assigned to another one meanwhile fails the batch
+        total = release_lots(lote_ids, user=current_user, motivo=data['motivo'], notas=data.get('notas'),
+                             client_ids=list(clients))
+        db.session.commit()
+        return jsonify({'message': 'Lotes liberados exitosamente', 'total': total})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Error al liberar los lotes'}), 500
+
 @bp.route('/api/lotes/<int:lote_id>/history')
 @login_required
+@versioned_response('lote_asignaciones_historial', 'client', 'user')
 def get_lot_history(lote_id):
     """Get assignment history for a lot"""
     lote = Lote.query.get_or_404(lote_id)
     
     # Get all historical records
-    history = LoteAsignacionHistorial.query.filter_by(lote_id=lote_id)\
+    history = with_profile(LoteAsignacionHistorial.query, 'lot_history').filter_by(lote_id=lote_id)\
         .order_by(LoteAsignacionHistorial.fecha_inicio.desc()).all()
     
     return jsonify([{
@@ -714,6 +1104,59 @@ def get_lot_history(lote_id):
         'motivo_cambio': record.motivo_cambio
     } for record in history])
 
+@bp.route('/api/lotes/<int:lote_id>/precios')
+@login_required
+def get_lot_prices(lote_id):
+    """Price history of a lot, and its price at ?fecha=YYYY-MM-DD (end of that day)"""
+    lote = Lote.query.get_or_404(lote_id)
+    history = LotePrecioHistorial.query.filter_by(lote_id=lote_id)\
+        .order_by(LotePrecioHistorial.fecha.desc(), LotePrecioHistorial.id.desc()).all()
+    data = {
+        'lote_id': lote.id,
+        'precio': lote.precio,
+        'historial': [{
+            'fecha': record.fecha.isoformat(),
+            'precio_anterior': record.precio_anterior,
+            'precio_nuevo': record.precio_nuevo,
+            'revision_id': record.revision_id
+        } for record in history]
+    }
+    fecha = request.args.get('fecha')
+    if fecha:
+        try:
+            when = datetime.strptime(fecha, '%Y-%m-%d') + timedelta(days=1, microseconds=-1)
+        except ValueError:
+            return jsonify({'error': 'Fecha no válida, use AAAA-MM-DD'}), 400
+        data['precio_a_la_fecha'] = price_as_of(lote, when)
+    return jsonify(data)
+
+@bp.route('/api/fraccionamientos/<int:id>/inventario')
+@login_required
+def fraccionamiento_inventory_as_of(id):
+    """Estado and precio of every lot at ?fecha=YYYY-MM-DD (end of that day), optionally by paquete and estado"""
+    fraccionamiento = Fraccionamiento.query.get_or_404(id)
+    try:
+        when = datetime.strptime(request.args.get('fecha', ''), '%Y-%m-%d') + timedelta(days=1, microseconds=-1)
+    except ValueError:
+        return jsonify({'error': 'Fecha no válida, use AAAA-MM-DD'}), 400
+
+    lots, snapshot = inventory_as_of(fraccionamiento.id, when)
+    paquete_id = request.args.get('paquete', type=int)
+    if paquete_id:
+        in_paquete = {lote_id for (lote_id,) in db.session.query(Lote.id).filter(Lote.paquete_id == paquete_id)}
+        lots = {lote_id: lot for lote_id, lot in lots.items() if lote_id in in_paquete}
+    resumen = summarize_inventory(lots)
+    estado = request.args.get('estado')
+    if estado:
+        lots = {lote_id: lot for lote_id, lot in lots.items() if lot['estado'] == estado}
+    return jsonify({
+        'fraccionamiento_id': fraccionamiento.id,
+        'fecha': when.isoformat(),
+        'snapshot': snapshot.tomado_en.isoformat() if snapshot else None,
+        'resumen': resumen,
+        'lotes': [dict(lot, id=lote_id) for lote_id, lot in sorted(lots.items())]
+    })
+
 @bp.route('/api/lotes/<int:lote_id>/release', methods=['POST'])
 @login_required
 def release_lot(lote_id):
@@ -723,7 +1166,7 @@ def release_lot(lote_id):
     if 'motivo' not in data:
         return jsonify({'error': 'Se requiere especificar el motivo'}), 400
     
-    lote = Lote.query.get_or_404(lote_id)
+    lote = with_profile(Lote.query, 'lot_detail').get_or_404(lote_id)
     
     # Check if user can modify this assignment
     if not current_user.can_modify_lot_assignment(lote.asignacion):
@@ -749,3 +1192,86 @@ def release_lot(lote_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Error al liberar el lote'}), 500
+
+@bp.route('/api/busquedas', methods=['GET'])
+@login_required
+def saved_searches_index():
+    """Saved lot searches of the current user"""
+    busquedas = BusquedaGuardada.query.filter_by(user_id=current_user.id)\
+        .order_by(BusquedaGuardada.created_at.desc()).all()
+    return jsonify([serialize_busqueda(busqueda) for busqueda in busquedas])
+
+@bp.route('/api/busquedas', methods=['POST'])
+@login_required
+def saved_search_create():
+    """Save lot criteria; the current user is notified when a matching lot becomes Libre"""
+    data = request.get_json() or {}
+    if not data.get('nombre') or not data.get('fraccionamiento_id'):
+        return jsonify({'error': 'Se requieren nombre y fraccionamiento'}), 400
+    client_id = data.get('client_id')
+    if client_id is not None:
+        if not isinstance(client_id, int) or db.session.get(Client, client_id) is None:
+            return jsonify({'error': 'Cliente no encontrado'}), 400
+        if client_id not in {client.id for client in current_user.get_assignable_clients()}:
+            return jsonify({'error': 'No tiene permiso para guardar búsquedas de este cliente'}), 403
+    try:
+        busqueda = BusquedaGuardada(
+            user_id=current_user.id,
+            client_id=client_id,
+            nombre=str(data['nombre'])[:100],
+            fraccionamiento_id=int(data['fraccionamiento_id']),
+            prototipo_id=int(data['prototipo_id']) if data.get('prototipo_id') else None,
+            tipo_de_lote=data.get('tipo_de_lote') or None,
+            precio_min=float(data['precio_min']) if data.get('precio_min') is not None else None,
+            precio_max=float(data['precio_max']) if data.get('precio_max') is not None else None
+        )
+        set_search_bands(busqueda)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    if db.session.get(Fraccionamiento, busqueda.fraccionamiento_id) is None:
+        return jsonify({'error': 'Fraccionamiento no encontrado'}), 400
+    db.session.add(busqueda)
+    db.session.commit()
+    return jsonify(serialize_busqueda(busqueda)), 201
+
+@bp.route('/api/busquedas/<int:id>', methods=['DELETE'])
+@login_required
+def saved_search_delete(id):
+    busqueda = BusquedaGuardada.query.get_or_404(id)
+    if busqueda.user_id != current_user.id and not current_user.has_role(UserRole.ADMIN):
+        return jsonify({'error': 'No tiene permiso para eliminar esta búsqueda'}), 403
+    db.session.delete(busqueda)
+    db.session.commit()
+    return jsonify({'message': 'Búsqueda eliminada'})
+
+@bp.route('/api/notificaciones')
+@login_required
+def notifications_index():
+    """Unread notifications of the current user (?todas=1 for the read ones too)"""
+    query = Notificacion.query.filter_by(user_id=current_user.id)
+    if not request.args.get('todas', type=int):
+        query = query.filter_by(leida=False)
+    notificaciones = query.order_by(Notificacion.created_at.desc(), Notificacion.id.desc()).limit(100).all()
+    return jsonify([{
+        'id': notificacion.id,
+        'mensaje': notificacion.mensaje,
+        'lote_id': notificacion.lote_id,
+        'busqueda_id': notificacion.busqueda_id,
+        'leida': notificacion.leida,
+        'created_at': notificacion.created_at.isoformat()
+    } for notificacion in notificaciones])
+
+@bp.route('/api/notificaciones/leidas', methods=['POST'])
+@login_required
+def notifications_mark_read():
+    """Mark the given notification ids (or all of them) of the current user as read"""
+    data = request.get_json() or {}
+    ids = data.get('ids')
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({'error': 'ids debe ser una lista de notificaciones'}), 400
+    query = Notificacion.query.filter_by(user_id=current_user.id, leida=False)
+    if ids is not None:
+        query = query.filter(Notificacion.id.in_(ids))
+    total = query.update({'leida': True}, synchronize_session=False)
+    db.session.commit()
+    return jsonify({'leidas': total})
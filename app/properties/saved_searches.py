@@ -0,0 +1,105 @@
+"""Saved lot searches and the notifications sent when a lot matches one.
+
+A saved search is a fraccionamiento, an optional prototipo and tipo_de_lote
+and an optional price range. Besides the exact bounds, the range is stored
+as the PRICE_BAND wide bands it covers (banda_min..banda_max), so when a
+lot becomes Libre the only searches looked at are the ones of its
+fraccionamiento, of its prototipo or of any prototipo, and whose bands
+include the lot's price band: one read on ix_busquedas_guardadas_bucket per
+lot instead of re-running every saved search. The candidates are then
+checked against the exact bounds and tipo_de_lote, and a Notificacion is
+written for the owner of each match in the same transaction as the change.
+
+Lots freed through the ORM (liberar_lote, the lot form, new Libre lots) are
+picked up on flush; bulk Core updates call notify_freed_lots themselves.
+"""
+import math
+from datetime import datetime
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.orm import Session
+from .models import Lote, BusquedaGuardada, Notificacion
+
+PRICE_BAND = 100000.0
+# banda_max of searches without precio_max
+OPEN_BAND = 2 ** 31 - 1
+MATCHED_ESTADO = 'Libre'
+
+def price_band(precio):
+    return max(int(math.floor(precio / PRICE_BAND)), 0)
+
+def set_bands(busqueda):
+    """Derive the band range of a search from its price range"""
+    if busqueda.precio_min is not None and busqueda.precio_max is not None \
+            and busqueda.precio_min > busqueda.precio_max:
+        raise ValueError('El precio mínimo no puede ser mayor al máximo')
+    busqueda.banda_min = price_band(busqueda.precio_min) if busqueda.precio_min is not None else 0
+    busqueda.banda_max = price_band(busqueda.precio_max) if busqueda.precio_max is not None else OPEN_BAND
+
+def serialize_busqueda(busqueda):
+    return {
+        'id': busqueda.id,
+        'nombre': busqueda.nombre,
+        'client_id': busqueda.client_id,
+        'fraccionamiento_id': busqueda.fraccionamiento_id,
+        'prototipo_id': busqueda.prototipo_id,
+        'tipo_de_lote': busqueda.tipo_de_lote,
+        'precio_min': busqueda.precio_min,
+        'precio_max': busqueda.precio_max,
+        'activa': busqueda.activa
+    }
+
+def _candidates(connection, fraccionamiento_id, prototipo_id, precio):
+    band = price_band(precio)
+    table = BusquedaGuardada.__table__
+    return connection.execute(
+        select(table.c.id, table.c.user_id, table.c.nombre, table.c.tipo_de_lote,
+               table.c.precio_min, table.c.precio_max)
+        .where(table.c.fraccionamiento_id == fraccionamiento_id,
+               or_(table.c.prototipo_id == prototipo_id, table.c.prototipo_id.is_(None)),
+               table.c.banda_min <= band, table.c.banda_max >= band,
+               table.c.activa.is_(True))
+    )
+
+def match(connection, fraccionamiento_id, prototipo_id, tipo_de_lote, precio):
+    """(busqueda_id, user_id, nombre) of the active searches a lot matches"""
+    return [(busqueda_id, user_id, nombre)
+            for busqueda_id, user_id, nombre, tipo, precio_min, precio_max
+            in _candidates(connection, fraccionamiento_id, prototipo_id, precio)
+            if (tipo is None or tipo == tipo_de_lote)
+            and (precio_min is None or precio >= precio_min)
+            and (precio_max is None or precio <= precio_max)]
+
+def notify_freed_lots(connection, lots):
+    """Notify the owners of the searches matched by lots that just became Libre.
+
+    lots are (lote_id, fraccionamiento_id, prototipo_id, tipo_de_lote,
+    precio, descripcion) tuples; returns the number of notifications.
+    """
+    now = datetime.utcnow()
+    rows = []
+    for lote_id, fraccionamiento_id, prototipo_id, tipo_de_lote, precio, descripcion in lots:
+        for busqueda_id, user_id, nombre in match(connection, fraccionamiento_id, prototipo_id, tipo_de_lote, precio):
+            rows.append({'user_id': user_id, 'busqueda_id': busqueda_id, 'lote_id': lote_id,
+                         'mensaje': f'{descripcion} está disponible ({nombre})'[:255],
+                         'leida': False, 'created_at': now})
+    if rows:
+        connection.execute(Notificacion.__table__.insert(), rows)
+    return len(rows)
+
+def describe(manzana, lote):
+    return f'Manzana {manzana} Lote {lote}'
+
+@event.listens_for(Session, 'after_flush')
+def _notify_freed_lots(session, flush_context):
+    freed = []
+    for obj in session.new | session.dirty:
+        if not isinstance(obj, Lote) or obj.estado_del_inmueble != MATCHED_ESTADO or obj in session.deleted:
+            continue
+        if obj not in session.new:
+            history = inspect(obj).attrs.estado_del_inmueble.history
+            if not history.added or MATCHED_ESTADO in (history.deleted or ()):
+                continue
+        freed.append((obj.id, obj.fraccionamiento_id, obj.prototipo_id, obj.tipo_de_lote, obj.precio,
+                      describe(obj.manzana, obj.lote)))
+    if freed:
+        notify_freed_lots(session.connection(), freed)
@@ -0,0 +1,137 @@
+"""Faceted lot search.
+
+Facet counts follow the usual drill-down rule: the counts of a facet are
+computed with every other active filter applied but not its own, so a
+seller can see what widening that facet would add. Instead of one grouped
+query per facet, the facet columns of every lot in the fraccionamiento or
+paquete are streamed once and each row is credited in a single pass: rows
+passing every filter count towards all facets, rows failing exactly one
+filter count only towards that facet, the rest are skipped.
+"""
+import math
+from collections import Counter
+from sqlalchemy import and_
+from app.database import db
+from .models import Prototipo, Lote
+from .reference_cache import prototipo_choices
+
+class Facet:
+    def __init__(self, name, column, kind='value', cast=str, band=None):
+        self.name = name
+        self.column = column
+        self.kind = kind  # 'value' (multi-select) or 'range' (min/max, counted in bands)
+        self.cast = cast
+        self.band = band
+
+    def parse(self, args):
+        """Selection of this facet in the query string, or None when unfiltered"""
+        if self.kind == 'value':
+            try:
+                values = {self.cast(value) for value in args.getlist(self.name) if value != ''}
+            except ValueError:
+                raise ValueError(f'Valor inválido para {self.name}')
+            return values or None
+
+        low = args.get(f'{self.name}_min', type=float)
+        high = args.get(f'{self.name}_max', type=float)
+        if low is None and high is None:
+            return None
+        return (low, high)
+
+    def clause(self, selection):
+        if self.kind == 'value':
+            return self.column.in_(selection)
+        low, high = selection
+        clauses = []
+        if low is not None:
+            clauses.append(self.column >= low)
+        if high is not None:
+            clauses.append(self.column <= high)
+        return and_(*clauses)
+
+    def matches(self, value, selection):
+        if self.kind == 'value':
+            return value in selection
+        low, high = selection
+        if value is None:
+            return False
+        return (low is None or value >= low) and (high is None or value <= high)
+
+    def bucket(self, value):
+        if self.kind == 'value' or value is None:
+            return value
+        return int(math.floor(value / self.band) * self.band)
+
+def _facets():
+    return [
+        Facet('estado', Lote.estado_del_inmueble),
+        Facet('tipo_de_lote', Lote.tipo_de_lote),
+        Facet('prototipo', Lote.prototipo_id, cast=int),
+        Facet('recamaras', Prototipo.recamaras, cast=int),
+        Facet('precio', Lote.precio, kind='range', band=100000),
+        Facet('terreno', Lote.terreno, kind='range', band=10),
+        Facet('frente', Lote.frente, kind='range', band=1),
+    ]
+
+def parse_filters(args):
+    """Return [(facet, selection)] for every facet, selection None when unfiltered"""
+    return [(facet, facet.parse(args)) for facet in _facets()]
+
+def apply_filters(query, filters):
+    """Restrict a catalog query (already joined with Prototipo) to the active filters"""
+    for facet, selection in filters:
+        if selection is not None:
+            query = query.filter(facet.clause(selection))
+    return query
+
+def facet_counts(filters, fraccionamiento_id=None, paquete_id=None, batch_size=1000):
+    """Return (total matching lots, {facet: [{'value', 'label', 'count'}]}) in one scan"""
+    facets = [facet for facet, _ in filters]
+    active = [(index, facet, selection) for index, (facet, selection) in enumerate(filters)
+              if selection is not None]
+
+    query = db.session.query(*[facet.column for facet in facets])\
+        .select_from(Lote).join(Prototipo, Prototipo.id == Lote.prototipo_id)
+    if fraccionamiento_id:
+        query = query.filter(Lote.fraccionamiento_id == fraccionamiento_id)
+    if paquete_id:
+        query = query.filter(Lote.paquete_id == paquete_id)
+
+    counts = [Counter() for _ in facets]
+    total = 0
+    for row in query.yield_per(batch_size):
+        failed = None
+        for index, facet, selection in active:
+            if not facet.matches(row[index], selection):
+                if failed is not None:
+                    break
+                failed = index
+        else:
+            if failed is None:
+                total += 1
+                for index, facet in enumerate(facets):
+                    counts[index][facet.bucket(row[index])] += 1
+            else:
+                counts[failed][facets[failed].bucket(row[failed])] += 1
+
+    prototipos = dict(prototipo_choices())
+    result = {}
+    for index, facet in enumerate(facets):
+        values = sorted(value for value in counts[index] if value is not None)
+        if None in counts[index]:
+            values.append(None)
+        result[facet.name] = [{
+            'value': value,
+            'label': _label(facet, value, prototipos),
+            'count': counts[index][value]
+        } for value in values]
+    return total, result
+
+def _label(facet, value, prototipos):
+    if value is None:
+        return 'N/A'
+    if facet.name == 'prototipo':
+        return prototipos.get(value, str(value))
+    if facet.kind == 'range':
+        return f'{value:,} - {value + facet.band:,}'
+    return str(value)
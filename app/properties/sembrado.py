@@ -0,0 +1,199 @@
+"""Availability overlay of the sembrado (site plan) of each fraccionamiento.
+
+Lots with a sembrado_poligono are drawn as SVG polygons on top of the plan
+image, filled by estado_del_inmueble. The overlay of a fraccionamiento is
+rendered once into SEMBRADO_OVERLAY_FOLDER and served from there as a
+file, whatever the number of lots. Each polygon encodes its estado in one
+character of its class ("e0", "e1", ...), so commits that only change
+estados patch those characters in place; other changes to the drawn lots
+or to the fraccionamiento drop the file and the next request renders it.
+"""
+import os
+import re
+import struct
+import threading
+from flask import current_app, has_app_context
+from markupsafe import escape
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app.database import db
+from .models import Fraccionamiento, Lote
+from .file_lock import FileLock
+
+ESTADO_CODES = {estado: str(code) for code, estado in enumerate(Lote.ESTADOS_INMUEBLE)}
+UNKNOWN_ESTADO_CODE = 'x'
+# Fill of each code: Libre, Apartado, Titulado, anything else
+ESTADO_COLORS = {'0': '#198754', '1': '#ffc107', '2': '#dc3545', UNKNOWN_ESTADO_CODE: '#6c757d'}
+# Lot attributes that appear in the overlay
+DRAWN_ATTRIBUTES = {'sembrado_poligono', 'manzana', 'lote', 'fraccionamiento_id'}
+POINT = re.compile(r'^(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)$')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def parse_poligono(text):
+    """Normalized "x,y x,y ..." points of a polygon; ValueError unless it has at least 3"""
+    points = []
+    for token in re.sub(r'\s*,\s*', ',', (text or '').strip()).split():
+        match = POINT.match(token)
+        if not match:
+            raise ValueError(f'Punto inválido en el polígono: {token}')
+        points.append(f'{match.group(1)},{match.group(2)}')
+    if len(points) < 3:
+        raise ValueError('El polígono necesita al menos 3 puntos')
+    return ' '.join(points)
+
+def image_size(path):
+    """(width, height) of a PNG or JPEG file read from its header, or None"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(24)
+            if head[:8] == PNG_SIGNATURE and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:2] != b'\xff\xd8':
+                return None
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                code = marker[1]
+                if code == 0x01 or 0xD0 <= code <= 0xD8:
+                    continue
+                length, = struct.unpack('>H', f.read(2))
+                # Start-of-frame markers carry the size; C4, C8 and CC are not frames
+                if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>xHH', f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+def _folder():
+    return current_app.config.get('SEMBRADO_OVERLAY_FOLDER')
+
+def _path(fraccionamiento_id):
+    return os.path.join(_folder(), f'{fraccionamiento_id}.svg')
+
+def _marker(lote_id):
+    return f'id="lote-{lote_id}" class="e'.encode()
+
+def render(connection, fraccionamiento_id):
+    """SVG overlay of a fraccionamiento, or None when its sembrado is not an image"""
+    size = connection.execute(
+        select(Fraccionamiento.sembrado_ancho, Fraccionamiento.sembrado_alto)
+        .where(Fraccionamiento.id == fraccionamiento_id)
+    ).first()
+    if size is None or not all(size):
+        return None
+
+    rows = connection.execute(
+        select(Lote.id, Lote.manzana, Lote.lote, Lote.estado_del_inmueble, Lote.sembrado_poligono)
+        .where(Lote.fraccionamiento_id == fraccionamiento_id, Lote.sembrado_poligono.isnot(None))
+        .order_by(Lote.paquete_id, Lote.manzana_orden, Lote.lote_orden, Lote.id)
+    )
+    ancho, alto = size
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {ancho} {alto}" width="{ancho}" height="{alto}">',
+        '<style>polygon{fill-opacity:.45;stroke:#fff;stroke-width:1}'
+        + ''.join(f'.e{code}{{fill:{color}}}' for code, color in ESTADO_COLORS.items()) + '</style>'
+    ]
+    for lote_id, manzana, lote, estado, poligono in rows:
+        code = ESTADO_CODES.get(estado, UNKNOWN_ESTADO_CODE)
+        parts.append(
+            f'<polygon {_marker(lote_id).decode()}{code}" points="{escape(poligono)}">'
+            f'<title>Manzana {escape(manzana)} - Lote {escape(lote)}: {escape(estado)}</title></polygon>'
+        )
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+def build(fraccionamiento_id, path):
+    """Render the overlay into path (removing it when there is nothing to draw)"""
+    # A connection of its own: the overlay must reflect what is committed now,
+    # not a transaction the request opened earlier
+    with db.engine.connect() as connection:
+        svg = render(connection, fraccionamiento_id)
+    if svg is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(svg)
+    os.replace(temporary, path)
+    return True
+
+def overlay_path(fraccionamiento_id):
+    """Path of the current overlay of a fraccionamiento (rendered if needed), or None"""
+    if not _folder():
+        return None
+    path = _path(fraccionamiento_id)
+    if not os.path.exists(path):
+        os.makedirs(_folder(), exist_ok=True)
+        # Commits patch or drop the file under the same lock, so one landing
+        # while we render waits and is applied after we are done
+        with FileLock(path):
+            if not os.path.exists(path) and not build(fraccionamiento_id, path):
+                return None
+    return path
+
+def patch_estados(fraccionamiento_id, changes):
+    """Write new estados (lote id -> estado) into an existing overlay"""
+    path = _path(fraccionamiento_id)
+    if not os.path.exists(path):
+        return
+    with FileLock(path), open(path, 'r+b') as f:
+        content = f.read()
+        for lote_id, estado in changes.items():
+            offset = content.find(_marker(lote_id))
+            # Lots without a polygon are not drawn
+            if offset != -1:
+                f.seek(offset + len(_marker(lote_id)))
+                f.write(ESTADO_CODES.get(estado, UNKNOWN_ESTADO_CODE).encode())
+
+def invalidate(fraccionamiento_id):
+    """Drop the overlay of a fraccionamiento so it is rendered again"""
+    path = _path(fraccionamiento_id)
+    with FileLock(path):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _lote_fraccionamientos(obj):
+    history = inspect(obj).attrs.fraccionamiento_id.history
+    return set(history.deleted or ()) | {obj.fraccionamiento_id}
+
+@event.listens_for(Session, 'after_flush')
+def _collect_overlay_changes(session, flush_context):
+    info = session.info.setdefault('sembrado_overlays', {'estados': {}, 'invalid': set()})
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Lote):
+            info['invalid'] |= _lote_fraccionamientos(obj)
+        elif isinstance(obj, Fraccionamiento):
+            info['invalid'].add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Fraccionamiento) and session.is_modified(obj, include_collections=False):
+            info['invalid'].add(obj.id)
+        if not isinstance(obj, Lote):
+            continue
+        changed = {attr.key for attr in inspect(obj).attrs if attr.history.has_changes()}
+        if changed & DRAWN_ATTRIBUTES:
+            info['invalid'] |= _lote_fraccionamientos(obj)
+        elif 'estado_del_inmueble' in changed:
+            info['estados'].setdefault(obj.fraccionamiento_id, {})[obj.id] = obj.estado_del_inmueble
+
+@event.listens_for(Session, 'after_commit')
+def _update_overlays(session):
+    info = session.info.pop('sembrado_overlays', None)
+    if not info or not has_app_context() or not _folder() or not os.path.isdir(_folder()):
+        return
+    try:
+        for fraccionamiento_id in info['invalid'] - {None}:
+            invalidate(fraccionamiento_id)
+        for fraccionamiento_id, changes in info['estados'].items():
+            if fraccionamiento_id not in info['invalid']:
+                patch_estados(fraccionamiento_id, changes)
+    except OSError:
+        current_app.logger.exception('No se pudo actualizar el sembrado de disponibilidad')
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_overlay_changes(session):
+    session.info.pop('sembrado_overlays', None)
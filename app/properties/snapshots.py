@@ -0,0 +1,208 @@
+"""Static snapshots of the public lot catalog.
+
+For every fraccionamiento the public catalog page and the JSON of its lots
+are pre-rendered under CATALOG_SNAPSHOT_FOLDER, once for the whole
+fraccionamiento and once per paquete:
+
+    <folder>/<fraccionamiento_id>/index.html
+    <folder>/<fraccionamiento_id>/lotes.json
+    <folder>/<fraccionamiento_id>/paquetes/<paquete_id>/index.html
+    <folder>/<fraccionamiento_id>/paquetes/<paquete_id>/lotes.json
+
+so the front web server can answer anonymous visitors straight from disk.
+Every commit that touches lots, paquetes or fraccionamientos, or renames a
+prototipo, queues the fraccionamientos affected; whether it comes from a
+request, a background thread (expired holds, tiles) or a CLI command. A
+worker thread per app regenerates them, so writes never wait for the
+rendering, and a fraccionamiento changed again while queued is rendered
+once. The worker only runs while there is work, and the interpreter waits
+for it at exit, so CLI commands do not leave stale snapshots behind.
+"""
+import json
+import os
+import shutil
+import threading
+from flask import current_app, has_app_context, render_template, url_for
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from .models import Prototipo, Fraccionamiento, Paquete, Lote
+from .forms import LoteFilterForm
+from .catalog import catalog_query, serialize_catalog_row
+from .reference_cache import paquete_choices
+from .file_lock import FileLock
+from .versions import table_version
+
+ALL = '*'
+
+def _folder():
+    return current_app.config.get('CATALOG_SNAPSHOT_FOLDER')
+
+def _write(path, content):
+    """Write a file atomically so the web server never serves half of it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+def _snapshot_url(*parts):
+    folder = os.path.relpath(_folder(), current_app.static_folder).replace(os.sep, '/')
+    return url_for('static', filename='/'.join((folder,) + tuple(str(part) for part in parts)))
+
+def _render(fraccionamiento_id, paquete_id, directory, json_parts):
+    query = catalog_query(fraccionamiento_id=fraccionamiento_id, paquete_id=paquete_id)\
+        .order_by(Lote.paquete_id, Lote.manzana_orden, Lote.lote_orden, Lote.id)
+    # Read before the rows, which the page then brings up to date from the live events after it
+    version = table_version('lotes')
+    rows = [serialize_catalog_row(lote) for lote in query.yield_per(1000)]
+    _write(os.path.join(directory, 'lotes.json'), json.dumps(
+        {'lotes': rows, 'next_cursor': None, 'version': version}, ensure_ascii=False, separators=(',', ':')
+    ))
+
+    form = LoteFilterForm(meta={'csrf': False}, data={
+        'fraccionamiento': fraccionamiento_id, 'paquete': paquete_id or 0, 'estado': ''
+    })
+    form.paquete.choices = [(0, 'Todos los paquetes')] + paquete_choices(fraccionamiento_id)
+    _write(os.path.join(directory, 'index.html'), render_template(
+        'properties/lotes/public.html', form=form, static_snapshot=True,
+        catalog_url=_snapshot_url(*json_parts, 'lotes.json')
+    ))
+
+def build_fraccionamiento(fraccionamiento_id):
+    """(Re)generate the snapshot of one fraccionamiento; removes it if it no longer exists.
+
+    Must run in a request context of its own (see _anonymous_request) so
+    the pages are rendered as seen by an anonymous visitor.
+    """
+    directory = os.path.join(_folder(), str(fraccionamiento_id))
+    os.makedirs(_folder(), exist_ok=True)
+    # Other processes' workers may be regenerating the same fraccionamiento
+    with FileLock(directory):
+        _build_fraccionamiento(fraccionamiento_id, directory)
+
+def _build_fraccionamiento(fraccionamiento_id, directory):
+    fraccionamiento = Fraccionamiento.query.get(fraccionamiento_id)
+    if fraccionamiento is None:
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+
+    _render(fraccionamiento_id, None, directory, (fraccionamiento_id,))
+    paquetes = {str(paquete_id) for paquete_id, _ in paquete_choices(fraccionamiento_id)}
+    for paquete_id in paquetes:
+        _render(fraccionamiento_id, int(paquete_id), os.path.join(directory, 'paquetes', paquete_id),
+                (fraccionamiento_id, 'paquetes', paquete_id))
+
+    # Drop paquetes that were deleted or moved away
+    paquetes_dir = os.path.join(directory, 'paquetes')
+    for name in os.listdir(paquetes_dir) if os.path.isdir(paquetes_dir) else ():
+        if name not in paquetes:
+            shutil.rmtree(os.path.join(paquetes_dir, name), ignore_errors=True)
+
+def _anonymous_request(app):
+    """Request context the pages are rendered in, outside any request.
+
+    The templates need a request: url_for builds their links from it, and
+    current_user is loaded per request, anonymous here since there is no
+    session cookie. test_request_context is how Flask builds a context for
+    a request that did not come over the network; despite the name it is a
+    plain RequestContext for a GET of the public catalog, with the app's
+    SERVER_NAME, APPLICATION_ROOT and PREFERRED_URL_SCHEME.
+    """
+    return app.test_request_context('/properties/lotes/public')
+
+def regenerate(fraccionamiento_ids):
+    """Regenerate the given fraccionamientos (ALL for every one)"""
+    app = current_app._get_current_object()
+    # A fresh app context so neither the logged-in user nor the session leak in
+    with app.app_context(), _anonymous_request(app):
+        if ALL in fraccionamiento_ids:
+            existing = {f.id for f in Fraccionamiento.query}
+            folder = _folder()
+            on_disk = {int(name) for name in os.listdir(folder) if name.isdigit()} if os.path.isdir(folder) else set()
+            fraccionamiento_ids = existing | on_disk
+        for fraccionamiento_id in sorted(fraccionamiento_ids):
+            build_fraccionamiento(fraccionamiento_id)
+
+class SnapshotWorker:
+    """Thread regenerating the queued fraccionamientos of one app"""
+
+    def __init__(self, app):
+        self.app = app
+        self.pending = set()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def schedule(self, fraccionamiento_ids):
+        with self.condition:
+            self.pending |= fraccionamiento_ids
+            if self.thread is None:
+                # Not a daemon, so a CLI command exits once its snapshots are written
+                self.thread = threading.Thread(target=self._run, name='catalog-snapshots')
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    return
+                pending, self.pending = self.pending, set()
+            with self.app.app_context():
+                try:
+                    regenerate(pending)
+                except Exception:
+                    current_app.logger.exception('No se pudieron regenerar los catálogos estáticos')
+
+    def wait(self):
+        """Return once the queue is empty (for tests and scripts)"""
+        while True:
+            with self.condition:
+                thread = self.thread
+            if thread is None:
+                return
+            thread.join()
+
+_worker_lock = threading.Lock()
+
+def get_worker(app):
+    with _worker_lock:
+        if 'catalog_snapshots' not in app.extensions:
+            app.extensions['catalog_snapshots'] = SnapshotWorker(app)
+        return app.extensions['catalog_snapshots']
+
+def _prototipo_fraccionamientos(session, prototipo):
+    """Fraccionamientos with lots of a prototipo, whose rows show its name"""
+    table = Lote.__table__
+    return set(session.connection().execute(
+        select(table.c.fraccionamiento_id).distinct().where(table.c.prototipo_id == prototipo.id)
+    ).scalars())
+
+def _changed_fraccionamientos(session, obj):
+    if isinstance(obj, Prototipo):
+        if obj in session.deleted or inspect(obj).attrs.nombre_prototipo.history.has_changes():
+            return _prototipo_fraccionamientos(session, obj)
+        return set()
+    if isinstance(obj, Fraccionamiento):
+        return {obj.id}
+    # Lote or Paquete: the fraccionamiento it is in now and the one it left
+    history = inspect(obj).attrs.fraccionamiento_id.history
+    return set(history.deleted or ()) | set(history.unchanged or ()) | {obj.fraccionamiento_id}
+
+@event.listens_for(Session, 'after_flush')
+def _collect_snapshot_changes(session, flush_context):
+    changed = session.info.setdefault('catalog_snapshots', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Prototipo, Fraccionamiento, Paquete, Lote)):
+            changed |= _changed_fraccionamientos(session, obj)
+
+@event.listens_for(Session, 'after_commit')
+def _schedule_snapshots(session):
+    changed = session.info.pop('catalog_snapshots', None)
+    if changed and has_app_context() and _folder():
+        changed.discard(None)
+        if changed:
+            get_worker(current_app._get_current_object()).schedule(changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_snapshot_changes(session):
+    session.info.pop('catalog_snapshots', None)
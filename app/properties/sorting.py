@@ -0,0 +1,63 @@
+"""Natural sort keys for manzana and lote identifiers.
+
+Manzanas are written as Roman numerals ("XVII"), plain numbers ("17") or
+letters ("C"), lotes as numbers with an optional suffix ("29", "29-A").
+Lexical order puts "X" before "IX" and "10" before "9", so lots store
+integer keys derived from both fields and are ordered by those instead.
+
+A single letter such as "C" or "I" is 100 or 1 in a plan numbered in Roman
+numerals but the third or ninth manzana of a lettered one, so it is only
+read as a Roman numeral when its paquete has Roman numerals of two or more
+characters ("II", "XIV"); see uses_roman_numerals.
+"""
+import re
+
+# Key for values that cannot be parsed; they sort after every numbered one
+UNKNOWN_SORT_KEY = 999999
+# Key of manzana "A"; letters sort alphabetically after the numbers
+LETTER_SORT_KEY = 900000
+
+ROMAN_PATTERN = re.compile(r'^M{0,3}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})$')
+ROMAN_VALUES = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000}
+LEADING_NUMBER = re.compile(r'\d+')
+
+def roman_to_int(value):
+    """Convert a Roman numeral to an int, or None if it is not one"""
+    if not value or not ROMAN_PATTERN.match(value):
+        return None
+    total = 0
+    for current, following in zip(value, value[1:] + ' '):
+        digit = ROMAN_VALUES[current]
+        total += -digit if ROMAN_VALUES.get(following, 0) > digit else digit
+    return total
+
+def _tokens(manzana):
+    return re.split(r'[\s.\-]+', manzana.strip().upper())
+
+def uses_roman_numerals(manzanas):
+    """Whether the manzanas of a paquete are numbered in Roman numerals"""
+    return any(len(token) > 1 and roman_to_int(token) is not None
+               for manzana in manzanas if manzana for token in _tokens(manzana))
+
+def manzana_sort_key(manzana, roman=False):
+    """Sort key of a manzana written in Arabic or Roman numerals or as a letter ("Mz. XVII" also works).
+
+    roman tells whether single letters are Roman numerals, i.e. whether the
+    paquete of the manzana uses them (see uses_roman_numerals).
+    """
+    if not manzana:
+        return UNKNOWN_SORT_KEY
+    for token in reversed(_tokens(manzana)):
+        if token.isdigit():
+            return int(token)
+        value = roman_to_int(token) if len(token) > 1 or roman else None
+        if value is not None:
+            return value
+        if len(token) == 1 and 'A' <= token <= 'Z':
+            return LETTER_SORT_KEY + ord(token) - ord('A')
+    return UNKNOWN_SORT_KEY
+
+def lote_sort_key(lote):
+    """Sort key of a lote number, using its first run of digits ("29-A" -> 29)"""
+    match = LEADING_NUMBER.search(lote or '')
+    return int(match.group()) if match else UNKNOWN_SORT_KEY
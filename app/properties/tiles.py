@@ -0,0 +1,169 @@
+"""Deep Zoom tile pyramids of the sembrado plans.
+
+An uploaded plan image is cut once into TILE_SIZE px JPEG tiles at every
+zoom level, in the Deep Zoom Image layout the viewer understands:
+
+    uploads/fraccionamientos/tiles/<fraccionamiento_id>/<digest>.dzi
+    uploads/fraccionamientos/tiles/<fraccionamiento_id>/<digest>_files/<level>/<col>_<row>.jpg
+
+so the zoom modal only downloads the tiles of the current viewport and zoom
+instead of the whole file. The pyramid is built in a background thread
+right after the upload and recorded in Fraccionamiento.sembrado_tiles when
+complete; until then the plan is shown as uploaded. PDF plans are
+rasterized first (their first page, at RASTER_DPI), so they get the same
+zoomable viewer and overlay as image plans. Builds of the same
+fraccionamiento, from two uploads or two processes, run one after the
+other under its FileLock, each into a temporary directory of its own.
+"""
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import threading
+import pymupdf
+from flask import current_app
+from PIL import Image
+from app.database import db
+from .models import Fraccionamiento
+from .file_lock import FileLock
+
+TILE_SIZE = 256
+OVERLAP = 1
+TILE_FORMAT = 'jpg'
+TILE_QUALITY = 85
+# Relative to the static folder
+TILES_FOLDER = os.path.join('uploads', 'fraccionamientos', 'tiles')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Resolution PDF plans are rasterized at, capped so the longest side fits in RASTER_MAX_SIDE px
+RASTER_DPI = 200
+RASTER_MAX_SIDE = 8192
+
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" '
+    'Overlap="{overlap}" Format="{format}"><Size Width="{width}" Height="{height}"/></Image>\n'
+)
+
+def supported(sembrado):
+    """Whether a pyramid can be built for a sembrado file"""
+    return bool(sembrado) and sembrado.lower().endswith(IMAGE_EXTENSIONS + ('.pdf',))
+
+def open_plan(source):
+    """The plan as an RGB image; the first page of a PDF is rasterized"""
+    if not source.lower().endswith('.pdf'):
+        with Image.open(source) as original:
+            return original.convert('RGB')
+    try:
+        with pymupdf.open(source) as document:
+            page = document[0]
+            zoom = min(RASTER_DPI / 72, RASTER_MAX_SIDE / max(page.rect.width, page.rect.height))
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+    except (RuntimeError, IndexError) as e:
+        # Corrupt, encrypted or empty PDFs
+        raise ValueError(f'No se pudo leer el PDF {source}: {e}') from e
+    return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+def _digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def _tile_boxes(width, height):
+    """(col, row, box) of every tile of a level, boxes including the overlap"""
+    for col in range(math.ceil(width / TILE_SIZE)):
+        for row in range(math.ceil(height / TILE_SIZE)):
+            x, y = col * TILE_SIZE, row * TILE_SIZE
+            yield col, row, (max(x - OVERLAP, 0), max(y - OVERLAP, 0),
+                             min(x + TILE_SIZE + OVERLAP, width), min(y + TILE_SIZE + OVERLAP, height))
+
+def build_pyramid(source, directory, name):
+    """Cut a plan (image or PDF) into a Deep Zoom pyramid <directory>/<name>.dzi; returns (width, height)"""
+    files = os.path.join(directory, f'{name}_files')
+    image = open_plan(source)
+    width, height = image.size
+    max_level = math.ceil(math.log2(max(width, height))) if max(width, height) > 1 else 0
+
+    # Unique per build, so a concurrent build never writes into or removes it
+    temporary = tempfile.mkdtemp(prefix=f'{name}_files.', suffix='.tmp', dir=directory)
+    try:
+        # Top level first; every lower level is the previous one halved
+        level_image = image
+        for level in range(max_level, -1, -1):
+            scale = 2 ** (max_level - level)
+            size = (max(math.ceil(width / scale), 1), max(math.ceil(height / scale), 1))
+            if level_image.size != size:
+                level_image = level_image.resize(size, Image.LANCZOS)
+            level_dir = os.path.join(temporary, str(level))
+            os.makedirs(level_dir)
+            for col, row, box in _tile_boxes(*size):
+                level_image.crop(box).save(os.path.join(level_dir, f'{col}_{row}.{TILE_FORMAT}'),
+                                           quality=TILE_QUALITY)
+
+        # The .dzi goes last: its presence means the tiles are complete
+        shutil.rmtree(files, ignore_errors=True)
+        os.replace(temporary, files)
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+    with open(os.path.join(directory, f'{name}.dzi'), 'w', encoding='utf-8') as f:
+        f.write(DZI_TEMPLATE.format(tile_size=TILE_SIZE, overlap=OVERLAP, format=TILE_FORMAT,
+                                    width=width, height=height))
+    return width, height
+
+def _remove_pyramids(directory, keep=None):
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        if keep is None or not name.startswith(keep):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+def build_tiles(fraccionamiento_id):
+    """Build the pyramid of a fraccionamiento's sembrado; returns the .dzi path or None"""
+    static_folder = current_app.static_folder
+    relative_dir = os.path.join(TILES_FOLDER, str(fraccionamiento_id))
+    directory = os.path.join(static_folder, relative_dir)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    # A build waiting here reads the sembrado once the previous one is done,
+    # so the last upload is the one left
+    with FileLock(directory):
+        fraccionamiento = db.session.get(Fraccionamiento, fraccionamiento_id)
+        if fraccionamiento is None or not supported(fraccionamiento.sembrado):
+            return None
+
+        source = os.path.join(static_folder, fraccionamiento.sembrado)
+        name = _digest(source)
+        os.makedirs(directory, exist_ok=True)
+        width, height = build_pyramid(source, directory, name)
+
+        fraccionamiento.sembrado_tiles = os.path.join(relative_dir, f'{name}.dzi').replace(os.sep, '/')
+        fraccionamiento.sembrado_ancho, fraccionamiento.sembrado_alto = width, height
+        db.session.commit()
+        _remove_pyramids(directory, keep=name)
+        return fraccionamiento.sembrado_tiles
+
+def remove_tiles(fraccionamiento_id):
+    """Delete every pyramid of a fraccionamiento"""
+    directory = os.path.join(current_app.static_folder, TILES_FOLDER, str(fraccionamiento_id))
+    shutil.rmtree(directory, ignore_errors=True)
+
+def build_tiles_in_background(fraccionamiento_id):
+    """Build the pyramid in a thread of its own so the upload request returns right away"""
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                build_tiles(fraccionamiento_id)
+            except (OSError, ValueError):
+                db.session.rollback()
+                app.logger.exception('No se pudo generar el mosaico del sembrado %s', fraccionamiento_id)
+
+    if supported(db.session.get(Fraccionamiento, fraccionamiento_id).sembrado):
+        thread = threading.Thread(target=run, name=f'sembrado-tiles-{fraccionamiento_id}', daemon=True)
+        thread.start()
+        return thread
+    return None
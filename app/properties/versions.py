@@ -0,0 +1,135 @@
+"""Table versions and conditional GET support for the read endpoints.
+
+Every commit bumps the TablaVersion row of each table it wrote to, inside
+the same transaction. The bumps are made just before the commit, after
+its last flush, so each table is bumped once per transaction and the
+'lotes' row every write to the lots shares is locked only for the end of
+it. A view decorated with @versioned_response reads the versions of the
+tables it depends on (one small SELECT), derives a strong ETag and a
+Last-Modified date from them and answers If-None-Match / If-Modified-Since
+with 304 before running its own queries or rendering.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from app.database import db
+from .models import TablaVersion
+
+def bump_versions(connection, tables):
+    """Increment the version of each table on a connection; returns {tabla: new version}"""
+    table = TablaVersion.__table__
+    now = datetime.utcnow()
+    tables = sorted(set(tables))
+    for name in tables:
+        result = connection.execute(
+            update(table).where(table.c.tabla == name)
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(tabla=name, version=1, updated_at=now))
+    # The rows are ours until commit, so these are the versions just written
+    return dict(connection.execute(select(table.c.tabla, table.c.version).where(table.c.tabla.in_(tables))).all())
+
+def defer_versions(session, tables):
+    """Bump the versions of tables when the session commits, in its transaction"""
+    session.info.setdefault('table_versions', set()).update(tables)
+
+def get_versions(tables):
+    """Return {tabla: (version, updated_at)}; unknown tables are at version 0"""
+    rows = db.session.query(TablaVersion.tabla, TablaVersion.version, TablaVersion.updated_at)\
+        .filter(TablaVersion.tabla.in_(tables)).all()
+    versions = {name: (0, None) for name in tables}
+    versions.update({name: (version, updated_at) for name, version, updated_at in rows})
+    return versions
+
+def table_version(name):
+    """Version of a table, as read by @versioned_response for this request when it was"""
+    versions = g.get('table_versions') or {}
+    if name not in versions:
+        versions = get_versions([name])
+    return versions[name][0]
+
+@event.listens_for(Session, 'after_flush')
+def _bump_written_tables(session, flush_context):
+    tables = set()
+    for obj in session.new | session.deleted:
+        tables.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tables.add(obj.__table__.name)
+
+    tables.discard(TablaVersion.__tablename__)
+    if tables:
+        defer_versions(session, tables)
+
+@event.listens_for(Session, 'before_commit')
+def _bump_pending_tables(session):
+    # The commit flushes after this event: flush now so the tables are complete
+    session.flush()
+    tables = session.info.pop('table_versions', None)
+    # {tabla: version} bumped by this commit, for the after_commit listeners (lot_index, live)
+    session.info['committed_versions'] = bump_versions(session.connection(), tables) if tables else {}
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(session):
+    session.info.pop('table_versions', None)
+    session.info.pop('committed_versions', None)
+
+def versioned_response(*tables):
+    """Serve 304 Not Modified while none of the given tables has changed.
+
+    The ETag covers the endpoint, its arguments, the query string, the
+    versions of the tables and the current user, since pages and API
+    payloads differ per user.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Pending flash messages must reach the user, so render normally
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            versions = get_versions(tables)
+            # Read before the view's rows, so they are at least this recent (see table_version)
+            g.table_versions = versions
+            key = repr((
+                request.endpoint,
+                sorted(kwargs.items()),
+                sorted(request.args.items(multi=True)),
+                [versions[name][0] for name in tables],
+                current_user.get_id() if current_user.is_authenticated else None
+            ))
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            modified = [updated_at for _, updated_at in versions.values() if updated_at]
+            last_modified = max(modified).replace(microsecond=0) if modified else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = bool(last_modified and request.if_modified_since and
+                                    last_modified <= request.if_modified_since.replace(tzinfo=None))
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                try:
+                    response = make_response(f(*args, **kwargs))
+                finally:
+                    g.pop('table_versions', None)
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Let browsers keep the copy but always revalidate it
+            response.cache_control.no_cache = True
+            if current_user.is_authenticated:
+                response.cache_control.private = True
+            return response
+        return decorated_function
+    return decorator
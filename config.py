@@ -21,5 +21,36 @@ class Config:
     MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB max per file
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     
+    # Anonymous page cache for the public lot catalog
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 30))  # seconds
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 256))
+    
+    # Memory-mapped lot index shared by the workers (set to '' to disable)
+    LOT_INDEX_PATH = os.environ.get('LOT_INDEX_PATH', os.path.join(basedir, 'instance', 'lot_index.bin'))
+    
+    # Pre-rendered public catalog, must live under app/static (set to '' to disable)
+    CATALOG_SNAPSHOT_FOLDER = os.environ.get('CATALOG_SNAPSHOT_FOLDER',
+                                             os.path.join(basedir, 'app', 'static', 'catalog'))
+    
+    # Cached availability overlays of the sembrados (set to '' to disable)
+    SEMBRADO_OVERLAY_FOLDER = os.environ.get('SEMBRADO_OVERLAY_FOLDER',
+                                             os.path.join(basedir, 'instance', 'sembrado_overlays'))
+    
+    # Default validity of apartado holds in hours (unset: they never expire), and
+    # whether this process runs the scheduler releasing them when due
+    APARTADO_VIGENCIA_HORAS = float(os.environ['APARTADO_VIGENCIA_HORAS']) \
+        if os.environ.get('APARTADO_VIGENCIA_HORAS') else None
+    HOLD_SCHEDULER = os.environ.get('HOLD_SCHEDULER', '1') == '1'
+    
+    # Live lot status: the web processes send lot changes as UDP datagrams to
+    # LIVE_EVENTS_ADDRESS (set to '' to disable) and live_gateway.py, listening
+    # there, streams them to the catalog pages from LIVE_GATEWAY_BIND.
+    # LIVE_EVENTS_URL is the gateway stream as browsers reach it (unset: pages
+    # don't subscribe)
+    LIVE_EVENTS_ADDRESS = os.environ.get('LIVE_EVENTS_ADDRESS', '127.0.0.1:5055')
+    LIVE_GATEWAY_BIND = os.environ.get('LIVE_GATEWAY_BIND', '0.0.0.0:5002')
+    LIVE_GATEWAY_ORIGIN = os.environ.get('LIVE_GATEWAY_ORIGIN', '*')
+    LIVE_EVENTS_URL = os.environ.get('LIVE_EVENTS_URL', '')
+    
     # Application configuration
     APP_NAME = "CRM Inmobiliario"
@@ -0,0 +1,226 @@
+"""Server-sent events gateway for live lot status.
+
+Runs as its own process next to the web app:
+
+    python live_gateway.py
+
+The web processes send every committed lot change as a UDP datagram to
+LIVE_EVENTS_ADDRESS (see app/properties/live.py). This process relays each
+change to the pages subscribed to the lot's fraccionamiento at
+
+    GET /lotes/eventos?fraccionamiento=<id>[&desde=<version>]
+
+as server-sent events. All the connections are served by one asyncio loop,
+so an open catalog page costs an idle socket here instead of a WSGI worker
+or a catalog query per poll. Only the standard library and config.py are
+used; Flask and the database are not touched.
+
+Recent events are kept so a page reconnecting with Last-Event-ID gets what
+it missed. A page connecting for the first time passes the 'lotes' table
+version its rows were read at (desde=<version>, see lotes_catalog and
+snapshots.py), and every event carries the version of its commit, so the
+changes committed between reading the rows and subscribing are replayed
+too. When the events are gone (or the gateway restarted) the page is told
+to reload its rows with a 'reset' event. Pages too slow to keep up, or
+whose connection stops taking data for HEARTBEAT seconds, are disconnected
+and reconnect the same way.
+"""
+import asyncio
+import collections
+import itertools
+import json
+import logging
+from urllib.parse import urlsplit, parse_qs
+from config import Config
+
+STREAM_PATH = '/lotes/eventos'
+HEARTBEAT = 20  # seconds between keep-alive comments
+QUEUE_SIZE = 256  # events waiting per page before it is disconnected
+REPLAY_SIZE = 4096  # recent events kept for reconnecting pages
+RETRY = 3000  # milliseconds before the browser reconnects
+REQUEST_TIMEOUT = 10  # seconds to send the request headers
+
+logger = logging.getLogger('live_gateway')
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+class Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.dropped = False
+
+class Gateway:
+    def __init__(self, origin='*'):
+        self.origin = origin
+        self.subscribers = collections.defaultdict(set)  # fraccionamiento_id -> Subscribers
+        self.recent = collections.deque(maxlen=REPLAY_SIZE)  # (event id, fraccionamiento_id, version, data)
+        self.ids = itertools.count(1)
+        self.last_id = 0
+        # Pages whose rows are older than this 'lotes' version may have missed
+        # events: dropped from recent, or sent before the first one received
+        self.replay_from = None
+        self.max_version = 0
+
+    def dispatch(self, events):
+        """Relay lot events to the pages of their fraccionamientos"""
+        for event in events:
+            fraccionamiento_id = event.get('fraccionamiento_id')
+            version = event.get('version')
+            if not isinstance(version, int):
+                # Unknown to the pages' stamps: only the ones at the latest version have it
+                version = None
+                self.replay_from = self.max_version
+            else:
+                if self.replay_from is None:
+                    self.replay_from = version - 1
+                self.max_version = max(self.max_version, version)
+            if len(self.recent) == self.recent.maxlen and self.recent[0][2] is not None:
+                self.replay_from = max(self.replay_from, self.recent[0][2])
+            self.last_id = next(self.ids)
+            data = json.dumps(event, separators=(',', ':'))
+            self.recent.append((self.last_id, fraccionamiento_id, version, data))
+            for subscriber in list(self.subscribers.get(fraccionamiento_id, ())):
+                try:
+                    subscriber.queue.put_nowait((self.last_id, data))
+                except asyncio.QueueFull:
+                    # Its handler sees the flag with the next event and hangs up
+                    subscriber.dropped = True
+                    self.subscribers[fraccionamiento_id].discard(subscriber)
+
+    def missed(self, fraccionamiento_id, last_event_id):
+        """Events after last_event_id, or None when they are no longer known"""
+        if last_event_id == self.last_id:
+            return []
+        if last_event_id > self.last_id or not self.recent or self.recent[0][0] > last_event_id + 1:
+            return None
+        return [(event_id, data) for event_id, fid, _, data in self.recent
+                if event_id > last_event_id and fid == fraccionamiento_id]
+
+    def missed_since_version(self, fraccionamiento_id, version):
+        """Events newer than the rows of a page read at a 'lotes' version, or None when they are no longer known"""
+        if self.replay_from is not None and version < self.replay_from:
+            return None
+        return [(event_id, data) for event_id, fid, event_version, data in self.recent
+                if fid == fraccionamiento_id and event_version is not None and event_version > version]
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            writer.close()
+            return
+
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        try:
+            fraccionamiento_id = int(query['fraccionamiento'][0])
+        except (KeyError, ValueError):
+            fraccionamiento_id = None
+        if method != 'GET' or url.path != STREAM_PATH or fraccionamiento_id is None:
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await self._close(writer)
+            return
+
+        writer.write((
+            'HTTP/1.1 200 OK\r\n'
+            'Content-Type: text/event-stream\r\n'
+            'Cache-Control: no-cache\r\n'
+            'Connection: keep-alive\r\n'
+            'X-Accel-Buffering: no\r\n'
+            f'Access-Control-Allow-Origin: {self.origin}\r\n'
+            '\r\n'
+            f'retry: {RETRY}\n\n'
+        ).encode('latin-1'))
+        desde = query.get('desde', [''])[0]
+        if headers.get('last-event-id', '').isdigit():
+            missed = self.missed(fraccionamiento_id, int(headers['last-event-id']))
+        elif desde.isdigit():
+            missed = self.missed_since_version(fraccionamiento_id, int(desde))
+        else:
+            missed = []
+        if missed is None:
+            writer.write(f'id: {self.last_id}\nevent: reset\ndata: {{}}\n\n'.encode('utf-8'))
+        else:
+            for event_id, data in missed:
+                writer.write(f'id: {event_id}\ndata: {data}\n\n'.encode('utf-8'))
+            # Without data no event fires, but a reconnect resumes from here
+            writer.write(f'id: {self.last_id}\n\n'.encode('utf-8'))
+
+        subscriber = Subscriber()
+        self.subscribers[fraccionamiento_id].add(subscriber)
+        try:
+            await self._drain(writer)
+            while True:
+                try:
+                    event_id, data = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                else:
+                    if subscriber.dropped:
+                        break
+                    writer.write(f'id: {event_id}\ndata: {data}\n\n'.encode('utf-8'))
+                await self._drain(writer)
+        except asyncio.TimeoutError:
+            # Not reading: closing would wait to flush what it does not take
+            writer.transport.abort()
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers[fraccionamiento_id].discard(subscriber)
+            if not self.subscribers[fraccionamiento_id]:
+                del self.subscribers[fraccionamiento_id]
+            await self._close(writer)
+
+    @staticmethod
+    async def _drain(writer):
+        """Wait for the page to take the data written, HEARTBEAT seconds at most"""
+        await asyncio.wait_for(writer.drain(), HEARTBEAT)
+
+    @staticmethod
+    async def _close(writer):
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+class EventsProtocol(asyncio.DatagramProtocol):
+    """Lot events published by the web processes, a JSON list per datagram"""
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def datagram_received(self, data, addr):
+        try:
+            events = json.loads(data)
+        except ValueError:
+            logger.warning('Datagrama inválido de %s', addr)
+            return
+        self.gateway.dispatch(events if isinstance(events, list) else [events])
+
+async def main():
+    gateway = Gateway(Config.LIVE_GATEWAY_ORIGIN)
+    loop = asyncio.get_running_loop()
+    await loop.create_datagram_endpoint(lambda: EventsProtocol(gateway),
+                                        local_addr=parse_address(Config.LIVE_EVENTS_ADDRESS))
+    server = await asyncio.start_server(gateway.handle, *parse_address(Config.LIVE_GATEWAY_BIND), backlog=1024)
+    logger.info('Eventos en %s, páginas en %s%s', Config.LIVE_EVENTS_ADDRESS, Config.LIVE_GATEWAY_BIND, STREAM_PATH)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,50 @@
+"""Add lote_contadores table and merge lot_assignments head
+
+Revision ID: 0275d08ccf2d
+Revises: 2aca8e5f5372, lot_assignments
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0275d08ccf2d'
+down_revision = ('2aca8e5f5372', 'lot_assignments')
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lote_contadores',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('ambito', sa.String(length=20), nullable=False),
+        sa.Column('ambito_id', sa.Integer(), nullable=False),
+        sa.Column('estado', sa.String(length=50), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('ambito', 'ambito_id', 'estado', name='uq_lote_contadores_ambito_estado')
+    )
+
+    # Backfill from the existing lots
+    op.execute("""
+        INSERT INTO lote_contadores (ambito, ambito_id, estado, total)
+        SELECT 'paquete', paquete_id, estado_del_inmueble, COUNT(*)
+        FROM lotes GROUP BY paquete_id, estado_del_inmueble
+    """)
+    op.execute("""
+        INSERT INTO lote_contadores (ambito, ambito_id, estado, total)
+        SELECT 'prototipo', prototipo_id, estado_del_inmueble, COUNT(*)
+        FROM lotes GROUP BY prototipo_id, estado_del_inmueble
+    """)
+    op.execute("""
+        INSERT INTO lote_contadores (ambito, ambito_id, estado, total)
+        SELECT 'fraccionamiento', paquetes.fraccionamiento_id, lotes.estado_del_inmueble, COUNT(*)
+        FROM lotes JOIN paquetes ON paquetes.id = lotes.paquete_id
+        GROUP BY paquetes.fraccionamiento_id, lotes.estado_del_inmueble
+    """)
+
+
+def downgrade():
+    op.drop_table('lote_contadores')
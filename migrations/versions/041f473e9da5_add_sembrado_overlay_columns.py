@@ -0,0 +1,34 @@
+"""Add sembrado size to fraccionamiento and sembrado_poligono to lotes
+
+Revision ID: 041f473e9da5
+Revises: e3f820b74fb4
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '041f473e9da5'
+down_revision = 'e3f820b74fb4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fraccionamiento', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sembrado_ancho', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('sembrado_alto', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sembrado_poligono', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.drop_column('sembrado_poligono')
+
+    with op.batch_alter_table('fraccionamiento', schema=None) as batch_op:
+        batch_op.drop_column('sembrado_alto')
+        batch_op.drop_column('sembrado_ancho')
@@ -0,0 +1,26 @@
+"""Add sembrado_tiles to fraccionamiento
+
+Revision ID: 216dbd8844e6
+Revises: 041f473e9da5
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '216dbd8844e6'
+down_revision = '041f473e9da5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fraccionamiento', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sembrado_tiles', sa.String(length=200), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('fraccionamiento', schema=None) as batch_op:
+        batch_op.drop_column('sembrado_tiles')
@@ -0,0 +1,28 @@
+"""Add vence_en to lote_asignaciones
+
+Revision ID: 467c7741da7b
+Revises: 4699a727a7ab
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '467c7741da7b'
+down_revision = '4699a727a7ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('lote_asignaciones', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('vence_en', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_lote_asignaciones_estado_vence', ['estado', 'vence_en'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('lote_asignaciones', schema=None) as batch_op:
+        batch_op.drop_index('ix_lote_asignaciones_estado_vence')
+        batch_op.drop_column('vence_en')
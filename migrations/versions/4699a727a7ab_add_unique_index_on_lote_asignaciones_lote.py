@@ -0,0 +1,59 @@
+"""Add unique index on lote_asignaciones.lote_id
+
+Lots assigned more than once before the index existed keep their first
+assignment; the later ones are closed into lote_asignaciones_historial
+with motivo 'Asignación duplicada', so the double booking stays on record.
+
+Revision ID: 4699a727a7ab
+Revises: 73100f967ca7
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4699a727a7ab'
+down_revision = '73100f967ca7'
+branch_labels = None
+depends_on = None
+
+
+DUPLICATE_MOTIVO = 'Asignación duplicada'
+
+asignaciones = sa.table(
+    'lote_asignaciones',
+    sa.column('id', sa.Integer), sa.column('lote_id', sa.Integer), sa.column('client_id', sa.Integer),
+    sa.column('user_id', sa.Integer), sa.column('fecha_asignacion', sa.DateTime),
+    sa.column('estado', sa.String), sa.column('notas', sa.Text)
+)
+historial = sa.table(
+    'lote_asignaciones_historial',
+    sa.column('lote_id', sa.Integer), sa.column('client_id', sa.Integer), sa.column('user_id', sa.Integer),
+    sa.column('fecha_inicio', sa.DateTime), sa.column('fecha_fin', sa.DateTime),
+    sa.column('estado', sa.String), sa.column('motivo_cambio', sa.String), sa.column('notas', sa.Text)
+)
+
+
+def upgrade():
+    connection = op.get_bind()
+    first = sa.select(sa.func.min(asignaciones.c.id)).group_by(asignaciones.c.lote_id)
+    duplicates = connection.execute(
+        sa.select(asignaciones).where(asignaciones.c.id.not_in(first)).order_by(asignaciones.c.id)
+    ).all()
+    if duplicates:
+        now = datetime.utcnow()
+        connection.execute(historial.insert(), [{
+            'lote_id': row.lote_id, 'client_id': row.client_id, 'user_id': row.user_id,
+            'fecha_inicio': row.fecha_asignacion or now, 'fecha_fin': now, 'estado': row.estado,
+            'motivo_cambio': DUPLICATE_MOTIVO, 'notas': row.notas
+        } for row in duplicates])
+        connection.execute(asignaciones.delete().where(asignaciones.c.id.in_([row.id for row in duplicates])))
+
+    op.create_index('uq_lote_asignaciones_lote', 'lote_asignaciones', ['lote_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_lote_asignaciones_lote', table_name='lote_asignaciones')
@@ -0,0 +1,31 @@
+"""Add tabla_versiones table
+
+Revision ID: 6e891f130406
+Revises: 0275d08ccf2d
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e891f130406'
+down_revision = '0275d08ccf2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tabla_versiones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tabla', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('tabla')
+    )
+
+
+def downgrade():
+    op.drop_table('tabla_versiones')
@@ -0,0 +1,63 @@
+"""Add busquedas_guardadas and notificaciones tables
+
+Revision ID: 73100f967ca7
+Revises: a12f5752f173
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '73100f967ca7'
+down_revision = 'a12f5752f173'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('busquedas_guardadas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=True),
+        sa.Column('nombre', sa.String(length=100), nullable=False),
+        sa.Column('fraccionamiento_id', sa.Integer(), nullable=False),
+        sa.Column('prototipo_id', sa.Integer(), nullable=True),
+        sa.Column('tipo_de_lote', sa.String(length=50), nullable=True),
+        sa.Column('precio_min', sa.Float(), nullable=True),
+        sa.Column('precio_max', sa.Float(), nullable=True),
+        sa.Column('banda_min', sa.Integer(), nullable=False),
+        sa.Column('banda_max', sa.Integer(), nullable=False),
+        sa.Column('activa', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['client.id'], ),
+        sa.ForeignKeyConstraint(['fraccionamiento_id'], ['fraccionamiento.id'], ),
+        sa.ForeignKeyConstraint(['prototipo_id'], ['prototipos.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_busquedas_guardadas_bucket', 'busquedas_guardadas',
+                    ['fraccionamiento_id', 'prototipo_id', 'banda_min'], unique=False)
+    op.create_table('notificaciones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('busqueda_id', sa.Integer(), nullable=True),
+        sa.Column('lote_id', sa.Integer(), nullable=True),
+        sa.Column('mensaje', sa.String(length=255), nullable=False),
+        sa.Column('leida', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['busqueda_id'], ['busquedas_guardadas.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['lote_id'], ['lotes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notificaciones_user_leida', 'notificaciones',
+                    ['user_id', 'leida', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notificaciones_user_leida', table_name='notificaciones')
+    op.drop_table('notificaciones')
+    op.drop_index('ix_busquedas_guardadas_bucket', table_name='busquedas_guardadas')
+    op.drop_table('busquedas_guardadas')
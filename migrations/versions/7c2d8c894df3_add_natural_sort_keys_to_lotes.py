@@ -0,0 +1,104 @@
+"""Add natural sort keys to lotes
+
+Revision ID: 7c2d8c894df3
+Revises: 6e891f130406
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d8c894df3'
+down_revision = '6e891f130406'
+branch_labels = None
+depends_on = None
+
+# Frozen copy of app/properties/sorting.py so the migration does not depend
+# on application code that may change later
+UNKNOWN_SORT_KEY = 999999
+LETTER_SORT_KEY = 900000
+ROMAN_PATTERN = re.compile(r'^M{0,3}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})$')
+ROMAN_VALUES = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000}
+
+
+def roman_to_int(value):
+    if not value or not ROMAN_PATTERN.match(value):
+        return None
+    total = 0
+    for current, following in zip(value, value[1:] + ' '):
+        digit = ROMAN_VALUES[current]
+        total += -digit if ROMAN_VALUES.get(following, 0) > digit else digit
+    return total
+
+
+def _tokens(manzana):
+    return re.split(r'[\s.\-]+', manzana.strip().upper())
+
+
+def uses_roman_numerals(manzanas):
+    return any(len(token) > 1 and roman_to_int(token) is not None
+               for manzana in manzanas if manzana for token in _tokens(manzana))
+
+
+def manzana_sort_key(manzana, roman=False):
+    if not manzana:
+        return UNKNOWN_SORT_KEY
+    for token in reversed(_tokens(manzana)):
+        if token.isdigit():
+            return int(token)
+        value = roman_to_int(token) if len(token) > 1 or roman else None
+        if value is not None:
+            return value
+        if len(token) == 1 and 'A' <= token <= 'Z':
+            return LETTER_SORT_KEY + ord(token) - ord('A')
+    return UNKNOWN_SORT_KEY
+
+
+def lote_sort_key(lote):
+    match = re.search(r'\d+', lote or '')
+    return int(match.group()) if match else UNKNOWN_SORT_KEY
+
+
+def upgrade():
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('manzana_orden', sa.Integer(), nullable=False,
+                                      server_default=str(UNKNOWN_SORT_KEY)))
+        batch_op.add_column(sa.Column('lote_orden', sa.Integer(), nullable=False,
+                                      server_default=str(UNKNOWN_SORT_KEY)))
+
+    # Backfill one key per distinct paquete and manzana, and per distinct lote,
+    # instead of per row
+    connection = op.get_bind()
+    lotes = sa.table('lotes',
+        sa.column('paquete_id', sa.Integer),
+        sa.column('manzana', sa.String),
+        sa.column('lote', sa.String),
+        sa.column('manzana_orden', sa.Integer),
+        sa.column('lote_orden', sa.Integer)
+    )
+    paquetes = {}
+    for paquete_id, manzana in connection.execute(sa.select(lotes.c.paquete_id, lotes.c.manzana).distinct()):
+        paquetes.setdefault(paquete_id, []).append(manzana)
+    for paquete_id, manzanas in paquetes.items():
+        roman = uses_roman_numerals(manzanas)
+        for manzana in manzanas:
+            connection.execute(
+                lotes.update()
+                .where(lotes.c.paquete_id == paquete_id, lotes.c.manzana == manzana)
+                .values(manzana_orden=manzana_sort_key(manzana, roman))
+            )
+    for (lote,) in connection.execute(sa.select(lotes.c.lote).distinct()).all():
+        connection.execute(lotes.update().where(lotes.c.lote == lote).values(lote_orden=lote_sort_key(lote)))
+
+    op.create_index('ix_lotes_paquete_orden', 'lotes',
+                    ['paquete_id', 'manzana_orden', 'lote_orden', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_lotes_paquete_orden', table_name='lotes')
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.drop_column('lote_orden')
+        batch_op.drop_column('manzana_orden')
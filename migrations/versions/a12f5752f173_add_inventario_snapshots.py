@@ -0,0 +1,42 @@
+"""Add inventario_snapshots table and time window indexes
+
+Revision ID: a12f5752f173
+Revises: e57b60f15f0e
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a12f5752f173'
+down_revision = 'e57b60f15f0e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inventario_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('fraccionamiento_id', sa.Integer(), nullable=False),
+        sa.Column('tomado_en', sa.DateTime(), nullable=False),
+        sa.Column('total_lotes', sa.Integer(), nullable=False),
+        sa.Column('datos', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['fraccionamiento_id'], ['fraccionamiento.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_inventario_snapshots_fraccionamiento_fecha', 'inventario_snapshots',
+                    ['fraccionamiento_id', 'tomado_en'], unique=False)
+    op.create_index('ix_lote_asignaciones_fecha', 'lote_asignaciones', ['fecha_asignacion'], unique=False)
+    op.create_index('ix_lote_asignaciones_historial_periodo', 'lote_asignaciones_historial',
+                    ['fecha_fin', 'fecha_inicio'], unique=False)
+    op.create_index('ix_lote_precio_historial_fecha', 'lote_precio_historial', ['fecha'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_lote_precio_historial_fecha', table_name='lote_precio_historial')
+    op.drop_index('ix_lote_asignaciones_historial_periodo', table_name='lote_asignaciones_historial')
+    op.drop_index('ix_lote_asignaciones_fecha', table_name='lote_asignaciones')
+    op.drop_index('ix_inventario_snapshots_fraccionamiento_fecha', table_name='inventario_snapshots')
+    op.drop_table('inventario_snapshots')
@@ -0,0 +1,40 @@
+"""Add reglas_precio table
+
+Revision ID: d3077eb8dfb9
+Revises: 216dbd8844e6
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3077eb8dfb9'
+down_revision = '216dbd8844e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reglas_precio',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('fraccionamiento_id', sa.Integer(), nullable=False),
+        sa.Column('paquete_id', sa.Integer(), nullable=True),
+        sa.Column('concepto', sa.String(length=30), nullable=False),
+        sa.Column('tipo_de_lote', sa.String(length=50), nullable=True),
+        sa.Column('valor', sa.Float(), nullable=False),
+        sa.Column('es_porcentaje', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['fraccionamiento_id'], ['fraccionamiento.id'], ),
+        sa.ForeignKeyConstraint(['paquete_id'], ['paquetes.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_reglas_precio_fraccionamiento', 'reglas_precio',
+                    ['fraccionamiento_id', 'paquete_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_reglas_precio_fraccionamiento', table_name='reglas_precio')
+    op.drop_table('reglas_precio')
@@ -0,0 +1,42 @@
+"""Add fraccionamiento_id to lotes
+
+Revision ID: d769ddba6a54
+Revises: 7c2d8c894df3
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd769ddba6a54'
+down_revision = '7c2d8c894df3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fraccionamiento_id', sa.Integer(), nullable=True))
+
+    # Backfill from each lot's paquete in a single statement
+    op.execute(
+        'UPDATE lotes SET fraccionamiento_id = '
+        '(SELECT paquetes.fraccionamiento_id FROM paquetes WHERE paquetes.id = lotes.paquete_id)'
+    )
+
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.alter_column('fraccionamiento_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_lotes_fraccionamiento_id', 'fraccionamiento',
+                                    ['fraccionamiento_id'], ['id'])
+        batch_op.create_index('ix_lotes_fraccionamiento_orden',
+                              ['fraccionamiento_id', 'paquete_id', 'manzana_orden', 'lote_orden', 'id'],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.drop_index('ix_lotes_fraccionamiento_orden')
+        batch_op.drop_constraint('fk_lotes_fraccionamiento_id', type_='foreignkey')
+        batch_op.drop_column('fraccionamiento_id')
@@ -0,0 +1,119 @@
+"""Add lote_linderos table and perimetro/frente to lotes
+
+Revision ID: de690a83d934
+Revises: d769ddba6a54
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'de690a83d934'
+down_revision = 'd769ddba6a54'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Frozen copy of app/properties/linderos.py so the migration does not depend
+# on application code that may change later
+NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+STREET_WORDS = ('calle', 'av', 'avenida', 'blvd', 'boulevard', 'privada', 'priv',
+                'circuito', 'cerrada', 'andador', 'vialidad', 'carretera', 'camino')
+
+
+def parse_longitud(medidas):
+    longitudes = [float(value.replace(',', '.')) for value in NUMBER.findall(medidas or '')]
+    return sum(longitudes) if longitudes else None
+
+
+def borders_street(colindancia, calle=None):
+    text = (colindancia or '').strip().lower()
+    if not text:
+        return False
+    if calle and calle.strip().lower() in text:
+        return True
+    return re.split(r'[\s.]+', text)[0] in STREET_WORDS
+
+
+def upgrade():
+    op.create_table('lote_linderos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('lote_id', sa.Integer(), nullable=False),
+        sa.Column('lado', sa.Integer(), nullable=False),
+        sa.Column('orientacion', sa.String(length=50), nullable=True),
+        sa.Column('medidas', sa.String(length=50), nullable=True),
+        sa.Column('colindancia', sa.String(length=100), nullable=True),
+        sa.Column('longitud', sa.Float(), nullable=True),
+        sa.Column('es_frente', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['lote_id'], ['lotes.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('lote_id', 'lado', name='uq_lote_linderos_lote_lado')
+    )
+    op.create_index('ix_lote_linderos_orientacion_longitud', 'lote_linderos',
+                    ['orientacion', 'longitud'], unique=False)
+
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('perimetro', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('frente', sa.Float(), nullable=True))
+        batch_op.create_index('ix_lotes_fraccionamiento_frente', ['fraccionamiento_id', 'frente'], unique=False)
+
+    # Parse the existing lots in id order, one batch at a time
+    connection = op.get_bind()
+    sides = [(f'orientacion_{lado}', f'medidas_orientacion_{lado}', f'colindancia_{lado}') for lado in range(1, 5)]
+    lotes = sa.table('lotes', sa.column('id', sa.Integer), sa.column('calle', sa.String),
+                     sa.column('perimetro', sa.Float), sa.column('frente', sa.Float),
+                     *[sa.column(name, sa.String) for side in sides for name in side])
+    linderos = sa.table('lote_linderos', *[sa.column(name) for name in (
+        'lote_id', 'lado', 'orientacion', 'medidas', 'colindancia', 'longitud', 'es_frente')])
+    update = lotes.update().where(lotes.c.id == sa.bindparam('lote_id'))\
+        .values(perimetro=sa.bindparam('nuevo_perimetro'), frente=sa.bindparam('nuevo_frente'))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(lotes).where(lotes.c.id > last_id).order_by(lotes.c.id).limit(BATCH_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+
+        lindero_rows, lote_rows = [], []
+        for row in rows:
+            longitudes, frentes = [], []
+            for lado, (orientacion, medidas, colindancia) in enumerate(sides, 1):
+                if not any([row[orientacion], row[medidas], row[colindancia]]):
+                    continue
+                longitud = parse_longitud(row[medidas])
+                es_frente = borders_street(row[colindancia], row['calle'])
+                lindero_rows.append({
+                    'lote_id': row['id'], 'lado': lado, 'orientacion': row[orientacion],
+                    'medidas': row[medidas], 'colindancia': row[colindancia],
+                    'longitud': longitud, 'es_frente': es_frente
+                })
+                if longitud is not None:
+                    longitudes.append(longitud)
+                    if es_frente:
+                        frentes.append(longitud)
+            lote_rows.append({
+                'lote_id': row['id'],
+                'nuevo_perimetro': sum(longitudes) if longitudes else None,
+                'nuevo_frente': max(frentes) if frentes else None
+            })
+
+        if lindero_rows:
+            connection.execute(linderos.insert(), lindero_rows)
+        connection.execute(update, lote_rows)
+        last_id = rows[-1]['id']
+
+
+def downgrade():
+    with op.batch_alter_table('lotes', schema=None) as batch_op:
+        batch_op.drop_index('ix_lotes_fraccionamiento_frente')
+        batch_op.drop_column('frente')
+        batch_op.drop_column('perimetro')
+
+    op.drop_index('ix_lote_linderos_orientacion_longitud', table_name='lote_linderos')
+    op.drop_table('lote_linderos')
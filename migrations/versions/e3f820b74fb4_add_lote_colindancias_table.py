@@ -0,0 +1,84 @@
+"""Add lote_colindancias adjacency table
+
+Revision ID: e3f820b74fb4
+Revises: de690a83d934
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+import re
+from collections import defaultdict
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3f820b74fb4'
+down_revision = 'de690a83d934'
+branch_labels = None
+depends_on = None
+
+# Frozen copies of lote_sort_key and parse_vecinos so the migration does not
+# depend on application code that may change later
+LEADING_NUMBER = re.compile(r'\d+')
+LOTE_REFERENCE = re.compile(
+    r'\blotes?\s*(?:n[úu]m(?:ero)?s?\.?|no\.?|n[°º]\.?|#)?\s*(\d+(?:\s*(?:,|y)\s*\d+)*)',
+    re.IGNORECASE
+)
+
+
+def lote_sort_key(lote):
+    match = LEADING_NUMBER.search(lote or '')
+    return int(match.group()) if match else 999999
+
+
+def parse_vecinos(colindancia):
+    numbers = []
+    for match in LOTE_REFERENCE.finditer(colindancia or ''):
+        numbers.extend(int(number) for number in re.findall(r'\d+', match.group(1)))
+    return numbers
+
+
+def upgrade():
+    op.create_table('lote_colindancias',
+        sa.Column('lote_id', sa.Integer(), nullable=False),
+        sa.Column('vecino_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['lote_id'], ['lotes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['vecino_id'], ['lotes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('lote_id', 'vecino_id')
+    )
+    op.create_index('ix_lote_colindancias_vecino', 'lote_colindancias', ['vecino_id'], unique=False)
+
+    # Build the edges one (paquete, manzana) group at a time
+    connection = op.get_bind()
+    colindancias = [f'colindancia_{lado}' for lado in range(1, 5)]
+    lotes = sa.table('lotes', sa.column('id', sa.Integer), sa.column('paquete_id', sa.Integer),
+                     sa.column('manzana', sa.String), sa.column('lote', sa.String),
+                     *[sa.column(name, sa.String) for name in colindancias])
+    edges_table = sa.table('lote_colindancias', sa.column('lote_id'), sa.column('vecino_id'))
+
+    groups = connection.execute(sa.select(lotes.c.paquete_id, lotes.c.manzana).distinct()).all()
+    for paquete_id, manzana in groups:
+        rows = connection.execute(
+            sa.select(lotes.c.id, lotes.c.lote, *[lotes.c[name] for name in colindancias])
+            .where(lotes.c.paquete_id == paquete_id, lotes.c.manzana == manzana)
+        ).all()
+        by_number = defaultdict(list)
+        for row in rows:
+            by_number[lote_sort_key(row[1])].append(row[0])
+
+        edges = set()
+        for row in rows:
+            for colindancia in row[2:]:
+                for number in parse_vecinos(colindancia):
+                    for vecino_id in by_number.get(number, ()):
+                        if vecino_id != row[0]:
+                            edges.add((row[0], vecino_id))
+                            edges.add((vecino_id, row[0]))
+        if edges:
+            connection.execute(edges_table.insert(),
+                               [{'lote_id': a, 'vecino_id': b} for a, b in sorted(edges)])
+
+
+def downgrade():
+    op.drop_index('ix_lote_colindancias_vecino', table_name='lote_colindancias')
+    op.drop_table('lote_colindancias')
@@ -0,0 +1,54 @@
+"""Add revisiones_precio and lote_precio_historial tables
+
+Revision ID: e57b60f15f0e
+Revises: d3077eb8dfb9
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e57b60f15f0e'
+down_revision = 'd3077eb8dfb9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revisiones_precio',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.DateTime(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('valor', sa.Float(), nullable=True),
+        sa.Column('fraccionamiento_id', sa.Integer(), nullable=True),
+        sa.Column('paquete_id', sa.Integer(), nullable=True),
+        sa.Column('prototipo_id', sa.Integer(), nullable=True),
+        sa.Column('total_lotes', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['fraccionamiento_id'], ['fraccionamiento.id'], ),
+        sa.ForeignKeyConstraint(['paquete_id'], ['paquetes.id'], ),
+        sa.ForeignKeyConstraint(['prototipo_id'], ['prototipos.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('lote_precio_historial',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('lote_id', sa.Integer(), nullable=False),
+        sa.Column('revision_id', sa.Integer(), nullable=True),
+        sa.Column('fecha', sa.DateTime(), nullable=False),
+        sa.Column('precio_anterior', sa.Float(), nullable=False),
+        sa.Column('precio_nuevo', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['lote_id'], ['lotes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['revision_id'], ['revisiones_precio.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_lote_precio_historial_lote_fecha', 'lote_precio_historial',
+                    ['lote_id', 'fecha'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_lote_precio_historial_lote_fecha', table_name='lote_precio_historial')
+    op.drop_table('lote_precio_historial')
+    op.drop_table('revisiones_precio')
@@ -0,0 +1,109 @@
+import pytest
+from flask import g
+from sqlalchemy import insert
+from config import Config
+from app import create_app
+from app.database import db
+from app.auth.models import User, UserRole
+from app.clients.models import Client
+from app.properties.models import Prototipo, Fraccionamiento, Paquete, Lote
+from app.properties import analytics
+from app.properties.page_cache import cache as page_cache
+from app.properties.reference_cache import cache as reference_cache
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SECRET_KEY = 'test'
+        # A file, so threads get connections of their own to the same database
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        LOT_INDEX_PATH = ''
+        CATALOG_SNAPSHOT_FOLDER = ''
+        SEMBRADO_OVERLAY_FOLDER = ''
+        HOLD_SCHEDULER = False
+        LIVE_EVENTS_ADDRESS = ''
+
+    app = create_app(TestConfig)
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Process-wide caches outlive the database of the previous test
+    page_cache.purge()
+    reference_cache.clear()
+    analytics._current = None
+
+    @app.teardown_request
+    def forget_user(exc):
+        # Requests share the app context of the test, and so flask.g
+        g.pop('_login_user', None)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def admin(app):
+    user = User(username='admin', email='admin@example.com', nombre='Ana', apellido_paterno='Pérez',
+                apellido_materno='López', role=UserRole.ADMIN.value)
+    user.set_password('secreto')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def login(client):
+    """Log a user into the test client"""
+    def log_in(user):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+    return log_in
+
+@pytest.fixture
+def buyer(admin):
+    buyer = Client(nombre='Carlos', apellido_paterno='Ruiz', apellido_materno='Soto', celular='5512345678',
+                   assigned_user_id=admin.id)
+    db.session.add(buyer)
+    db.session.commit()
+    return buyer
+
+@pytest.fixture
+def inventory(app):
+    """Build a fraccionamiento with lotes lots spread over paquetes paquetes.
+
+    The lots are inserted in bulk with Core, so no flush listener sees them;
+    the counters are rebuilt afterwards. Returns (fraccionamiento, paquetes,
+    prototipo, lote_ids).
+    """
+    def build(lotes, paquetes=1, estado='Libre'):
+        prototipo = Prototipo(nombre_prototipo='Alba', superficie_terreno=90, superficie_construccion=60,
+                              niveles=1, recamaras=2, banos=1, precio=850000)
+        fraccionamiento = Fraccionamiento(nombre='Las Lomas')
+        db.session.add_all([prototipo, fraccionamiento])
+        db.session.flush()
+        created = [Paquete(nombre=f'Paquete {n + 1}', fraccionamiento_id=fraccionamiento.id)
+                   for n in range(paquetes)]
+        db.session.add_all(created)
+        db.session.flush()
+        rows = [{
+            'paquete_id': created[n % paquetes].id, 'prototipo_id': prototipo.id,
+            'fraccionamiento_id': fraccionamiento.id, 'calle': 'Encino', 'numero_exterior': n + 1,
+            'manzana': str(n // 40 + 1), 'lote': str(n % 40 + 1), 'manzana_orden': n // 40 + 1,
+            'lote_orden': n % 40 + 1, 'terreno': 90 + n % 30, 'tipo_de_lote': 'Regular',
+            'estado_del_inmueble': estado, 'precio': 850000 + (n % 30) * 1000
+        } for n in range(lotes)]
+        for start in range(0, len(rows), 5000):
+            db.session.execute(insert(Lote.__table__), rows[start:start + 5000])
+        db.session.commit()
+
+        from app.properties.counters import reconcile
+        reconcile()
+        lote_ids = [lote_id for (lote_id,) in db.session.query(Lote.id).order_by(Lote.id)]
+        return fraccionamiento, created, prototipo, lote_ids
+    return build
@@ -0,0 +1,40 @@
+from sqlalchemy import update
+from app.database import db
+from app.properties.adjacency import contiguous_groups
+from app.properties.models import Lote
+
+def neighbourhood(inventory):
+    """Lots 1 to 8 of one manzana: 1-2-3 and 2-4 touch, 5-6 touch, 7-8 touch but 8 is Apartado"""
+    fraccionamiento, _, _, lote_ids = inventory(8)
+    lotes = [db.session.get(Lote, lote_id) for lote_id in lote_ids]
+    lotes[0].colindancia_1 = 'Lote Número 02'
+    lotes[1].colindancia_2 = 'Lotes 03 y 04 Respectivamente'
+    # Either direction is enough
+    lotes[5].colindancia_3 = 'Lote No. 5'
+    lotes[6].colindancia_1 = 'Lote #8'
+    db.session.commit()
+    db.session.execute(update(Lote.__table__).where(Lote.id == lote_ids[7]).values(estado_del_inmueble='Apartado'))
+    db.session.commit()
+    return fraccionamiento, lote_ids
+
+def test_groups_are_connected_components(app, inventory):
+    fraccionamiento, ids = neighbourhood(inventory)
+    assert contiguous_groups(2, fraccionamiento_id=fraccionamiento.id) == [(ids[:2], 4), (ids[4:6], 2)]
+    # Breadth-first from lot 1: its neighbour 2, then 2's neighbours 3 and 4
+    assert contiguous_groups(4, fraccionamiento_id=fraccionamiento.id) == [(ids[:4], 4)]
+    assert contiguous_groups(5, fraccionamiento_id=fraccionamiento.id) == []
+
+    db.session.execute(update(Lote.__table__).where(Lote.id == ids[1]).values(estado_del_inmueble='Titulado'))
+    db.session.commit()
+    # Without lot 2 the first block falls apart
+    assert contiguous_groups(2, fraccionamiento_id=fraccionamiento.id) == [(ids[4:6], 2)]
+
+def test_groups_are_limited(app, client, inventory):
+    fraccionamiento, ids = neighbourhood(inventory)
+    assert contiguous_groups(2, fraccionamiento_id=fraccionamiento.id, limit=1) == [(ids[:2], 4)]
+
+    url = f'/properties/api/lotes/contiguos?fraccionamiento={fraccionamiento.id}'
+    data = client.get(url + '&limite=1').get_json()
+    assert data['hay_mas'] and [[lote['id'] for lote in grupo['lotes']] for grupo in data['grupos']] == [ids[:2]]
+    data = client.get(url).get_json()
+    assert not data['hay_mas'] and len(data['grupos']) == 2
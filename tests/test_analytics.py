@@ -0,0 +1,43 @@
+from sqlalchemy import update
+from app.database import db
+from app.properties import analytics
+from app.properties.models import Lote
+
+def test_price_distribution(app, inventory):
+    # 30 lots: terreno 90..119 m², precio 850,000..879,000
+    fraccionamiento, _, _, lote_ids = inventory(30)
+    db.session.execute(update(Lote).where(Lote.id.in_(lote_ids[:10])).values(tipo_de_lote='Esquina'))
+    db.session.commit()
+
+    report = analytics.price_distribution(fraccionamiento_id=fraccionamiento.id, group='tipo_de_lote',
+                                          percentiles=(0, 50, 100), bins=3)
+    per_m2 = sorted((850000 + n * 1000) / (90 + n) for n in range(30))
+    assert report['lotes'] == 30
+    assert report['percentiles_m2'] == {'0': round(per_m2[0], 2), '50': round((per_m2[14] + per_m2[15]) / 2, 2),
+                                        '100': round(per_m2[-1], 2)}
+    assert sum(bin['lotes'] for bin in report['histograma_m2']) == 30
+    assert [(grupo['grupo'], grupo['lotes']) for grupo in report['grupos']] == [('Esquina', 10), ('Regular', 20)]
+    assert analytics.price_distribution(estado='Titulado')['lotes'] == 0
+
+def test_simulation_applies_the_first_matching_adjustment(app, inventory):
+    fraccionamiento, _, prototipo, lote_ids = inventory(4)
+    db.session.execute(update(Lote).values(precio=1000000))
+    db.session.execute(update(Lote).where(Lote.id == lote_ids[0]).values(tipo_de_lote='Esquina'))
+    db.session.commit()
+
+    result = analytics.simulate([{'tipo_de_lote': 'Esquina', 'porcentaje': 10},
+                                 {'prototipo_id': prototipo.id, 'monto': -50000}],
+                                fraccionamiento_id=fraccionamiento.id)
+    assert result['valor_actual'] == 4000000
+    assert result['valor_proyectado'] == 1100000 + 3 * 950000
+    assert [ajuste['lotes'] for ajuste in result['ajustes']] == [1, 3]
+
+def test_selections_are_cached_until_lots_change(app, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(5)
+    columns = analytics.get_columns()
+    assert columns.select(fraccionamiento.id, 'Libre') is columns.select(fraccionamiento.id, 'Libre')
+
+    db.session.get(Lote, lote_ids[0]).estado_del_inmueble = 'Apartado'
+    db.session.commit()
+    assert analytics.get_columns() is not columns
+    assert len(analytics.get_columns().select(fraccionamiento.id, 'Libre')) == 4
@@ -0,0 +1,57 @@
+from collections import Counter
+import pytest
+from sqlalchemy import event
+from app.database import db
+from app.properties import counters
+from app.properties.counters import apply_deltas, get_counts, lot_delta
+from app.properties.models import Lote
+
+def test_deltas_are_applied_in_key_order(app):
+    written = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        written.append(tuple(parameters[:3]))
+
+    # A release: the Apartado rows come first in the Counter
+    deltas = Counter()
+    lot_delta(deltas, 3, 2, 1, 'Apartado', -1)
+    lot_delta(deltas, 3, 2, 1, 'Libre', 1)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        apply_deltas(db.session.connection(), deltas)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert written == sorted(written)
+    assert written[0] == ('fraccionamiento', 2, 'Apartado')
+
+def test_deltas_upsert_counter_rows(app):
+    deltas = Counter({('paquete', 7, 'Libre'): 2})
+    apply_deltas(db.session.connection(), deltas)
+    apply_deltas(db.session.connection(), deltas)
+    apply_deltas(db.session.connection(), Counter({('paquete', 7, 'Libre'): -1}))
+    db.session.commit()
+    assert get_counts('paquete') == {7: {'Libre': 3}}
+
+def test_lot_writes_keep_counters_in_sync(app, inventory):
+    fraccionamiento, paquetes, _, lote_ids = inventory(5)
+    lote = db.session.get(Lote, lote_ids[0])
+    lote.estado_del_inmueble = 'Titulado'
+    db.session.delete(db.session.get(Lote, lote_ids[1]))
+    db.session.commit()
+    assert get_counts('fraccionamiento') == {fraccionamiento.id: {'Libre': 3, 'Titulado': 1}}
+    assert get_counts('paquete') == {paquetes[0].id: {'Libre': 3, 'Titulado': 1}}
+
+def test_lot_writes_fail_with_their_counters(app, inventory, monkeypatch):
+    fraccionamiento, _, _, lote_ids = inventory(3)
+
+    def broken(connection, deltas):
+        raise RuntimeError('contadores bloqueados')
+
+    monkeypatch.setattr(counters, 'apply_deltas', broken)
+    db.session.get(Lote, lote_ids[0]).estado_del_inmueble = 'Apartado'
+    with pytest.raises(RuntimeError):
+        db.session.commit()
+    db.session.rollback()
+    # One transaction: no lot change without its counters
+    assert db.session.get(Lote, lote_ids[0]).estado_del_inmueble == 'Libre'
+    assert get_counts('fraccionamiento') == {fraccionamiento.id: {'Libre': 3}}
@@ -0,0 +1,52 @@
+import os
+from datetime import datetime, timedelta
+from app.database import db
+from app.properties import holds, snapshots
+from app.properties.models import LoteAsignacion
+from app.properties.reservations import reserve_many
+
+def expired_holds(lote_ids, client, user):
+    reserve_many(lote_ids, client, user, vence_en=datetime.utcnow() - timedelta(minutes=1))
+    db.session.commit()
+
+def test_a_failing_lot_does_not_hold_back_the_batch(app, admin, buyer, inventory, monkeypatch):
+    _, _, _, lote_ids = inventory(5)
+    expired_holds(lote_ids, buyer, admin)
+    release_many = holds.release_many
+
+    def failing(ids, **kwargs):
+        if lote_ids[2] in ids:
+            raise RuntimeError('database is locked')
+        return release_many(ids, **kwargs)
+
+    monkeypatch.setattr(holds, 'release_many', failing)
+    # A batch smaller than the holds due, so the failed lot would be read again
+    assert holds.release_expired(batch_size=2) == 4
+    assert [asignacion.lote_id for asignacion in LoteAsignacion.query] == [lote_ids[2]]
+
+def test_scheduler_backs_off_while_holds_stay_due(app):
+    scheduler = holds.HoldScheduler(app)
+    now = datetime(2026, 1, 1)
+    for delay in (holds.RETRY_DELAY, holds.RETRY_DELAY * 2, holds.RETRY_DELAY * 4):
+        scheduler.deadlines = []
+        scheduler._plan(now - timedelta(minutes=1), now=now)
+        assert scheduler.deadlines == [now + timedelta(seconds=delay)]
+
+    # A sweep that leaves nothing due resets the delay
+    scheduler.deadlines = []
+    scheduler._plan(now + timedelta(hours=1), now=now)
+    assert scheduler.deadlines == [now + timedelta(hours=1)] and scheduler.retry_delay == holds.RETRY_DELAY
+
+def test_expired_holds_reach_the_static_catalog(app, admin, buyer, inventory):
+    app.config['CATALOG_SNAPSHOT_FOLDER'] = os.path.join(app.static_folder, 'catalog-test')
+    try:
+        fraccionamiento, _, _, lote_ids = inventory(2)
+        expired_holds(lote_ids[:1], buyer, admin)
+        assert holds.release_expired() == 1
+        snapshots.get_worker(app).wait()
+        path = os.path.join(app.config['CATALOG_SNAPSHOT_FOLDER'], str(fraccionamiento.id), 'lotes.json')
+        with open(path, encoding='utf-8') as f:
+            assert '"Apartado"' not in f.read()
+    finally:
+        snapshots.get_worker(app).wait()
+        snapshots.shutil.rmtree(app.config['CATALOG_SNAPSHOT_FOLDER'], ignore_errors=True)
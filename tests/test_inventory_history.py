@@ -0,0 +1,85 @@
+from datetime import datetime
+from sqlalchemy import insert, update
+from app.database import db
+from app.properties.inventory_history import inventory_as_of, take_snapshot
+from app.properties.models import Lote, LoteAsignacion, LoteAsignacionHistorial, LotePrecioHistorial
+from app.properties.reservations import release_many, reserve
+
+def day(number, hour=0):
+    return datetime(2024, 1, number, hour)
+
+def edit_price(lote_id, precio, fecha):
+    db.session.get(Lote, lote_id).precio = precio
+    db.session.commit()
+    # The history row of the edit, moved to when it should have happened
+    row = LotePrecioHistorial.query.filter_by(lote_id=lote_id).order_by(LotePrecioHistorial.id.desc()).first()
+    row.fecha = fecha
+    db.session.commit()
+
+def state(fraccionamiento_id, when):
+    lots, snapshot = inventory_as_of(fraccionamiento_id, when)
+    return {lote_id: (lot['estado'], lot['precio']) for lote_id, lot in lots.items()}, snapshot
+
+def history(admin, buyer, inventory):
+    """Lots a, b, c created on the 1st and snapshotted on the 3rd; the changes around it:
+
+    2nd       a: 850000 -> 900000
+    3rd       snapshot
+    4th       d created at 700000
+    4th 12h   b Apartado until the 6th
+    5th       a: 900000 -> 950000, d: 700000 -> 720000, c Apartado (still)
+    """
+    fraccionamiento, paquetes, prototipo, (a, b, c) = inventory(3)
+    db.session.execute(update(Lote.__table__).values(created_at=day(1)))
+    db.session.commit()
+    edit_price(a, 900000, day(2))
+    snapshot = take_snapshot(fraccionamiento.id, day(3))
+    db.session.commit()
+
+    d = db.session.execute(insert(Lote.__table__).values(
+        paquete_id=paquetes[0].id, prototipo_id=prototipo.id, fraccionamiento_id=fraccionamiento.id,
+        calle='Encino', numero_exterior=4, manzana='1', lote='4', manzana_orden=1, lote_orden=4, terreno=90,
+        tipo_de_lote='Regular', estado_del_inmueble='Libre', precio=700000, created_at=day(4)
+    )).inserted_primary_key[0]
+    db.session.commit()
+    edit_price(d, 720000, day(5))
+    edit_price(a, 950000, day(5))
+
+    reserve(db.session.get(Lote, b), buyer, admin)
+    db.session.commit()
+    release_many([b], admin, 'Cancelación')
+    db.session.execute(update(LoteAsignacionHistorial.__table__).values(fecha_inicio=day(4, 12), fecha_fin=day(6)))
+    reserve(db.session.get(Lote, c), buyer, admin)
+    db.session.execute(update(LoteAsignacion.__table__).values(fecha_asignacion=day(5)))
+    db.session.commit()
+    return fraccionamiento.id, snapshot.id, (a, b, c, d)
+
+def test_before_the_first_snapshot_the_history_is_replayed(app, admin, buyer, inventory):
+    fraccionamiento_id, _, (a, b, c, d) = history(admin, buyer, inventory)
+    lots, snapshot = state(fraccionamiento_id, day(1, 12))
+    assert snapshot is None
+    assert lots == {a: ('Libre', 850000), b: ('Libre', 851000), c: ('Libre', 852000)}
+    lots, _ = state(fraccionamiento_id, day(2, 12))
+    assert lots[a] == ('Libre', 900000)
+
+def test_at_the_moment_of_a_snapshot(app, admin, buyer, inventory):
+    fraccionamiento_id, snapshot_id, (a, b, c, d) = history(admin, buyer, inventory)
+    lots, snapshot = state(fraccionamiento_id, day(3))
+    assert snapshot.id == snapshot_id
+    assert lots == {a: ('Libre', 900000), b: ('Libre', 851000), c: ('Libre', 852000)}
+
+def test_changes_after_a_snapshot_are_replayed(app, admin, buyer, inventory):
+    fraccionamiento_id, snapshot_id, (a, b, c, d) = history(admin, buyer, inventory)
+    # d exists from its creation on, at the price it was created with
+    lots, snapshot = state(fraccionamiento_id, day(4, 6))
+    assert snapshot.id == snapshot_id
+    assert lots == {a: ('Libre', 900000), b: ('Libre', 851000), c: ('Libre', 852000), d: ('Libre', 700000)}
+
+    lots, _ = state(fraccionamiento_id, day(5, 12))
+    assert lots == {a: ('Libre', 950000), b: ('Apartado', 851000), c: ('Apartado', 852000),
+                    d: ('Libre', 720000)}
+
+    # b's assignment opened and closed within the window
+    lots, _ = state(fraccionamiento_id, day(7))
+    assert lots == {a: ('Libre', 950000), b: ('Libre', 851000), c: ('Apartado', 852000),
+                    d: ('Libre', 720000)}
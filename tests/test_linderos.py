@@ -0,0 +1,43 @@
+import pytest
+from app.properties.linderos import borders_street, frente, linderos_de, parse_longitud, parse_vecinos, perimetro
+from app.properties.models import Lote
+
+@pytest.mark.parametrize('medidas, longitud', [
+    ('7 metros', 7.0),
+    ('7.50 m', 7.5),
+    ('7,50 ML', 7.5),
+    ('7 y 8 metros', 15.0),
+    ('7, 8', 15.0),
+    ('12.25 + 3,5', 15.75),
+    ('sin medida', None),
+    ('', None),
+    (None, None),
+])
+def test_side_lengths(medidas, longitud):
+    assert parse_longitud(medidas) == longitud
+
+@pytest.mark.parametrize('colindancia, vecinos', [
+    ('Lote Número 03 y Lote Número 04 Respectivamente', [3, 4]),
+    ('Lote No. 3', [3]),
+    ('lotes 03 y 04', [3, 4]),
+    ('Lote #3, 4', [3, 4]),
+    ('LOTE NUM 12', [12]),
+    ('Calle Encino 45', []),
+    (None, []),
+])
+def test_neighbour_numbers(colindancia, vecinos):
+    assert parse_vecinos(colindancia) == vecinos
+
+def test_sides_of_a_lot():
+    lote = Lote(calle='Encino',
+                orientacion_1='Norte', medidas_orientacion_1='7 y 8 metros', colindancia_1='Calle Encino',
+                orientacion_2='Sur', medidas_orientacion_2='15,00 m', colindancia_2='Lote Número 10',
+                orientacion_3='Este', medidas_orientacion_3='20', colindancia_3='Av. Las Torres',
+                orientacion_4=None, medidas_orientacion_4=None, colindancia_4=None)
+    linderos = linderos_de(lote)
+    assert [(lindero['lado'], lindero['longitud'], lindero['es_frente']) for lindero in linderos] == \
+        [(1, 15.0, True), (2, 15.0, False), (3, 20.0, True)]
+    assert perimetro(linderos) == 50.0
+    assert frente(linderos) == 20.0
+    assert perimetro([]) is None and frente(linderos[1:2]) is None
+    assert not borders_street('Área verde') and not borders_street('')
@@ -0,0 +1,71 @@
+import asyncio
+import collections
+import json
+import socket
+from unittest import mock
+import live_gateway
+from app.database import db
+from app.properties.models import Lote
+from app.properties.versions import get_versions
+
+def event(lote_id, version, fraccionamiento_id=1):
+    return {'lote_id': lote_id, 'fraccionamiento_id': fraccionamiento_id, 'paquete_id': 1,
+            'estado_del_inmueble': 'Apartado', 'version': version}
+
+def replayed(missed):
+    return [json.loads(data)['lote_id'] for _, data in missed]
+
+def test_pages_get_the_events_after_the_version_of_their_rows():
+    gateway = live_gateway.Gateway()
+    gateway.dispatch([event(1, 5), event(2, 6), event(3, 6, fraccionamiento_id=2), event(4, 7)])
+    assert replayed(gateway.missed_since_version(1, 5)) == [2, 4]
+    assert replayed(gateway.missed_since_version(1, 7)) == []
+    # Events before the first one the gateway received are unknown
+    assert replayed(gateway.missed_since_version(1, 4)) == [1, 2, 4]
+    assert gateway.missed_since_version(1, 3) is None
+
+def test_pages_older_than_the_dropped_events_reset():
+    gateway = live_gateway.Gateway()
+    gateway.recent = collections.deque(maxlen=2)
+    gateway.dispatch([event(1, 5), event(2, 6), event(3, 7)])
+    # The event at version 5 is gone: only pages that already have it can replay
+    assert gateway.missed_since_version(1, 4) is None
+    assert replayed(gateway.missed_since_version(1, 5)) == [2, 3]
+
+def test_a_page_that_stops_reading_is_dropped(monkeypatch):
+    monkeypatch.setattr(live_gateway, 'HEARTBEAT', 0.05)
+    gateway = live_gateway.Gateway()
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'GET /lotes/eventos?fraccionamiento=1 HTTP/1.1\r\nHost: x\r\n\r\n')
+        async def full_window():
+            await asyncio.sleep(3600)
+
+        writer = mock.Mock()
+        # The TCP window is full: the buffer never drains
+        writer.drain = full_window
+        writer.wait_closed = mock.AsyncMock()
+        await asyncio.wait_for(gateway.handle(reader, writer), 5)
+        return writer
+
+    writer = asyncio.run(run())
+    writer.transport.abort.assert_called_once()
+    assert not gateway.subscribers
+
+def test_catalog_rows_and_events_carry_the_lotes_version(app, client, inventory):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(5)
+    app.config['LIVE_EVENTS_ADDRESS'] = f'127.0.0.1:{receiver.getsockname()[1]}'
+    try:
+        fraccionamiento, _, _, lote_ids = inventory(3)
+        page = client.get(f'/properties/api/lotes/catalog?fraccionamiento={fraccionamiento.id}').get_json()
+        assert page['version'] == get_versions(['lotes'])['lotes'][0]
+
+        db.session.get(Lote, lote_ids[0]).estado_del_inmueble = 'Apartado'
+        db.session.commit()
+        events = json.loads(receiver.recv(65536))
+        assert events == [dict(events[0], lote_id=lote_ids[0], version=page['version'] + 1)]
+    finally:
+        receiver.close()
@@ -0,0 +1,85 @@
+"""The properties pages cost the same number of statements whatever the inventory size"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert
+from app.database import db
+from app.clients.models import Client
+from app.properties.models import Prototipo, PrototipoImagen, LoteAsignacionHistorial
+from app.properties.page_cache import cache as page_cache
+
+SMALL, LARGE = 10, 10000
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+def add_related_rows(size, lote_id, user_id):
+    """size prototipos with an image each, and size history rows of lote_id, each with a client of its own"""
+    db.session.execute(insert(Prototipo.__table__), [{
+        'nombre_prototipo': f'Prototipo {n}', 'superficie_terreno': 90, 'superficie_construccion': 60,
+        'niveles': 1, 'recamaras': 2, 'banos': 1, 'precio': 850000
+    } for n in range(size)])
+    prototipo_ids = [row[0] for row in db.session.query(Prototipo.id).order_by(Prototipo.id.desc()).limit(size)]
+    db.session.execute(insert(PrototipoImagen.__table__), [
+        {'prototipo_id': prototipo_id, 'filename': f'{prototipo_id}.jpg'} for prototipo_id in prototipo_ids
+    ])
+
+    db.session.execute(insert(Client.__table__), [{
+        'nombre': f'Cliente {n}', 'apellido_paterno': 'Ruiz', 'apellido_materno': 'Soto',
+        'celular': '5512345678', 'assigned_user_id': user_id
+    } for n in range(size)])
+    client_ids = [row[0] for row in db.session.query(Client.id).order_by(Client.id.desc()).limit(size)]
+    start = datetime(2025, 1, 1)
+    db.session.execute(insert(LoteAsignacionHistorial.__table__), [{
+        'lote_id': lote_id, 'client_id': client_id, 'user_id': user_id,
+        'fecha_inicio': start + timedelta(days=n), 'fecha_fin': start + timedelta(days=n, hours=12),
+        'estado': 'Apartado', 'motivo_cambio': 'Cancelación'
+    } for n, client_id in enumerate(client_ids)])
+    db.session.commit()
+
+def page_costs(app, client, fraccionamiento, paquetes, lote_id):
+    """{page: number of statements} of the properties pages of one fraccionamiento"""
+    anonymous = app.test_client()
+    pages = {
+        'catalog (anonymous)': (anonymous, f'/properties/api/lotes/catalog?fraccionamiento={fraccionamiento.id}'),
+        'catalog': (client, f'/properties/api/lotes/catalog?paquete={paquetes[0].id}&sort=precio'),
+        'detail': (client, f'/properties/api/lotes/{lote_id}'),
+        'history': (client, f'/properties/api/lotes/{lote_id}/history'),
+        'prototipos': (client, '/properties/prototipos'),
+        'paquetes': (client, f'/properties/fraccionamientos/{fraccionamiento.id}/paquetes'),
+        'paquete lotes': (client, f'/properties/paquetes/{paquetes[0].id}/lotes'),
+    }
+    costs = {}
+    for name, (browser, url) in pages.items():
+        # The first hit fills the choice lists cache, which is not what is measured
+        assert browser.get(url).status_code == 200, name
+        page_cache.purge()
+        with count_statements() as statements:
+            response = browser.get(url)
+        assert response.status_code == 200, name
+        costs[name] = len(statements)
+    return costs
+
+def test_page_costs_do_not_depend_on_inventory_size(app, client, admin, login, inventory):
+    login(admin)
+
+    fraccionamiento, paquetes, _, lote_ids = inventory(SMALL, paquetes=1)
+    add_related_rows(SMALL, lote_ids[0], admin.id)
+    small = page_costs(app, client, fraccionamiento, paquetes, lote_ids[0])
+
+    fraccionamiento, paquetes, _, lote_ids = inventory(LARGE, paquetes=LARGE // 100)
+    add_related_rows(LARGE, lote_ids[0], admin.id)
+    large = page_costs(app, client, fraccionamiento, paquetes, lote_ids[0])
+
+    assert small == large
+    # A page is a handful of statements, not one per row
+    assert max(large.values()) <= 10, large
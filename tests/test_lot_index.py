@@ -0,0 +1,80 @@
+import pytest
+from app.database import db
+from app.properties import lot_index
+from app.properties.catalog import decode_cursor, encode_cursor
+from app.properties.models import Lote
+from app.properties.page_cache import cache as page_cache
+from app.properties.reservations import reserve, release_many
+
+@pytest.fixture
+def index_path(app, tmp_path):
+    app.config['LOT_INDEX_PATH'] = str(tmp_path / 'lot_index.bin')
+    lot_index._current = None
+    yield app.config['LOT_INDEX_PATH']
+    if lot_index._rebuilding is not None:
+        lot_index._rebuilding.join()
+    lot_index._current = None
+
+def wait_for_rebuild():
+    lot_index._rebuilding.join(timeout=30)
+
+def test_stale_index_is_rebuilt_in_the_background(app, index_path, inventory):
+    inventory(30)
+    # Missing: answered from the database while a thread builds it
+    assert lot_index.get_index() is None
+    wait_for_rebuild()
+    index = lot_index.get_index()
+    assert index is not None and index.rows == 30
+
+    # A price change is not patchable; the old file is not served meanwhile
+    lote = db.session.get(Lote, 1)
+    lote.precio = 1
+    db.session.commit()
+    assert lot_index.get_index() is None
+    wait_for_rebuild()
+    rows, _ = lot_index.get_index().page(fraccionamiento_id=lote.fraccionamiento_id, sort='precio', limit=1)
+    assert rows[0]['id'] == lote.id and rows[0]['precio'] == 1
+
+def test_reservations_patch_the_index(app, index_path, admin, buyer, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(30)
+    lot_index.get_index()
+    wait_for_rebuild()
+    stamp = tuple(lot_index.get_index().stamp)
+
+    # Conditional UPDATEs, not ORM writes: the index is patched, not rebuilt
+    reserve(db.session.get(Lote, lote_ids[0]), buyer, admin)
+    db.session.commit()
+    index = lot_index.get_index()
+    assert index is not None and tuple(index.stamp) != stamp
+    rows, _ = index.page(fraccionamiento_id=fraccionamiento.id, estado='Apartado')
+    assert [row['id'] for row in rows] == [lote_ids[0]]
+
+    release_many([lote_ids[0]], admin, 'Cancelación')
+    db.session.commit()
+    rows, _ = lot_index.get_index().page(fraccionamiento_id=fraccionamiento.id, estado='Apartado')
+    assert rows == []
+
+def test_index_pages_match_the_database(app, client, index_path, inventory):
+    fraccionamiento, _, _, _ = inventory(120, paquetes=3)
+    url = f'/properties/api/lotes/catalog?fraccionamiento={fraccionamiento.id}&sort=precio&limit=40'
+    from_database = client.get(url).get_json()
+    wait_for_rebuild()
+    page_cache.purge()
+    from_index = client.get(url).get_json()
+    assert lot_index._current is not None
+    assert from_index == from_database
+
+@pytest.mark.parametrize('values', [['a', 1], [None, 1], [True, 1], [[1], 1]])
+def test_cursors_only_hold_numbers(values):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(values), 2)
+
+def test_non_numeric_cursor_is_a_bad_request(app, client, index_path, inventory):
+    fraccionamiento, _, _, _ = inventory(10)
+    lot_index.get_index()
+    wait_for_rebuild()
+    cursor = encode_cursor(['x', 'y'])
+    response = client.get(f'/properties/api/lotes/catalog?fraccionamiento={fraccionamiento.id}'
+                          f'&sort=precio&after={cursor}')
+    assert lot_index._current is not None
+    assert response.status_code == 400
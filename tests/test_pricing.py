@@ -0,0 +1,85 @@
+from sqlalchemy import update
+from app.database import db
+from app.properties.models import Lote, LotePrecioHistorial, ReglaPrecio, RevisionPrecio
+from app.properties.pricing import parse_reglas, recalculate
+
+def set_lot(lote_id, **values):
+    db.session.execute(update(Lote.__table__).where(Lote.id == lote_id).values(**values))
+    db.session.commit()
+
+def prices(lote_ids):
+    db.session.expire_all()
+    return [db.session.get(Lote, lote_id).precio for lote_id in lote_ids]
+
+def priced_inventory(inventory):
+    """Six lots over two paquetes; lot n has n m² of terreno beyond the prototipo and costs 850000 + n * 1000"""
+    fraccionamiento, paquetes, _, lote_ids = inventory(6, paquetes=2)
+    for n, lote_id in enumerate(lote_ids):
+        set_lot(lote_id, terreno=90 + n, precio=850000 + n * 1000)
+    set_lot(lote_ids[2], tipo_de_lote='En Esquina')
+    set_lot(lote_ids[4], estado_del_inmueble='Apartado')
+    set_lot(lote_ids[5], estado_del_inmueble='Titulado')
+    db.session.add_all(parse_reglas(fraccionamiento.id, [
+        {'concepto': 'premio_tipo_de_lote', 'tipo_de_lote': 'Regular', 'valor': 10, 'es_porcentaje': True},
+        {'concepto': 'premio_tipo_de_lote', 'tipo_de_lote': 'En Esquina', 'valor': 50000},
+        {'concepto': 'precio_m2_excedente', 'valor': 1000},
+        # The second paquete replaces the Regular premio with a fixed one
+        {'concepto': 'premio_tipo_de_lote', 'tipo_de_lote': 'Regular', 'valor': 20000,
+         'paquete_id': paquetes[1].id},
+    ]))
+    db.session.commit()
+    return fraccionamiento, lote_ids
+
+# Prototipo precio 850000; lots alternate between the paquetes
+EXPECTED = [
+    850000 + 85000,          # Regular, 10 %
+    850000 + 20000 + 1000,   # Regular in the second paquete: 20000 + 1 m²
+    850000 + 50000 + 2000,   # En Esquina: 50000 + 2 m²
+    850000 + 20000 + 3000,   # Regular in the second paquete: 20000 + 3 m²
+    854000,                  # Apartado: kept
+    855000,                  # Titulado: kept
+]
+
+def test_dry_run_returns_the_changes_without_writing(app, inventory):
+    fraccionamiento, lote_ids = priced_inventory(inventory)
+    changes = recalculate(fraccionamiento.id, dry_run=True)
+    db.session.commit()
+
+    assert {change['lote_id']: (change['precio_actual'], change['precio_nuevo']) for change in changes} == {
+        lote_ids[n]: (850000 + n * 1000, EXPECTED[n]) for n in range(4)
+    }
+    assert prices(lote_ids) == [850000 + n * 1000 for n in range(6)]
+    assert RevisionPrecio.query.count() == 0
+    assert LotePrecioHistorial.query.count() == 0
+
+def test_recalculation_applies_rules_and_paquete_overrides(app, admin, inventory):
+    fraccionamiento, lote_ids = priced_inventory(inventory)
+    changes = recalculate(fraccionamiento.id, user_id=admin.id)
+    db.session.commit()
+
+    assert len(changes) == 4
+    assert prices(lote_ids) == EXPECTED
+    revision = RevisionPrecio.query.one()
+    assert (revision.tipo, revision.fraccionamiento_id, revision.total_lotes) == ('reglas', fraccionamiento.id, 4)
+    history = {row.lote_id: (row.revision_id, row.precio_anterior, row.precio_nuevo)
+               for row in LotePrecioHistorial.query}
+    assert history == {lote_ids[n]: (revision.id, 850000 + n * 1000, EXPECTED[n]) for n in range(4)}
+
+    # Nothing left to change: no new revision
+    assert recalculate(fraccionamiento.id) == []
+    db.session.commit()
+    assert RevisionPrecio.query.count() == 1
+
+def test_recalculation_of_one_paquete(app, inventory):
+    fraccionamiento, lote_ids = priced_inventory(inventory)
+    paquete_id = db.session.get(Lote, lote_ids[1]).paquete_id
+    recalculate(fraccionamiento.id, paquete_id=paquete_id)
+    db.session.commit()
+    assert prices(lote_ids) == [850000, EXPECTED[1], 852000, EXPECTED[3], 854000, 855000]
+
+def test_fraccionamientos_without_rules_keep_their_prices(app, inventory):
+    fraccionamiento, lote_ids = priced_inventory(inventory)
+    ReglaPrecio.query.delete()
+    db.session.commit()
+    assert recalculate(fraccionamiento.id) == []
+    assert prices(lote_ids) == [850000 + n * 1000 for n in range(6)]
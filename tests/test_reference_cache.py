@@ -0,0 +1,30 @@
+from sqlalchemy import insert
+from app.database import db
+from app.properties.models import Fraccionamiento
+from app.properties.reference_cache import cache, fraccionamiento_choices
+from app.properties.versions import bump_versions
+
+def test_lists_follow_the_table_version(app):
+    db.session.add(Fraccionamiento(nombre='Las Lomas'))
+    db.session.commit()
+    assert [nombre for _, nombre in fraccionamiento_choices()] == ['Las Lomas']
+    hits = cache.stats()['hits']
+    assert [nombre for _, nombre in fraccionamiento_choices()] == ['Las Lomas']
+    assert cache.stats()['hits'] == hits + 1
+
+    # Written the way another process's commit looks from here: no local
+    # invalidation, only the row and the version bump
+    db.session.execute(insert(Fraccionamiento.__table__).values(nombre='El Roble'))
+    db.session.commit()
+    assert [nombre for _, nombre in fraccionamiento_choices()] == ['Las Lomas']
+    bump_versions(db.session.connection(), ['fraccionamiento'])
+    db.session.commit()
+    assert [nombre for _, nombre in fraccionamiento_choices()] == ['El Roble', 'Las Lomas']
+
+def test_local_commits_drop_the_lists_at_once(app):
+    assert fraccionamiento_choices() == []
+    invalidations = cache.stats()['invalidations']
+    db.session.add(Fraccionamiento(nombre='Las Lomas'))
+    db.session.commit()
+    assert cache.stats()['invalidations'] == invalidations + 1
+    assert [nombre for _, nombre in fraccionamiento_choices()] == ['Las Lomas']
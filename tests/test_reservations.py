@@ -0,0 +1,145 @@
+"""Concurrent reservations: one winner per lot, whatever the interleaving"""
+import threading
+from collections import Counter
+import pytest
+from sqlalchemy import func
+from app.database import db
+from app.auth.models import User, UserRole
+from app.clients.models import Client
+from app.properties.counters import get_counts
+from app.properties.models import Lote, LoteAsignacion
+from app.properties.reservations import (reserve, reserve_many, release_many, current_assignments,
+                                         LotNotAvailable)
+from app.properties.versions import get_versions
+
+THREADS = 8
+LOTS = 12
+
+def race(app, lote_ids, client_id, user_id):
+    """Half the threads reserve the lots one by one, the others two at a time; returns what each one won"""
+    start = threading.Barrier(THREADS)
+    won, errors = [[] for _ in range(THREADS)], []
+
+    def run(number):
+        with app.app_context():
+            client, user = db.session.get(Client, client_id), db.session.get(User, user_id)
+            start.wait()
+            try:
+                if number % 2:
+                    batches = [lote_ids[k:k + 2] for k in range(number % 4 // 2, len(lote_ids), 2)]
+                else:
+                    batches = [[lote_id] for lote_id in (lote_ids if number % 4 else reversed(lote_ids))]
+                for batch in batches:
+                    try:
+                        if len(batch) == 1:
+                            reserve(db.session.get(Lote, batch[0]), client, user)
+                        else:
+                            reserve_many(batch, client, user)
+                        db.session.commit()
+                        won[number].append(batch)
+                    except LotNotAvailable:
+                        db.session.rollback()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    return won
+
+def test_concurrent_reservations_have_one_winner_per_lot(app, admin, buyer, inventory):
+    fraccionamiento, paquetes, prototipo, lote_ids = inventory(LOTS)
+    before = get_versions(['lotes', 'lote_asignaciones'])
+    won = race(app, lote_ids, buyer.id, admin.id)
+
+    reserved = Counter(lote_id for batches in won for batch in batches for lote_id in batch)
+    assert reserved == Counter(lote_ids)
+    assignments = dict(db.session.query(LoteAsignacion.lote_id, func.count()).group_by(LoteAsignacion.lote_id))
+    assert assignments == dict.fromkeys(lote_ids, 1)
+    assert {lote.estado_del_inmueble for lote in Lote.query} == {'Apartado'}
+
+    def nonzero(counts):
+        return {ambito_id: {estado: total for estado, total in totals.items() if total}
+                for ambito_id, totals in counts.items()}
+    assert nonzero(get_counts('fraccionamiento')) == {fraccionamiento.id: {'Apartado': LOTS}}
+    assert nonzero(get_counts('paquete')) == {paquetes[0].id: {'Apartado': LOTS}}
+    assert nonzero(get_counts('prototipo')) == {prototipo.id: {'Apartado': LOTS}}
+    commits = sum(len(batches) for batches in won)
+    after = get_versions(['lotes', 'lote_asignaciones'])
+    assert after['lotes'][0] - before['lotes'][0] == commits
+    assert after['lote_asignaciones'][0] - before['lote_asignaciones'][0] == commits
+
+def vendedor(username, nombre):
+    user = User(username=username, email=f'{username}@example.com', nombre=nombre, apellido_paterno='Díaz',
+                apellido_materno='Mora', role=UserRole.VENDEDOR.value)
+    user.set_password('secreto')
+    db.session.add(user)
+    db.session.flush()
+    client = Client(nombre=f'Cliente de {nombre}', apellido_paterno='Ruiz', apellido_materno='Soto',
+                    celular='5512345678', assigned_user_id=user.id)
+    db.session.add(client)
+    db.session.commit()
+    return user, client
+
+def assigned_lots():
+    db.session.expire_all()
+    return dict(db.session.query(LoteAsignacion.lote_id, LoteAsignacion.client_id))
+
+def test_batch_assignment_is_all_or_nothing(app, client, admin, buyer, login, inventory):
+    _, _, _, lote_ids = inventory(3)
+    reserve(db.session.get(Lote, lote_ids[2]), buyer, admin)
+    db.session.commit()
+    login(admin)
+    response = client.post('/properties/api/lotes/assign/batch', json={'client_id': buyer.id, 'lote_ids': lote_ids})
+    assert response.status_code == 409
+    assert assigned_lots() == {lote_ids[2]: buyer.id}
+
+def test_batch_release_checks_every_lot(app, client, admin, login, inventory):
+    _, _, _, lote_ids = inventory(4)
+    ana, cliente_ana = vendedor('ana', 'Ana')
+    luis, cliente_luis = vendedor('luis', 'Luis')
+    reserve_many(lote_ids[:2], cliente_ana, ana)
+    reserve(db.session.get(Lote, lote_ids[2]), cliente_luis, luis)
+    db.session.commit()
+    before = assigned_lots()
+    login(ana)
+
+    # A lot of someone else's client
+    response = client.post('/properties/api/lotes/release/batch',
+                           json={'lote_ids': lote_ids[:3], 'motivo': 'Cancelación'})
+    assert response.status_code == 403
+    assert assigned_lots() == before
+    # A lot that is not assigned
+    response = client.post('/properties/api/lotes/release/batch',
+                           json={'lote_ids': [lote_ids[0], lote_ids[3]], 'motivo': 'Cancelación'})
+    assert response.status_code == 400
+    assert assigned_lots() == before
+    assert db.session.get(Lote, lote_ids[0]).estado_del_inmueble == 'Apartado'
+
+    response = client.post('/properties/api/lotes/release/batch',
+                           json={'lote_ids': lote_ids[:2], 'motivo': 'Cancelación'})
+    assert response.status_code == 200 and response.get_json()['total'] == 2
+    assert assigned_lots() == {lote_ids[2]: cliente_luis.id}
+
+def test_release_skips_lots_assigned_again_after_the_check(app, inventory):
+    _, _, _, lote_ids = inventory(2)
+    ana, cliente_ana = vendedor('ana', 'Ana')
+    luis, cliente_luis = vendedor('luis', 'Luis')
+    reserve_many(lote_ids, cliente_ana, ana)
+    db.session.commit()
+    checked = {asignacion.client_id for asignacion in current_assignments(lote_ids)}
+
+    # Meanwhile the second lot is released and assigned to another client
+    release_many([lote_ids[1]], luis, 'Cancelación')
+    reserve(db.session.get(Lote, lote_ids[1]), cliente_luis, luis)
+    db.session.commit()
+
+    with pytest.raises(ValueError):
+        release_many(lote_ids, ana, 'Cancelación', client_ids=checked)
+    db.session.rollback()
+    assert assigned_lots() == {lote_ids[0]: cliente_ana.id, lote_ids[1]: cliente_luis.id}
@@ -0,0 +1,83 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import update
+from app.database import db
+from app.properties.models import Lote, LotePrecioHistorial, Prototipo, RevisionPrecio
+from app.properties.revisions import price_as_of, revise
+
+def prices(lote_ids):
+    db.session.expire_all()
+    return [db.session.get(Lote, lote_id).precio for lote_id in lote_ids]
+
+def test_percentage_revision_of_a_paquete(app, admin, inventory):
+    # Prices 850000, 851000, ...; lots alternate between the paquetes
+    _, paquetes, _, lote_ids = inventory(4, paquetes=2)
+    db.session.execute(update(Lote.__table__).where(Lote.id == lote_ids[2]).values(estado_del_inmueble='Apartado'))
+    summary = revise('porcentaje', 10, paquete_id=paquetes[0].id, user_id=admin.id)
+    db.session.commit()
+
+    assert summary == {'total': 1, 'valor_actual': 850000, 'valor_nuevo': 935000,
+                       'revision_id': RevisionPrecio.query.one().id}
+    assert prices(lote_ids) == [935000, 851000, 852000, 853000]
+    # Written by the INSERT ... SELECT of the revision
+    history = LotePrecioHistorial.query.one()
+    assert (history.lote_id, history.revision_id, history.precio_anterior, history.precio_nuevo) == \
+        (lote_ids[0], summary['revision_id'], 850000, 935000)
+
+def test_amount_revision_of_a_prototipo(app, inventory):
+    _, _, _, lote_ids = inventory(3)
+    otro = Prototipo(nombre_prototipo='Cedro', superficie_terreno=90, superficie_construccion=70,
+                     niveles=2, recamaras=3, banos=2, precio=990000)
+    db.session.add(otro)
+    db.session.flush()
+    db.session.execute(update(Lote.__table__).where(Lote.id == lote_ids[1]).values(prototipo_id=otro.id))
+    revise('monto', -1000.5, prototipo_id=otro.id)
+    db.session.commit()
+    assert prices(lote_ids) == [850000, 849999.5, 852000]
+
+def test_amount_revision_of_a_fraccionamiento(app, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(2)
+    # inventory returns the ids of every lot so far
+    other_ids = inventory(2)[3][2:]
+    revise('monto', 500, fraccionamiento_id=fraccionamiento.id)
+    db.session.commit()
+    assert prices(lote_ids) == [850500, 851500]
+    assert prices(other_ids) == [850000, 851000]
+    assert RevisionPrecio.query.one().total_lotes == 2
+
+def test_revisions_cannot_leave_negative_prices(app, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(2)
+    with pytest.raises(ValueError):
+        revise('monto', -850500, fraccionamiento_id=fraccionamiento.id)
+    db.session.rollback()
+    assert prices(lote_ids) == [850000, 851000]
+    assert RevisionPrecio.query.count() == 0 and LotePrecioHistorial.query.count() == 0
+
+def test_dry_run_writes_nothing(app, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(2)
+    summary = revise('porcentaje', -50, fraccionamiento_id=fraccionamiento.id, dry_run=True)
+    db.session.commit()
+    assert summary['valor_nuevo'] == 850500 and summary['revision_id'] is None
+    assert prices(lote_ids) == [850000, 851000]
+
+def test_single_edits_and_price_as_of(app, inventory):
+    _, _, _, lote_ids = inventory(2)
+    lote = db.session.get(Lote, lote_ids[0])
+    lote.precio = 900000
+    db.session.commit()
+    lote.precio = 950000
+    db.session.commit()
+
+    history = LotePrecioHistorial.query.order_by(LotePrecioHistorial.id).all()
+    assert [(row.revision_id, row.precio_anterior, row.precio_nuevo) for row in history] == \
+        [(None, 850000, 900000), (None, 900000, 950000)]
+    for row, fecha in zip(history, [datetime(2024, 1, 10), datetime(2024, 2, 10)]):
+        row.fecha = fecha
+    db.session.commit()
+
+    assert price_as_of(lote, datetime(2024, 1, 1)) == 850000
+    assert price_as_of(lote, datetime(2024, 1, 10)) == 900000
+    assert price_as_of(lote, datetime(2024, 1, 20)) == 900000
+    assert price_as_of(lote, datetime(2024, 3, 1)) == 950000
+    # Never changed
+    assert price_as_of(db.session.get(Lote, lote_ids[1]), datetime(2024, 1, 1)) == 851000
@@ -0,0 +1,128 @@
+from datetime import datetime
+import pytest
+from app.database import db
+from app.auth.models import User, UserRole
+from app.clients.models import Client
+from app.properties.holds import release_expired
+from app.properties.models import BusquedaGuardada, Lote, Notificacion
+from app.properties.reservations import release_many, reserve_many
+from app.properties.saved_searches import OPEN_BAND, match, set_bands
+
+def test_marking_notifications_read_needs_a_list_of_ids(app, client, admin, login):
+    login(admin)
+    for ids in [5, '1,2', [1, 'x'], {'id': 1}]:
+        assert client.post('/properties/api/notificaciones/leidas', json={'ids': ids}).status_code == 400
+    response = client.post('/properties/api/notificaciones/leidas', json={'ids': [1, 2]})
+    assert response.status_code == 200 and response.get_json() == {'leidas': 0}
+
+def test_searches_are_saved_for_assignable_clients_only(app, client, admin, buyer, login, inventory):
+    fraccionamiento, _, _, _ = inventory(1)
+    vendedor = User(username='luis', email='luis@example.com', nombre='Luis', apellido_paterno='Díaz',
+                    apellido_materno='Mora', role=UserRole.VENDEDOR.value)
+    vendedor.set_password('secreto')
+    db.session.add(vendedor)
+    db.session.commit()
+    url = '/properties/api/busquedas'
+    search = {'nombre': 'Esquina', 'fraccionamiento_id': fraccionamiento.id}
+
+    login(vendedor)
+    # The buyer is a client of the admin
+    assert client.post(url, json=dict(search, client_id=buyer.id)).status_code == 403
+    assert client.post(url, json=dict(search, client_id=999)).status_code == 400
+    assert client.post(url, json=dict(search, client_id='1')).status_code == 400
+    propio = Client(nombre='Marta', apellido_paterno='Gil', apellido_materno='Vega', celular='5587654321', estatus='activo',
+                    assigned_user_id=vendedor.id)
+    db.session.add(propio)
+    db.session.commit()
+    response = client.post(url, json=dict(search, client_id=propio.id))
+    assert response.status_code == 201 and response.get_json()['client_id'] == propio.id
+
+def save_search(user, fraccionamiento_id, **criteria):
+    busqueda = BusquedaGuardada(user_id=user.id, nombre=criteria.pop('nombre', 'Búsqueda'),
+                                fraccionamiento_id=fraccionamiento_id, **criteria)
+    set_bands(busqueda)
+    db.session.add(busqueda)
+    db.session.commit()
+    return busqueda
+
+def matches(fraccionamiento_id, prototipo_id, precio, tipo_de_lote='Regular'):
+    return [busqueda_id for busqueda_id, _, _ in
+            match(db.session.connection(), fraccionamiento_id, prototipo_id, tipo_de_lote, precio)]
+
+def notified_lots():
+    return sorted(lote_id for (lote_id,) in db.session.query(Notificacion.lote_id))
+
+def test_price_bands_and_bounds(app, admin, inventory):
+    fraccionamiento, _, prototipo, _ = inventory(1)
+    cerrada = save_search(admin, fraccionamiento.id, precio_min=200000, precio_max=300000)
+    assert (cerrada.banda_min, cerrada.banda_max) == (2, 3)
+
+    assert matches(fraccionamiento.id, prototipo.id, 199999.99) == []
+    assert matches(fraccionamiento.id, prototipo.id, 200000) == [cerrada.id]
+    assert matches(fraccionamiento.id, prototipo.id, 300000) == [cerrada.id]
+    # Same band as the maximum, above it
+    assert matches(fraccionamiento.id, prototipo.id, 300000.01) == []
+
+def test_open_ranges(app, admin, inventory):
+    fraccionamiento, _, prototipo, _ = inventory(1)
+    desde = save_search(admin, fraccionamiento.id, precio_min=500000)
+    hasta = save_search(admin, fraccionamiento.id, precio_max=500000)
+    assert (desde.banda_max, hasta.banda_min) == (OPEN_BAND, 0)
+    assert matches(fraccionamiento.id, prototipo.id, 0) == [hasta.id]
+    assert sorted(matches(fraccionamiento.id, prototipo.id, 500000)) == [desde.id, hasta.id]
+    assert matches(fraccionamiento.id, prototipo.id, 50000000) == [desde.id]
+
+    with pytest.raises(ValueError):
+        set_bands(BusquedaGuardada(precio_min=2, precio_max=1))
+
+def test_prototipo_and_tipo_de_lote(app, admin, inventory):
+    fraccionamiento, _, prototipo, _ = inventory(1)
+    otro, _, otro_prototipo, _ = inventory(1)
+    cualquiera = save_search(admin, fraccionamiento.id)
+    del_prototipo = save_search(admin, fraccionamiento.id, prototipo_id=prototipo.id)
+    esquina = save_search(admin, fraccionamiento.id, tipo_de_lote='En Esquina')
+
+    assert sorted(matches(fraccionamiento.id, prototipo.id, 900000)) == [cualquiera.id, del_prototipo.id]
+    assert matches(fraccionamiento.id, otro_prototipo.id, 900000) == [cualquiera.id]
+    assert sorted(matches(fraccionamiento.id, otro_prototipo.id, 900000, 'En Esquina')) == \
+        [cualquiera.id, esquina.id]
+    # Searches are per fraccionamiento
+    assert matches(otro.id, prototipo.id, 900000) == []
+
+def test_only_lots_becoming_libre_are_notified(app, admin, buyer, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(3)
+    save_search(admin, fraccionamiento.id)
+
+    # Already Libre: a price edit is not news
+    db.session.get(Lote, lote_ids[0]).precio = 860000
+    db.session.commit()
+    assert notified_lots() == []
+
+    reserve_many(lote_ids[1:], buyer, admin)
+    db.session.commit()
+    assert notified_lots() == []
+    release_many([lote_ids[1]], admin, 'Cancelación')
+    db.session.commit()
+    assert notified_lots() == [lote_ids[1]]
+
+    # Changed through the ORM
+    lote = db.session.get(Lote, lote_ids[2])
+    db.session.delete(lote.asignacion)
+    lote.estado_del_inmueble = 'Libre'
+    db.session.commit()
+    assert notified_lots() == [lote_ids[1], lote_ids[2]]
+    mensaje = Notificacion.query.filter_by(lote_id=lote_ids[2]).one().mensaje
+    assert mensaje == f'Manzana {lote.manzana} Lote {lote.lote} está disponible (Búsqueda)'
+
+def test_expired_holds_notify(app, admin, buyer, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(2)
+    save_search(admin, fraccionamiento.id)
+    inactiva = save_search(admin, fraccionamiento.id, nombre='Pausada')
+    inactiva.activa = False
+    db.session.commit()
+    reserve_many(lote_ids, buyer, admin, vence_en=datetime(2024, 1, 1))
+    db.session.commit()
+
+    assert release_expired(now=datetime(2024, 1, 2)) == 2
+    assert notified_lots() == lote_ids
+    assert {n.user_id for n in Notificacion.query} == {admin.id}
@@ -0,0 +1,55 @@
+import json
+import os
+import pytest
+from app.database import db
+from app.properties import snapshots
+from app.properties.models import Fraccionamiento, Lote, Prototipo
+
+@pytest.fixture
+def folder(app, tmp_path, monkeypatch):
+    # Snapshots are served as static files, so the folder is under the static one
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path / 'static'))
+    app.config['CATALOG_SNAPSHOT_FOLDER'] = str(tmp_path / 'static' / 'catalog')
+    yield app.config['CATALOG_SNAPSHOT_FOLDER']
+    snapshots.get_worker(app).wait()
+
+def snapshot_lots(folder, fraccionamiento_id):
+    with open(os.path.join(folder, str(fraccionamiento_id), 'lotes.json'), encoding='utf-8') as f:
+        return json.load(f)['lotes']
+
+def test_commits_outside_a_request_are_regenerated(app, folder, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(3)
+    snapshots.get_worker(app).wait()
+    lote = db.session.get(Lote, lote_ids[0])
+    lote.estado_del_inmueble = 'Apartado'
+    db.session.commit()
+    snapshots.get_worker(app).wait()
+    rows = {row['id']: row for row in snapshot_lots(folder, fraccionamiento.id)}
+    assert rows[lote.id]['estado_del_inmueble'] == 'Apartado'
+
+def test_only_fraccionamientos_using_a_renamed_prototipo_are_queued(app, folder, inventory):
+    fraccionamiento, _, prototipo, _ = inventory(2)
+    db.session.add(Fraccionamiento(nombre='Sin lotes'))
+    other = Prototipo(nombre_prototipo='Sin lotes', superficie_terreno=90, superficie_construccion=60,
+                      niveles=1, recamaras=2, banos=1, precio=850000)
+    db.session.add(other)
+    db.session.commit()
+    snapshots.get_worker(app).wait()
+
+    prototipo.nombre_prototipo = 'Alba II'
+    db.session.flush()
+    assert db.session.info['catalog_snapshots'] == {fraccionamiento.id}
+    db.session.commit()
+
+    other.precio = 900000
+    db.session.flush()
+    assert db.session.info['catalog_snapshots'] == set()
+    db.session.commit()
+
+def test_a_failing_regeneration_is_logged(app, folder, inventory, monkeypatch, caplog):
+    inventory(1)
+    snapshots.get_worker(app).wait()
+    monkeypatch.setattr(snapshots, 'build_fraccionamiento', lambda fraccionamiento_id: 1 / 0)
+    snapshots.get_worker(app).schedule({1})
+    snapshots.get_worker(app).wait()
+    assert 'No se pudieron regenerar' in caplog.text
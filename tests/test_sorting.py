@@ -0,0 +1,37 @@
+from app.database import db
+from app.properties.models import Lote
+from app.properties.sorting import manzana_sort_key, uses_roman_numerals, LETTER_SORT_KEY
+
+def test_single_letters_are_letters_unless_the_paquete_uses_roman_numerals():
+    assert manzana_sort_key('C') == LETTER_SORT_KEY + 2
+    assert manzana_sort_key('Mz. D') == LETTER_SORT_KEY + 3
+    assert manzana_sort_key('C', roman=True) == 100
+    assert manzana_sort_key('XVII') == 17
+    assert manzana_sort_key('12') == 12
+    assert uses_roman_numerals(['I', 'II', 'V'])
+    assert not uses_roman_numerals(['A', 'B', 'C', 'D', 'I'])
+
+def _lot(paquete, prototipo, manzana, lote='1'):
+    return Lote(paquete_id=paquete.id, prototipo_id=prototipo.id, calle='Encino', numero_exterior=1,
+                manzana=manzana, lote=lote, tipo_de_lote='Regular', precio=850000)
+
+def _ordered_manzanas(paquete):
+    return [manzana for (manzana,) in db.session.query(Lote.manzana).filter(Lote.paquete_id == paquete.id)
+            .order_by(Lote.manzana_orden, Lote.lote_orden, Lote.id)]
+
+def test_mixed_letter_and_number_plan(app, inventory):
+    _, paquetes, prototipo, _ = inventory(0)
+    db.session.add_all([_lot(paquetes[0], prototipo, manzana) for manzana in ('M', 'C', '2', 'L', '10', 'D')])
+    db.session.commit()
+    assert _ordered_manzanas(paquetes[0]) == ['2', '10', 'C', 'D', 'L', 'M']
+
+def test_roman_plan_rekeys_its_single_letters(app, inventory):
+    _, paquetes, prototipo, _ = inventory(0)
+    db.session.add_all([_lot(paquetes[0], prototipo, manzana) for manzana in ('X', 'V', 'I')])
+    db.session.commit()
+    assert _ordered_manzanas(paquetes[0]) == ['I', 'V', 'X']
+
+    # The first longer numeral shows the plan is numbered in Roman numerals
+    db.session.add_all([_lot(paquetes[0], prototipo, manzana) for manzana in ('IV', 'XI')])
+    db.session.commit()
+    assert _ordered_manzanas(paquetes[0]) == ['I', 'IV', 'V', 'X', 'XI']
@@ -0,0 +1,75 @@
+import os
+import threading
+import pymupdf
+from PIL import Image
+from app.database import db
+from app.properties import tiles
+from app.properties.models import Fraccionamiento
+
+def tile_names(directory, name):
+    files = os.path.join(directory, f'{name}_files')
+    return {level: sorted(os.listdir(os.path.join(files, level))) for level in os.listdir(files)}
+
+def test_pyramid_levels_halve_down_to_one_pixel(tmp_path):
+    source = tmp_path / 'plano.png'
+    Image.new('RGB', (600, 300), 'white').save(source)
+    assert tiles.build_pyramid(str(source), str(tmp_path), 'plano') == (600, 300)
+
+    levels = tile_names(tmp_path, 'plano')
+    # ceil(log2(600)) = 10: levels 0 (1x1 px) to 10 (full size)
+    assert sorted(map(int, levels)) == list(range(11))
+    assert levels['10'] == ['0_0.jpg', '0_1.jpg', '1_0.jpg', '1_1.jpg', '2_0.jpg', '2_1.jpg']
+    assert levels['0'] == ['0_0.jpg']
+    with Image.open(tmp_path / 'plano_files' / '10' / '1_0.jpg') as tile:
+        # Inner tiles carry one pixel of overlap on each side
+        assert tile.size == (258, 257)
+    dzi = (tmp_path / 'plano.dzi').read_text()
+    assert 'TileSize="256"' in dzi and '<Size Width="600" Height="300"/>' in dzi
+
+def test_pdf_sembrados_are_rasterized(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    document = pymupdf.open()
+    document.new_page(width=720, height=360).draw_rect(pymupdf.Rect(10, 10, 100, 100), fill=(0, 0.5, 0))
+    os.makedirs(tmp_path / 'sembrados')
+    document.save(tmp_path / 'sembrados' / 'plano.pdf')
+
+    fraccionamiento = Fraccionamiento(nombre='Las Lomas', sembrado='sembrados/plano.pdf')
+    db.session.add(fraccionamiento)
+    db.session.commit()
+    dzi = tiles.build_tiles(fraccionamiento.id)
+
+    assert dzi == fraccionamiento.sembrado_tiles and os.path.exists(tmp_path / dzi)
+    # 720 x 360 pt at RASTER_DPI
+    scale = tiles.RASTER_DPI / 72
+    assert (fraccionamiento.sembrado_ancho, fraccionamiento.sembrado_alto) == (720 * scale, 360 * scale)
+
+def test_concurrent_builds_of_one_plan(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    os.makedirs(tmp_path / 'sembrados')
+    Image.new('RGB', (900, 500), 'white').save(tmp_path / 'sembrados' / 'plano.png')
+    fraccionamiento = Fraccionamiento(nombre='Las Lomas', sembrado='sembrados/plano.png')
+    db.session.add(fraccionamiento)
+    db.session.commit()
+
+    # Two uploads of the same plan, each building in a thread of its own
+    results, errors = [], []
+
+    def build():
+        with app.app_context():
+            try:
+                results.append(tiles.build_tiles(fraccionamiento.id))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=build) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    assert results[0] == results[1]
+
+    directory = os.path.dirname(tmp_path / results[0])
+    name = os.path.basename(results[0])[:-len('.dzi')]
+    assert sorted(os.listdir(directory)) == [f'{name}.dzi', f'{name}_files']
+    assert tile_names(directory, name)['10'] == sorted(f'{col}_{row}.jpg' for col in range(4) for row in range(2))
@@ -0,0 +1,47 @@
+import pytest
+from app.database import db
+from app.properties import versions
+from app.properties.models import Lote
+from app.properties.versions import get_versions
+
+def lotes_version():
+    return get_versions(['lotes'])['lotes'][0]
+
+def test_a_commit_bumps_each_written_table_once(app, inventory):
+    _, _, _, lote_ids = inventory(3)
+    before = lotes_version()
+    db.session.get(Lote, lote_ids[0]).estado_del_inmueble = 'Titulado'
+    db.session.flush()
+    db.session.get(Lote, lote_ids[1]).estado_del_inmueble = 'Titulado'
+    db.session.commit()
+    assert lotes_version() == before + 1
+    assert db.session.info['committed_versions'] == {'lotes': before + 1}
+
+def test_lot_writes_fail_with_their_version_bump(app, inventory, monkeypatch):
+    _, _, _, lote_ids = inventory(3)
+    before = lotes_version()
+
+    def broken(connection, tables):
+        raise RuntimeError('versiones bloqueadas')
+
+    monkeypatch.setattr(versions, 'bump_versions', broken)
+    db.session.get(Lote, lote_ids[0]).estado_del_inmueble = 'Titulado'
+    with pytest.raises(RuntimeError):
+        db.session.commit()
+    db.session.rollback()
+    monkeypatch.undo()
+    # One transaction: cached pages can never outlive a change they missed
+    assert db.session.get(Lote, lote_ids[0]).estado_del_inmueble == 'Libre'
+    assert lotes_version() == before
+
+def test_conditional_get_until_the_lots_change(app, client, inventory):
+    fraccionamiento, _, _, lote_ids = inventory(3)
+    url = f'/properties/api/lotes/catalog?fraccionamiento={fraccionamiento.id}'
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    db.session.get(Lote, lote_ids[0]).estado_del_inmueble = 'Titulado'
+    db.session.commit()
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']